@@ -0,0 +1,281 @@
+"""
+Nạp catalog Amazon (file metadata JSON lines / CSV, có thể nén .gz) vào Supabase theo luồng:
+
+1. Đọc file từng chunk (ETL_CHUNK_SIZE bản ghi) -> bộ nhớ không phụ thuộc kích thước file.
+2. Tải ảnh song song trên I/O pool, embedding CLIP theo lô lớn (ETL_EMBED_BATCH):
+   thời trang dùng ảnh (không có ảnh thì dùng title), sách dùng title.
+3. Upsert theo lô (ETL_UPSERT_BATCH) vào fashion_clip_index / books_index, chạy nền
+   trong lúc chunk sau đang được embedding.
+4. Sau mỗi chunk đã ghi xong thì lưu checkpoint -> chạy lại lệnh sẽ tiếp tục từ chỗ dừng.
+
+Chạy: python -m ETL.ingest fashion|books <file> [--chunk-size N] [--limit N] [--restart]
+"""
+import argparse
+import ast
+import base64
+import csv
+import gzip
+import itertools
+import json
+import os
+import time
+from io import BytesIO
+from typing import Iterator, List, Optional
+
+import requests
+from PIL import Image
+
+from app.config import (
+    ETL_CHUNK_SIZE, ETL_UPSERT_BATCH, ETL_EMBED_BATCH, ETL_CHECKPOINT_DIR, ETL_IMAGE_TIMEOUT,
+    THUMBNAIL_COLUMN_ENABLED
+)
+from app.thumbnails import THUMBNAIL_FIELD, make_thumbnail_base64
+from app.utils import embed_images, embed_texts, get_io_executor, get_db
+
+TABLES = {"fashion": "fashion_clip_index", "books": "books_index"}
+
+
+# ==================================================
+# ĐỌC FILE
+# ==================================================
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def _parse_line(line: str) -> dict:
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        # Bản dump Amazon 2018 dùng cú pháp dict của Python (nháy đơn)
+        return ast.literal_eval(line)
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """Từng bản ghi của file, không nạp cả file vào RAM."""
+    with _open_text(path) as f:
+        if ".csv" in os.path.basename(path):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield _parse_line(line)
+
+
+def iter_chunks(records: Iterator[dict], chunk_size: int) -> Iterator[List[dict]]:
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk: return
+        yield chunk
+
+
+# ==================================================
+# CHUẨN HOÁ BẢN GHI AMAZON
+# ==================================================
+
+def _as_list(value) -> list:
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value) if value.startswith("[") else [value]
+        except (ValueError, SyntaxError):
+            value = [value]
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def first_image_url(record: dict) -> Optional[str]:
+    """URL ảnh đầu tiên: `images` (bản 2023, list dict hoặc dict list) hoặc imageURL* (bản 2018)."""
+    images = record.get("images")
+    if isinstance(images, dict):
+        images = images.get("large") or images.get("hi_res") or images.get("thumb")
+    for image in _as_list(images):
+        url = image.get("large") or image.get("hi_res") or image.get("thumb") if isinstance(image, dict) else image
+        if url: return url
+    for field in ("imageURLHighRes", "imageURL", "image_url", "image"):
+        urls = _as_list(record.get(field))
+        if urls: return urls[0]
+    return None
+
+
+def _author(record: dict) -> str:
+    author = record.get("author") or record.get("authors")
+    if isinstance(author, dict):
+        author = author.get("name")
+    author = ", ".join(str(a) for a in _as_list(author))
+    return author or "Unknown"
+
+
+def to_row(kind: str, record: dict) -> Optional[dict]:
+    """Bản ghi Amazon -> dòng của bảng đích (chưa có embedding / ảnh). Thiếu id hoặc title -> None."""
+    product_id = record.get("parent_asin") or record.get("asin") or record.get("id")
+    title = (record.get("title") or "").strip()
+    if not product_id or not title:
+        return None
+
+    categories = str(_as_list(record.get("categories") or record.get("category") or record.get("main_category")))
+    description = " ".join(str(d) for d in _as_list(record.get("description")))
+    row = {"id": str(product_id), "title": title, "_image_url": first_image_url(record)}
+    if kind == "books":
+        row.update(author=_author(record), categories=categories, description=description)
+    else:
+        row["metadata"] = {"categories": categories, "description": description}
+    return row
+
+
+# ==================================================
+# ẢNH + EMBEDDING
+# ==================================================
+
+def fetch_image(url: Optional[str]) -> Optional[bytes]:
+    """Tải ảnh và kiểm tra giải mã được (ảnh hỏng không được làm hỏng cả lô embedding)."""
+    if not url: return None
+    try:
+        response = requests.get(url, timeout=ETL_IMAGE_TIMEOUT)
+        response.raise_for_status()
+        Image.open(BytesIO(response.content)).verify()
+        return response.content
+    except Exception:
+        return None
+
+
+def _embed_in_batches(embed_fn, payloads: list, batch_size: int) -> list:
+    vectors = []
+    for start in range(0, len(payloads), batch_size):
+        batch = payloads[start:start + batch_size]
+        try:
+            vectors.extend(embed_fn(batch))
+        except Exception:
+            for payload in batch:
+                try:
+                    vectors.append(embed_fn([payload])[0])
+                except Exception as e:
+                    print(f"Lỗi tạo CLIP embedding: {e}")
+                    vectors.append(None)
+    return vectors
+
+
+def embed_rows(kind: str, rows: List[dict], images: List[Optional[bytes]], batch_size: int):
+    """Gán `embedding` cho từng dòng: ảnh nếu có (thời trang), còn lại dùng title."""
+    image_pos = [i for i, data in enumerate(images) if data] if kind == "fashion" else []
+    text_pos = sorted(set(range(len(rows))) - set(image_pos))
+    image_vectors = _embed_in_batches(embed_images, [images[i] for i in image_pos], batch_size)
+    text_vectors = _embed_in_batches(embed_texts, [rows[i]["title"] for i in text_pos], batch_size)
+    for i, vector in zip(image_pos + text_pos, image_vectors + text_vectors):
+        rows[i]["embedding"] = vector
+
+
+def attach_images(rows: List[dict], images: List[Optional[bytes]]):
+    for row, data in zip(rows, images):
+        if not data: continue
+        row["image_base64"] = base64.b64encode(data).decode("utf-8")
+        if THUMBNAIL_COLUMN_ENABLED:
+            row[THUMBNAIL_FIELD] = make_thumbnail_base64(row["image_base64"])
+
+
+# ==================================================
+# GHI SUPABASE + CHECKPOINT
+# ==================================================
+
+def upsert_rows(client, table: str, rows: List[dict], batch_size: int = ETL_UPSERT_BATCH) -> int:
+    for start in range(0, len(rows), batch_size):
+        client.table(table).upsert(rows[start:start + batch_size], on_conflict="id").execute()
+    return len(rows)
+
+
+def checkpoint_path(kind: str, source: str) -> str:
+    return os.path.join(ETL_CHECKPOINT_DIR, f"{kind}-{os.path.basename(source)}.json")
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"records_done": 0, "rows_written": 0}
+
+
+def save_checkpoint(path: str, state: dict):
+    """Ghi file tạm rồi os.replace để checkpoint không bao giờ bị ghi dở."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(state, updated_at=time.time()), f)
+    os.replace(tmp_path, path)
+
+
+# ==================================================
+# PIPELINE
+# ==================================================
+
+def ingest(kind: str, source: str, client=None, chunk_size: int = ETL_CHUNK_SIZE,
+           limit: Optional[int] = None, resume: bool = True, embed_batch: int = ETL_EMBED_BATCH) -> dict:
+    client = client or get_db()
+    table = TABLES[kind]
+    executor = get_io_executor()
+    ckpt_path = checkpoint_path(kind, source)
+    state = load_checkpoint(ckpt_path) if resume else {"records_done": 0, "rows_written": 0}
+    if state["records_done"]:
+        print(f"↪️ Chạy tiếp từ bản ghi thứ {state['records_done']} ({ckpt_path})")
+
+    start_at = state["records_done"]
+    stop_at = None if limit is None else start_at + limit
+    records = itertools.islice(iter_records(source), start_at, stop_at)
+
+    processed, written, skipped = 0, 0, 0
+    pending = None  # (future upsert của chunk trước, records_done sau chunk đó)
+    started = time.perf_counter()
+    for chunk in iter_chunks(records, chunk_size):
+        chunk_started = time.perf_counter()
+        # Trùng id trong cùng 1 câu upsert sẽ bị Postgres từ chối -> giữ bản ghi cuối
+        rows = list({row["id"]: row for row in (to_row(kind, r) for r in chunk) if row}.values())
+        urls = [row.pop("_image_url") for row in rows]
+        images = list(executor.map(fetch_image, urls)) if kind == "fashion" else [None] * len(rows)
+
+        embed_rows(kind, rows, images, embed_batch)
+        attach_images(rows, images)
+        ready = [row for row in rows if row.get("embedding") is not None]
+        skipped += len(chunk) - len(ready)
+        del images
+
+        # Chỉ giữ tối đa 1 chunk đang ghi: chờ chunk trước xong rồi mới lưu checkpoint cho nó
+        if pending:
+            written += pending[0].result()
+            save_checkpoint(ckpt_path, {"records_done": pending[1], "rows_written": state["rows_written"] + written})
+        processed += len(chunk)
+        pending = (executor.submit(upsert_rows, client, table, ready), start_at + processed)
+
+        elapsed = time.perf_counter() - started
+        print(f"⏳ {table}: {start_at + processed} bản ghi | chunk {len(chunk) / (time.perf_counter() - chunk_started):.1f} items/s"
+              f" | trung bình {processed / elapsed:.1f} items/s")
+
+    if pending:
+        written += pending[0].result()
+        save_checkpoint(ckpt_path, {"records_done": pending[1], "rows_written": state["rows_written"] + written})
+
+    elapsed = time.perf_counter() - started
+    stats = {"records": processed, "rows_written": written, "skipped": skipped,
+             "seconds": elapsed, "items_per_second": processed / elapsed if elapsed else 0.0}
+    print(f"✅ {table}: {processed} bản ghi, ghi {written} dòng, bỏ qua {skipped} "
+          f"trong {elapsed:.1f}s ({stats['items_per_second']:.1f} items/s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nạp catalog Amazon vào Supabase")
+    parser.add_argument("kind", choices=sorted(TABLES))
+    parser.add_argument("source", help="file .jsonl / .json / .csv (có thể nén .gz)")
+    parser.add_argument("--chunk-size", type=int, default=ETL_CHUNK_SIZE)
+    parser.add_argument("--embed-batch", type=int, default=ETL_EMBED_BATCH)
+    parser.add_argument("--limit", type=int, help="chỉ xử lý tối đa N bản ghi (tính từ checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="bỏ qua checkpoint, chạy lại từ đầu")
+    args = parser.parse_args()
+    ingest(args.kind, args.source, chunk_size=args.chunk_size, limit=args.limit,
+           resume=not args.restart, embed_batch=args.embed_batch)
+
+
+if __name__ == "__main__":
+    main()
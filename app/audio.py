@@ -0,0 +1,90 @@
+"""
+Tiền xử lý âm thanh cho Whisper, hoàn toàn trong RAM:
+decode bytes (WAV/FLAC/OGG...) -> mono float32 ở sampling rate gốc.
+
+Kết quả đưa thẳng vào pipeline dạng {"raw": array, "sampling_rate": sr_gốc}, không cần ghi
+file tạm như trước; pipeline tự resample về 16 kHz (cùng bộ resample cho mọi đầu vào mảng).
+
+VAD theo năng lượng: cắt khoảng lặng đầu / cuối và chia bản ghi dài thành các đoạn
+(cắt ở chỗ nhỏ tiếng nhất) để decode từng đoạn, có bản ghi tạm sớm.
+"""
+from io import BytesIO
+from typing import List, Tuple
+
+import numpy as np
+
+# Whisper được huấn luyện ở 16 kHz
+WHISPER_SAMPLING_RATE = 16000
+
+
+def decode_audio(audio_bytes: bytes) -> Tuple[np.ndarray, int]:
+    """Decode bytes bằng soundfile (libsndfile). Trả về (mảng mono float32, sampling rate)."""
+    import soundfile as sf
+    audio, sampling_rate = sf.read(BytesIO(audio_bytes), dtype="float32", always_2d=True)
+    # Trộn các kênh về mono giống ffmpeg (-ac 1)
+    return audio.mean(axis=1), sampling_rate
+
+
+
+# --- VAD (THEO NĂNG LƯỢNG) ---
+FRAME_MS = 30
+# Khung nhỏ hơn mức này (dBFS) luôn bị coi là lặng, kể cả khi cả bản ghi đều nhỏ
+ABSOLUTE_FLOOR_DB = -60.0
+
+
+def frame_energy_db(audio: np.ndarray, sampling_rate: int, frame_ms: int = FRAME_MS) -> Tuple[np.ndarray, int]:
+    """RMS (dBFS) của từng khung `frame_ms`. Trả về (mảng dB, số mẫu mỗi khung)."""
+    frame_len = max(1, sampling_rate * frame_ms // 1000)
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.empty(0, dtype=np.float32), frame_len
+    frames = audio[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-10), frame_len
+
+
+def speech_frames(energy_db: np.ndarray, threshold_db: float) -> np.ndarray:
+    """Khung có tiếng nói: to hơn (khung to nhất + threshold_db) và trên mức sàn tuyệt đối."""
+    if len(energy_db) == 0:
+        return np.zeros(0, dtype=bool)
+    threshold = max(ABSOLUTE_FLOOR_DB, float(energy_db.max()) + threshold_db)
+    return energy_db >= threshold
+
+
+def trim_silence(audio: np.ndarray, sampling_rate: int, threshold_db: float = -35.0,
+                 padding_ms: int = 200) -> np.ndarray:
+    """Cắt khoảng lặng đầu và cuối (giữ lại `padding_ms` mỗi bên). Toàn lặng -> mảng rỗng."""
+    energy_db, frame_len = frame_energy_db(audio, sampling_rate)
+    voiced = np.flatnonzero(speech_frames(energy_db, threshold_db))
+    if len(voiced) == 0:
+        return audio[:0]
+    padding = sampling_rate * padding_ms // 1000
+    start = max(0, voiced[0] * frame_len - padding)
+    end = min(len(audio), (voiced[-1] + 1) * frame_len + padding)
+    return audio[start:end]
+
+
+def split_chunks(audio: np.ndarray, sampling_rate: int, max_seconds: float = 10.0,
+                 threshold_db: float = -35.0) -> List[np.ndarray]:
+    """
+    Chia bản ghi thành các đoạn <= max_seconds. Mỗi điểm cắt là khung nhỏ tiếng nhất trong
+    nửa sau của cửa sổ (thường là chỗ ngắt giữa hai từ); đoạn không có tiếng nói bị bỏ.
+    """
+    max_len = int(max_seconds * sampling_rate)
+    if len(audio) <= max_len:
+        return [audio] if len(audio) else []
+
+    energy_db, frame_len = frame_energy_db(audio, sampling_rate)
+    voiced = speech_frames(energy_db, threshold_db)
+    chunks, start = [], 0
+    while start < len(audio):
+        end = start + max_len
+        if end < len(audio):
+            first, last = (start + max_len // 2) // frame_len, end // frame_len
+            if last > first:
+                end = (first + int(np.argmin(energy_db[first:last]))) * frame_len
+        end = min(end, len(audio))
+        if voiced[start // frame_len:-(-end // frame_len)].any():
+            chunks.append(audio[start:end])
+        start = end
+    return chunks
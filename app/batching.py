@@ -0,0 +1,60 @@
+"""
+Micro-batching: gom các request đồng thời (từ nhiều session Streamlit) trong
+vài mili-giây rồi xử lý chung một lượt forward của model.
+
+Bên gọi nên chờ future.result(timeout=...) rồi future.cancel() khi quá hạn: item đã huỷ
+mà chưa vào lượt chạy sẽ bị bỏ qua.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, name: str = "micro-batcher"):
+        """
+        run_batch: nhận list item, trả về list kết quả cùng thứ tự.
+        max_wait_ms: thời gian tối đa chờ gom thêm request sau request đầu tiên.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            # Bỏ các item bên gọi đã huỷ (quá hạn chờ) trước khi chạy model
+            batch = [(item, future) for item, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch: continue
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.run_batch(items))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch trả về {len(results)} kết quả cho {len(batch)} item")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done(): future.set_exception(e)
@@ -6,7 +6,12 @@ load_dotenv()
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_ANON_KEY") # Hoặc Service Role nếu cần quyền ghi
 
-if not SUPABASE_URL or not SUPABASE_KEY:
+# Backend lưu trữ: "supabase" (mặc định) hoặc "local" (SQLite + numpy trên đĩa, cho triển khai 1 máy;
+# chép dữ liệu sang: python -m app.local_store import)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+LOCAL_STORE_PATH = os.environ.get("LOCAL_STORE_PATH", "data/local_store.sqlite3")
+
+if STORAGE_BACKEND == "supabase" and (not SUPABASE_URL or not SUPABASE_KEY):
     raise EnvironmentError("Lỗi: Chưa cấu hình SUPABASE_URL hoặc SUPABASE_KEY trong .env")
 
 # Model RAG văn bản cũ (nếu vẫn dùng)
@@ -15,4 +20,118 @@ EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 # Model CLIP cho thời trang (MỚI)
 CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
 
-GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
\ No newline at end of file
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+
+# Chỉ mục vector cục bộ cho fashion_clip_index (build: python -m app.vector_index build)
+# Không có thư mục chỉ mục hoặc chỉ mục quá cũ -> quay về RPC match_fashion_clip
+FASHION_INDEX_DIR = os.environ.get("FASHION_INDEX_DIR", "data/fashion_index")
+FASHION_INDEX_MAX_AGE = float(os.environ.get("FASHION_INDEX_MAX_AGE", 24 * 3600)) # giây
+FASHION_INDEX_NPROBE = int(os.environ.get("FASHION_INDEX_NPROBE", 8))
+# Kiểu lưu vector trong chỉ mục: float32 (chính xác), float16 (1/2 bộ nhớ) hoặc int8 + scale (~1/4).
+# Trên CPU, float16 -> float32 chậm hơn int8 -> float32 nên int8 thường là lựa chọn tốt hơn
+INDEX_DTYPE = os.environ.get("INDEX_DTYPE", "float32")
+
+# Micro-batching cho CLIP: gom request đồng thời trong CLIP_BATCH_WAIT_MS rồi chạy 1 lượt forward
+CLIP_BATCH_WAIT_MS = float(os.environ.get("CLIP_BATCH_WAIT_MS", 5))
+CLIP_MAX_BATCH = int(os.environ.get("CLIP_MAX_BATCH", 32))
+CLIP_TIMEOUT = float(os.environ.get("CLIP_TIMEOUT", 10)) # giây chờ 1 embedding (kể cả thời gian xếp hàng)
+
+# Cache embedding truy vấn (theo text đã chuẩn hoá hoặc hash nội dung ảnh)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 2048))
+QUERY_EMBEDDING_CACHE_TTL = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 0)) or None # giây, 0 = không hết hạn
+
+# Cache chi tiết sản phẩm theo id (fashion_clip_index, books_index)
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", 5000))
+PRODUCT_CACHE_TTL = float(os.environ.get("PRODUCT_CACHE_TTL", 3600)) or None # giây, 0 = không hết hạn
+
+# Thumbnail cho grid / card. Bật THUMBNAIL_COLUMN_ENABLED sau khi đã backfill cột thumbnail_base64
+THUMBNAIL_SIZE = (240, 300)
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", 70))
+THUMBNAIL_COLUMN_ENABLED = os.environ.get("THUMBNAIL_COLUMN_ENABLED", "0") == "1"
+
+# Ghi feedback theo lô (write-behind): flush khi đủ số cặp hoặc sau mỗi chu kỳ
+FEEDBACK_MAX_PENDING = int(os.environ.get("FEEDBACK_MAX_PENDING", 200))
+FEEDBACK_FLUSH_INTERVAL = float(os.environ.get("FEEDBACK_FLUSH_INTERVAL", 2.0)) # giây
+# Lô ghi lỗi: thử lại sau khoảng chờ tăng gấp đôi (tối đa FEEDBACK_MAX_BACKOFF giây),
+# cặp nào lỗi quá FEEDBACK_MAX_RETRIES lần thì bỏ (có log)
+FEEDBACK_MAX_RETRIES = int(os.environ.get("FEEDBACK_MAX_RETRIES", 5))
+FEEDBACK_MAX_BACKOFF = float(os.environ.get("FEEDBACK_MAX_BACKOFF", 60)) # giây
+
+# Số thread chạy song song các truy vấn I/O độc lập (Supabase)
+IO_WORKERS = int(os.environ.get("IO_WORKERS", 16))
+
+# Graph tương tác trong RAM (CSR) cho recommend_outfit_tool. Nạp từ CSV export nếu có, không thì đọc bảng
+INTERACTION_GRAPH_ENABLED = os.environ.get("INTERACTION_GRAPH_ENABLED", "1") == "1"
+INTERACTION_GRAPH_CSV = os.environ.get("INTERACTION_GRAPH_CSV") # vd: data/product_interactions.csv
+# Nạp lại toàn bộ bảng định kỳ (giây) để thấy điểm do process khác ghi; 0 = tắt (mặc định),
+# process vẫn tự cộng các lượt feedback của chính nó vào graph
+INTERACTION_GRAPH_REFRESH = float(os.environ.get("INTERACTION_GRAPH_REFRESH", 0))
+
+# Trending top-K theo loại sản phẩm, tính lại định kỳ + cập nhật ngay từ feedback
+TRENDING_CAPACITY = int(os.environ.get("TRENDING_CAPACITY", 50))
+TRENDING_REFRESH = float(os.environ.get("TRENDING_REFRESH", 300)) # giây
+
+# Chạy song song các node độc lập của graph (False = tuần tự như cũ)
+GRAPH_PARALLEL = os.environ.get("GRAPH_PARALLEL", "1") == "1"
+
+# Đường nhanh (không gọi LLM) cho bước hiểu ý định: chỉ dùng khi độ tự tin >= ngưỡng
+INTENT_FAST_PATH = os.environ.get("INTENT_FAST_PATH", "1") == "1"
+INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get("INTENT_CONFIDENCE_THRESHOLD", 0.85))
+
+# Cache bền vững cho phản hồi Gemini (hiểu ý định + câu trả lời stylist)
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 5000))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600)) or None # giây, 0 = không hết hạn
+# Dùng lại kết quả cho câu hỏi diễn đạt khác nhưng cùng ý (cùng tập từ khoá + embedding CLIP đủ gần)
+LLM_CACHE_SEMANTIC = os.environ.get("LLM_CACHE_SEMANTIC", "0") == "1"
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.environ.get("LLM_CACHE_SEMANTIC_THRESHOLD", 0.95))
+
+# Micro-batching cho Whisper: gom các đoạn ghi âm đồng thời rồi chạy chung 1 lượt pipeline
+STT_BATCH_WAIT_MS = float(os.environ.get("STT_BATCH_WAIT_MS", 20))
+STT_MAX_BATCH = int(os.environ.get("STT_MAX_BATCH", 8))
+STT_TIMEOUT = float(os.environ.get("STT_TIMEOUT", 30)) # giây chờ 1 đoạn ghi âm (kể cả thời gian xếp hàng)
+
+# VAD cho voice search: cắt khoảng lặng, khung nhỏ hơn (khung to nhất + VAD_THRESHOLD_DB) coi là lặng
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "1") == "1"
+VAD_THRESHOLD_DB = float(os.environ.get("VAD_THRESHOLD_DB", -35))
+# Bản ghi dài hơn được chia đoạn và decode lần lượt (Whisper tối đa 30 giây / lượt)
+STT_CHUNK_SECONDS = float(os.environ.get("STT_CHUNK_SECONDS", 10))
+
+# Ảnh tải lên: giải mã + thu nhỏ về kích thước đầu vào CLIP trong thread pool riêng,
+# lịch sử chat chỉ giữ ảnh preview nhỏ
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_PREVIEW_SIZE = (240, 240)
+
+# ETL nạp catalog (python -m ETL.ingest): số bản ghi mỗi chunk, số dòng mỗi lần upsert,
+# số ảnh mỗi lượt forward CLIP và thư mục lưu checkpoint để chạy tiếp khi bị ngắt
+ETL_CHUNK_SIZE = int(os.environ.get("ETL_CHUNK_SIZE", 512))
+ETL_UPSERT_BATCH = int(os.environ.get("ETL_UPSERT_BATCH", 100))
+ETL_EMBED_BATCH = int(os.environ.get("ETL_EMBED_BATCH", 64))
+ETL_CHECKPOINT_DIR = os.environ.get("ETL_CHECKPOINT_DIR", "data/etl_checkpoints")
+ETL_IMAGE_TIMEOUT = float(os.environ.get("ETL_IMAGE_TIMEOUT", 10)) # giây
+
+# Metrics (app.metrics): cổng HTTP cho endpoint /metrics của Prometheus (0 = tắt),
+# tỉ lệ truy vấn database được đo kích thước payload (serialize JSON tốn CPU nên chỉ lấy mẫu)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_PAYLOAD_SAMPLE_RATE = float(os.environ.get("METRICS_PAYLOAD_SAMPLE_RATE", 0.1))
+
+# Client database (app.db_client): pool HTTP keep-alive (cũng là số truy vấn chạy cùng lúc tối đa),
+# timeout mỗi truy vấn, ngân sách thời gian cho 1 lượt hỏi (graph) - truy vấn chỉ được chờ tới hạn còn lại
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 20))
+DB_KEEPALIVE_SECONDS = float(os.environ.get("DB_KEEPALIVE_SECONDS", 30))
+DB_CONNECT_TIMEOUT = float(os.environ.get("DB_CONNECT_TIMEOUT", 3))
+DB_TIMEOUT = float(os.environ.get("DB_TIMEOUT", 8)) # giây
+REQUEST_BUDGET_SECONDS = float(os.environ.get("REQUEST_BUDGET_SECONDS", 15))
+# Truy vấn đọc: gửi thêm 1 bản nếu sau DB_HEDGE_AFTER_MS chưa có kết quả (0 = tắt; nên đặt ~p95),
+# và thử lại tối đa DB_READ_RETRIES lần khi lỗi kết nối
+DB_HEDGE_AFTER_MS = float(os.environ.get("DB_HEDGE_AFTER_MS", 0))
+DB_READ_RETRIES = int(os.environ.get("DB_READ_RETRIES", 1))
+
+# Phân trang kết quả tìm kiếm (tools.SearchCursor): số sản phẩm mỗi trang, số ứng viên đã xếp hạng
+# lấy 1 lần (thời trang chỉ là id + similarity nên lấy nhiều; RPC sách trả cả dòng nên mặc định chỉ
+# lấy đủ trang đầu), dùng hết thì lấy lại gấp đôi, tối đa SEARCH_MAX_CANDIDATES
+FASHION_PAGE_SIZE = int(os.environ.get("FASHION_PAGE_SIZE", 10))
+BOOK_PAGE_SIZE = int(os.environ.get("BOOK_PAGE_SIZE", 5))
+SEARCH_FASHION_CANDIDATES = int(os.environ.get("SEARCH_FASHION_CANDIDATES", 100))
+SEARCH_BOOK_CANDIDATES = int(os.environ.get("SEARCH_BOOK_CANDIDATES", BOOK_PAGE_SIZE))
+SEARCH_MAX_CANDIDATES = int(os.environ.get("SEARCH_MAX_CANDIDATES", 1000))
@@ -0,0 +1,134 @@
+"""
+Gọi database có hạn chót:
+- make_supabase_options(): pool HTTP dùng chung (keep-alive, giới hạn số kết nối) + timeout mặc định.
+- request_budget(seconds): ngân sách độ trễ cho 1 lượt xử lý, lưu trong contextvar; mọi truy vấn
+  bên trong chỉ được chờ tới hạn chót còn lại (và không quá DB_TIMEOUT).
+- execute(endpoint, query, idempotent): chạy query.execute() trên pool thread riêng, quá hạn thì
+  ném DeadlineExceeded thay vì treo cả lượt rerun của Streamlit. Với truy vấn đọc (idempotent):
+  gửi thêm 1 bản (hedge) nếu sau DB_HEDGE_AFTER_MS chưa có kết quả, và thử lại khi lỗi kết nối.
+  Lệnh ghi chỉ bị chặn khi ngân sách đã hết trước lúc gửi; đã gửi thì chờ kết quả thật (không bỏ
+  dở giữa chừng, vì lệnh có thể vẫn commit và bên gọi thử lại sẽ ghi 2 lần).
+
+Bộ đếm: db_timeouts_total, db_retries_total, db_hedges_total, db_hedge_wins_total (theo endpoint).
+"""
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Optional
+
+from app.config import (
+    DB_MAX_CONNECTIONS, DB_KEEPALIVE_SECONDS, DB_CONNECT_TIMEOUT, DB_TIMEOUT,
+    DB_HEDGE_AFTER_MS, DB_READ_RETRIES
+)
+from app.metrics import metrics
+from app.startup import run_once
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("db_deadline", default=None)
+
+
+@contextmanager
+def request_budget(seconds: float):
+    """Đặt hạn chót cho mọi truy vấn trong khối (nếu bên ngoài đã có hạn chặt hơn thì giữ hạn đó)."""
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> float:
+    """Số giây 1 truy vấn được phép chờ: min(hạn chót của request, DB_TIMEOUT)."""
+    deadline = _deadline.get()
+    return DB_TIMEOUT if deadline is None else min(DB_TIMEOUT, deadline - time.monotonic())
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """submit() chạy hàm trong bản sao contextvars của thread gọi (giữ hạn chót của request)."""
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def make_supabase_options():
+    """ClientOptions cho create_client: 1 pool httpx keep-alive, tối đa DB_MAX_CONNECTIONS kết nối."""
+    import httpx
+    from supabase.client import ClientOptions
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=DB_MAX_CONNECTIONS, max_keepalive_connections=DB_MAX_CONNECTIONS,
+                            keepalive_expiry=DB_KEEPALIVE_SECONDS),
+        timeout=httpx.Timeout(DB_TIMEOUT, connect=DB_CONNECT_TIMEOUT),
+    )
+    return ClientOptions(httpx_client=http_client)
+
+
+@run_once
+def get_db_executor() -> ThreadPoolExecutor:
+    """Pool chạy query.execute(); cùng cỡ với pool kết nối HTTP nên không xếp hàng 2 lần."""
+    return ThreadPoolExecutor(max_workers=DB_MAX_CONNECTIONS, thread_name_prefix="db")
+
+
+@run_once
+def _transient_errors() -> tuple:
+    """Lỗi kết nối đáng thử lại (không gồm lỗi do chính truy vấn, vd: 4xx của PostgREST)."""
+    try:
+        import httpx
+        return ConnectionError, httpx.TransportError
+    except ImportError:
+        return (ConnectionError,)
+
+
+def execute(endpoint: str, query, idempotent: bool = False):
+    left = time_left()
+    if left <= 0:
+        metrics.inc("db_timeouts_total", endpoint=endpoint)
+        raise DeadlineExceeded(f"{endpoint}: đã hết ngân sách thời gian của request")
+
+    if not idempotent:
+        # httpx tự dừng sau DB_TIMEOUT nên không treo vô hạn
+        return query.execute()
+
+    deadline = time.monotonic() + left
+    executor = get_db_executor()
+    hedge_after = DB_HEDGE_AFTER_MS / 1000 if DB_HEDGE_AFTER_MS > 0 else None
+    error = None
+    for attempt in range(1 + DB_READ_RETRIES):
+        if attempt:
+            metrics.inc("db_retries_total", endpoint=endpoint)
+        pending = {executor.submit(query.execute)}
+        hedge, hedge_at = None, time.monotonic() + hedge_after if hedge_after else None
+        while pending:
+            wake = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(0.0, wake - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except _transient_errors() as e:
+                    error = e
+                    continue
+                for other in pending: other.cancel()
+                if future is hedge:
+                    metrics.inc("db_hedge_wins_total", endpoint=endpoint)
+                return response
+
+            now = time.monotonic()
+            if now >= deadline:
+                # Thread đang chạy không huỷ được; nó tự dừng khi httpx hết timeout
+                for other in pending: other.cancel()
+                metrics.inc("db_timeouts_total", endpoint=endpoint)
+                raise DeadlineExceeded(f"{endpoint}: không có phản hồi sau {left:.2f}s")
+            if hedge_at is not None and now >= hedge_at and pending:
+                hedge_at = None
+                metrics.inc("db_hedges_total", endpoint=endpoint)
+                hedge = executor.submit(query.execute)
+                pending.add(hedge)
+        # Mọi bản gửi đều lỗi kết nối: thử lại nếu còn lượt và còn thời gian
+        if time.monotonic() >= deadline: break
+    raise error
@@ -0,0 +1,137 @@
+"""
+Bộ đệm ghi sau (write-behind) cho feedback click / giỏ hàng.
+
+Click chỉ cộng dồn trọng số vào một dict trong RAM theo cặp (item_a, item_b);
+một thread nền ghi xuống Supabase theo lô khi đủ số cặp hoặc hết chu kỳ,
+và xả nốt phần còn lại khi process tắt.
+
+Lô ghi lỗi được gộp lại để thử tiếp, nhưng lần flush kế chờ lâu gấp đôi mỗi lần lỗi liên tiếp
+(tối đa max_backoff), và cặp lỗi quá max_retries lần thì bị bỏ (có log) thay vì giữ mãi.
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+Pair = Tuple[str, str]
+
+
+class FeedbackBuffer:
+    def __init__(self, flush_fn: Callable[[Dict[Pair, int]], Dict[Pair, int]],
+                 max_pending: int = 200, flush_interval: float = 2.0,
+                 max_retries: int = 5, max_backoff: float = 60.0):
+        """
+        flush_fn: ghi 1 lô {(item_a, item_b): weight}, trả về các cặp ghi lỗi để thử lại.
+        max_pending: số cặp khác nhau tối đa trước khi ép flush sớm.
+        flush_interval: chu kỳ flush (giây).
+        max_retries: số lần thử lại tối đa của 1 cặp trước khi bỏ.
+        max_backoff: khoảng chờ dài nhất giữa 2 lần flush khi đang lỗi liên tiếp (giây).
+        """
+        self.flush_fn = flush_fn
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.dropped = 0  # số cặp đã bỏ sau khi hết lượt thử lại
+        self._pending: Dict[Pair, int] = {}
+        self._attempts: Dict[Pair, int] = {}  # cặp -> số lần ghi lỗi liên tiếp
+        self._failures = 0  # số lần flush lỗi liên tiếp (để tính backoff)
+        self._retry_at = 0.0
+        self._listeners: List[Callable[[str, str, int], None]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="feedback-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add_listener(self, fn: Callable[[str, str, int], None]):
+        """fn(item_a, item_b, weight) được gọi ngay khi có feedback (vd: cập nhật graph trong RAM)."""
+        self._listeners.append(fn)
+
+    def add(self, item_a: str, item_b: str, weight: int = 1):
+        with self._lock:
+            key = (item_a, item_b)
+            self._pending[key] = self._pending.get(key, 0) + weight
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+        for fn in self._listeners:
+            try:
+                fn(item_a, item_b, weight)
+            except Exception as e:
+                print(f"❌ Lỗi listener feedback: {e}")
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def pending_items(self) -> Dict[Pair, int]:
+        """Bản sao các cặp chưa ghi (kể cả cặp lỗi đang chờ thử lại)."""
+        with self._lock:
+            return dict(self._pending)
+
+    @contextmanager
+    def paused(self):
+        """Không lô nào được ghi trong khối (chờ lô đang ghi xong trước); dùng khi cần đọc bảng nhất quán."""
+        with self._flush_lock:
+            yield
+
+    def flush(self) -> int:
+        """Ghi toàn bộ phần đang chờ, trả về số cặp đã ghi thành công."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch: return 0
+
+            try:
+                failed = self.flush_fn(batch) or {}
+            except Exception as e:
+                print(f"❌ Lỗi ghi lô feedback: {e}")
+                failed = batch
+            for key in batch:
+                if key not in failed: self._attempts.pop(key, None)
+
+            dropped = 0
+            if failed:
+                # Gộp lại phần lỗi để lần flush sau thử tiếp (trừ cặp đã hết lượt thử lại)
+                with self._lock:
+                    for key, weight in failed.items():
+                        attempts = self._attempts.get(key, 0) + 1
+                        if attempts > self.max_retries:
+                            self._attempts.pop(key, None)
+                            dropped += 1
+                            continue
+                        self._attempts[key] = attempts
+                        self._pending[key] = self._pending.get(key, 0) + weight
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(self.flush_interval * 2 ** self._failures, self.max_backoff)
+            else:
+                self._failures, self._retry_at = 0, 0.0
+            if dropped:
+                self.dropped += dropped
+                print(f"❌ Bỏ {dropped} cặp feedback sau {self.max_retries} lần thử lại")
+            return len(batch) - len(failed)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(max(self.flush_interval, self._retry_at - time.monotonic()))
+            self._wake.clear()
+            # Đang backoff sau lỗi: đủ cặp cũng không flush sớm
+            if time.monotonic() < self._retry_at: continue
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Lỗi flush feedback: {e}")
+
+    def close(self):
+        """Dừng thread nền và xả nốt phần còn lại (gọi tự động khi process thoát)."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"❌ Lỗi flush feedback khi tắt: {e}")
+        if self._pending:
+            print(f"❌ Còn {len(self._pending)} cặp feedback chưa ghi được")
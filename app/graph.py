@@ -1,14 +1,28 @@
-from langgraph.graph import StateGraph, END
+from langgraph.graph import StateGraph, START, END
 from app.tools import (
     AgentState, 
-    search_fashion_tool, 
-    recommend_outfit_tool, 
-    search_books_tool
+    fetch_outfit, 
+    new_search_cursor,
+    next_search_page
 )
+from app.startup import run_once, startup_report
+from app.utils import get_query_embedding, get_io_executor, normalize_query_text
+from app.cache import LRUCache
+from app.config import (
+    GRAPH_PARALLEL, INTENT_FAST_PATH, INTENT_CONFIDENCE_THRESHOLD, LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL, LLM_CACHE_SEMANTIC, LLM_CACHE_SEMANTIC_THRESHOLD, REQUEST_BUDGET_SECONDS,
+    FASHION_PAGE_SIZE, BOOK_PAGE_SIZE
+)
+from app.intent import extract_keywords, understand_locally
+from app.llm_cache import LLMCache, make_key
+from app.metrics import metrics
+from app.db_client import request_budget, time_left
 from langchain_google_genai import ChatGoogleGenerativeAI
 import logging
 import json
 import os
+import functools
+import time
 
 # Cấu hình Log
 logging.basicConfig(level=logging.INFO)
@@ -16,23 +30,36 @@ logger = logging.getLogger(__name__)
 
 # Lấy API Key
 llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7)
+@run_once
+def get_llm_cache() -> LLMCache:
+    cache = LLMCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL,
+                     semantic_threshold=LLM_CACHE_SEMANTIC_THRESHOLD)
+
+    def llm_cache_gauges():
+        for namespace, s in cache.stats().items():
+            labels = {"cache": f"llm.{namespace}"}
+            yield "cache_hits", labels, s["hits"] + s["semantic_hits"]
+            yield "cache_misses", labels, s["misses"]
+            yield "cache_hit_ratio", labels, s["hit_ratio"]
+
+    metrics.register_collector(llm_cache_gauges)
+    return cache
+
 # -----------------------------
 # NODE 1: HIỂU Ý ĐỊNH (INTENT & QUERY EXTRACTOR)
 # -----------------------------
-def understand_query_node(state: AgentState):
-    """
-    Thay thế cho translate_input_node.
-    Nhiệm vụ: 
-    1. Hiểu câu hỏi (bất kể ngôn ngữ nào).
-    2. Trích xuất từ khóa tìm kiếm chuẩn tiếng Anh (cho Vector Search).
-    3. Phân loại Intent (Book/Fashion).
-    4. Phát hiện ngôn ngữ người dùng (để trả lời sau này).
-    """
-    logger.info("---NODE: Hiểu Ý Định (Gemini)---")
-    question = (state.get("question") or "").strip()
-    
-    if not question:
-        return {"question_en": "", "category_intent": "fashion", "user_lang": "vi"}
+def understand_with_llm(question: str, use_cache: bool = True) -> dict:
+    """Gọi Gemini để lấy từ khoá tiếng Anh, intent và ngôn ngữ (có cache theo câu hỏi đã chuẩn hoá)."""
+    cache_key = make_key("understand", normalize_query_text(question))
+    embedding = get_query_embedding(text=question) if use_cache and LLM_CACHE_SEMANTIC else None
+    # So khớp semantic chỉ giữa các câu có cùng tập từ khoá (không phân biệt thứ tự, bỏ từ đệm):
+    # "show me a red dress" ~ "red dress please", nhưng "red dress" không dùng lại kết quả của "blue dress"
+    keyword_tag = " ".join(sorted(set(extract_keywords(question).split())))
+    if use_cache:
+        cached = get_llm_cache().get("understand", cache_key, embedding=embedding, tag=keyword_tag)
+        if cached is not None:
+            logger.info("👉 Dùng lại kết quả hiểu ý định từ cache")
+            return cached
 
     # Prompt đa năng
     prompt = f"""
@@ -47,7 +74,8 @@ def understand_query_node(state: AgentState):
     """
     
     try:
-        res = llm.invoke(prompt)
+        with metrics.span("llm_request", purpose="understand"):
+            res = llm.invoke(prompt)
         # Xử lý JSON từ Gemini (đôi khi nó bọc trong ```json ... ```)
         content = res.content.strip()
         if "```json" in content:
@@ -61,47 +89,121 @@ def understand_query_node(state: AgentState):
         intent = data.get("intent", "fashion")
         lang = data.get("language", "vi")
         
+        result = {"question_en": q_en, "category_intent": intent, "user_lang": lang}
+        # Chỉ cache khi Gemini trả lời hợp lệ
+        if use_cache:
+            get_llm_cache().set("understand", cache_key, result, embedding=embedding, tag=keyword_tag)
+        return result
+        
     except Exception as e:
         logger.error(f"Lỗi hiểu ý định: {e}")
-        q_en = question 
-        intent = "fashion"
-        lang = "vi"
+        return {"question_en": question, "category_intent": "fashion", "user_lang": "vi"}
+
+def understand_query_node(state: AgentState):
+    """
+    Thay thế cho translate_input_node.
+    Nhiệm vụ: 
+    1. Hiểu câu hỏi (bất kể ngôn ngữ nào).
+    2. Trích xuất từ khóa tìm kiếm chuẩn tiếng Anh (cho Vector Search).
+    3. Phân loại Intent (Book/Fashion).
+    4. Phát hiện ngôn ngữ người dùng (để trả lời sau này).
+    Câu ngắn, rõ ràng được xử lý tại chỗ (app.intent); chỉ gọi Gemini khi chưa đủ tự tin.
+    """
+    question = (state.get("question") or "").strip()
+    
+    if not question:
+        return {"question_en": "", "category_intent": "fashion", "user_lang": "vi"}
+
+    result = None
+    if INTENT_FAST_PATH:
+        try:
+            result = understand_locally(question, INTENT_CONFIDENCE_THRESHOLD)
+        except Exception as e:
+            logger.error(f"Lỗi đường nhanh hiểu ý định: {e}")
+    
+    if result is not None:
+        logger.info(f"---NODE: Hiểu Ý Định (Local, tự tin {result.pop('confidence'):.2f})---")
+    else:
+        logger.info("---NODE: Hiểu Ý Định (Gemini)---")
+        result = understand_with_llm(question)
         
-    logger.info(f"👉 Query: {q_en} | Intent: {intent} | Lang: {lang}")
+    logger.info(f"👉 Query: {result['question_en']} | Intent: {result['category_intent']} | Lang: {result['user_lang']}")
     
     # Lưu user_lang vào state để dùng ở bước cuối
-    return {"question_en": q_en, "category_intent": intent, "user_lang": lang}
+    return result
+
+# -----------------------------
+# NODE 1b: EMBEDDING ẢNH (chạy song song với NODE 1)
+# -----------------------------
+def embed_image_node(state: AgentState):
+    """Embedding ảnh không phụ thuộc kết quả LLM nên tính luôn trong lúc chờ Gemini."""
+    if state.get("image") is not None:
+        return {"query_vector": get_query_embedding(image=state["image"])}
+    if not state.get("image_bytes"):
+        return {}
+    return {"query_vector": get_query_embedding(image_data=state["image_bytes"])}
 
 # -----------------------------
 # NODE 2: TÌM KIẾM (Giữ nguyên logic)
 # -----------------------------
+# (top_id, intent) -> Future của fetch_outfit, để node gợi ý / trả lời dùng chung
+_outfit_prefetch = LRUCache(maxsize=256, ttl=60, name="outfit_prefetch")
+
+def prefetch_outfit(product_id: str, intent: str):
+    key = (product_id, intent)
+    future = _outfit_prefetch.get(key)
+    if future is None:
+        future = get_io_executor().submit(fetch_outfit, product_id, product_type=intent)
+        _outfit_prefetch.set(key, future)
+        future.add_done_callback(functools.partial(_evict_failed_outfit, key))
+    return future
+
+def _evict_failed_outfit(key, future):
+    """Lỗi / bị huỷ -> bỏ khỏi cache để lượt sau thử lại. Rỗng là kết quả thật (sản phẩm mới) nên vẫn giữ."""
+    if future.cancelled() or future.exception() is not None:
+        _outfit_prefetch.invalidate(key)
+
 def search_node(state: AgentState):
     intent = state.get("category_intent", "fashion")
     
+    # Giữ con trỏ trong state: UI lấy trang sau từ đó (nút "Xem thêm") mà không chạy lại graph
     if intent == "book":
-        products = search_books_tool(state)
+        cursor = new_search_cursor(state, "book", BOOK_PAGE_SIZE)
     else:
-        products = search_fashion_tool(state)
+        cursor = new_search_cursor(state, "fashion", FASHION_PAGE_SIZE)
+    products = next_search_page(cursor)
+
+    # Bắt đầu lấy gợi ý mua kèm cho top hit ngay, không chờ tới node gợi ý
+    if products:
+        prefetch_outfit(products[0]['id'], intent)
     
-    return {"recommendations": products}
+    return {"recommendations": products, "search_cursor": cursor}
 
 # -----------------------------
 # NODE 3: GỢI Ý (Giữ nguyên logic)
 # -----------------------------
-def recommendation_node(state: AgentState):
+def merge_outfit(state: AgentState) -> list:
     intent = state.get("category_intent", "fashion")
-    current_recs = state.get("recommendations", [])
+    current_recs = list(state.get("recommendations") or [])
     
     if current_recs:
         top_product_id = current_recs[0]['id']
-        outfit_items = recommend_outfit_tool(top_product_id, product_type=intent)
+        # Chờ trong phần ngân sách còn lại của request; quá hạn thì trả kết quả không kèm gợi ý mua kèm
+        try:
+            outfit = prefetch_outfit(top_product_id, intent).result(timeout=max(0.0, time_left()))
+        except Exception as e:
+            logger.warning(f"Bỏ qua gợi ý mua kèm cho {top_product_id}: {e!r}")
+            outfit = []
+        outfit_items = [dict(item) for item in outfit]
         
         existing_ids = {p['id'] for p in current_recs}
         for item in outfit_items:
             if item['id'] not in existing_ids:
                 current_recs.append(item)
-        
-    return {"recommendations": current_recs}
+    return current_recs
+
+def recommendation_node(state: AgentState):
+    return {"recommendations": merge_outfit(state)}
 
 # -----------------------------
 # NODE 4: TRẢ LỜI (Đa ngôn ngữ)
@@ -115,6 +217,10 @@ def generate_answer_node(state: AgentState):
     
     user_lang = state.get("user_lang", "vi") # Lấy ngôn ngữ đã detect
     products = state.get("recommendations", [])
+    if len(products) < 3:
+        # Chạy song song với node gợi ý: tự ghép gợi ý mua kèm (dùng chung kết quả prefetch)
+        # để 3 sản phẩm đầu giống hệt khi chạy tuần tự
+        products = merge_outfit(state)
     
     if not products:
         fail_msg = "Xin lỗi, mình không tìm thấy sản phẩm phù hợp." if user_lang == "vi" else "Sorry, I couldn't find any matching products."
@@ -137,25 +243,116 @@ def generate_answer_node(state: AgentState):
     Do NOT output JSON. Just plain text.
     """
     
-    res = llm.invoke(prompt)
+    # Cùng câu hỏi + cùng 3 sản phẩm đầu + cùng ngôn ngữ -> dùng lại câu trả lời cũ
+    cache_key = make_key(
+        "answer", normalize_query_text(state.get('question', '')), ",".join(p['id'] for p in products[:3]), user_lang
+    )
+    cached = get_llm_cache().get("answer", cache_key)
+    if cached is not None:
+        return {"answer_vi": cached}
+    
+    with metrics.span("llm_request", purpose="answer"):
+        res = llm.invoke(prompt)
+    get_llm_cache().set("answer", cache_key, res.content)
     return {"answer_vi": res.content} # Lưu thẳng vào answer_vi để Main UI hiển thị
 
 # -----------------------------
 # BUILD GRAPH
 # -----------------------------
-def build_fashion_graph():
+def timed_node(name: str, fn):
+    """Bọc node để đo thời gian vào graph_node_seconds{node=name}."""
+    @functools.wraps(fn)
+    def wrapper(state: AgentState):
+        with metrics.span("graph_node", node=name):
+            return fn(state)
+    return wrapper
+
+def build_fashion_graph(parallel: bool = GRAPH_PARALLEL):
+    """
+    parallel=True: 
+      - START -> (understand || embed_image) -> search
+      - search -> (recommend || answer) -> END
+    parallel=False: understand -> search -> recommend -> answer (tuần tự như cũ).
+    Hai chế độ cho ra cùng state cuối.
+    """
     workflow = StateGraph(AgentState)
     
-    workflow.add_node("understand", understand_query_node) # Node mới
-    workflow.add_node("search", search_node)
-    workflow.add_node("recommend", recommendation_node)
-    workflow.add_node("answer", generate_answer_node) # Node trả lời trực tiếp
+    workflow.add_node("understand", timed_node("understand", understand_query_node)) # Node mới
+    workflow.add_node("search", timed_node("search", search_node))
+    workflow.add_node("recommend", timed_node("recommend", recommendation_node))
+    workflow.add_node("answer", timed_node("answer", generate_answer_node)) # Node trả lời trực tiếp
     
-    workflow.set_entry_point("understand")
-    
-    workflow.add_edge("understand", "search")
-    workflow.add_edge("search", "recommend")
-    workflow.add_edge("recommend", "answer")
-    workflow.add_edge("answer", END)
+    if parallel:
+        workflow.add_node("embed_image", timed_node("embed_image", embed_image_node))
+        workflow.add_edge(START, "understand")
+        workflow.add_edge(START, "embed_image")
+        workflow.add_edge(["understand", "embed_image"], "search")
+        workflow.add_edge("search", "recommend")
+        workflow.add_edge("search", "answer")
+        workflow.add_edge("recommend", END)
+        workflow.add_edge("answer", END)
+    else:
+        workflow.set_entry_point("understand")
+        workflow.add_edge("understand", "search")
+        workflow.add_edge("search", "recommend")
+        workflow.add_edge("recommend", "answer")
+        workflow.add_edge("answer", END)
     
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile()
+
+@run_once
+def get_compiled_graph():
+    """Graph đã compile, dùng lại cho mọi truy vấn trong process (compile chỉ 1 lần)."""
+    with startup_report.phase("compile graph"):
+        return build_fashion_graph()
+
+def stream_fashion_graph(inputs: dict):
+    """
+    Chạy graph và phát sự kiện ngay khi có:
+      ("results", products) - sau node search, rồi sau node recommend (danh sách đầy đủ)
+      ("cursor", cursor)    - SearchCursor của lượt tìm kiếm (để lấy trang tiếp theo)
+      ("token", text)       - từng token câu trả lời của node answer
+      ("answer", text)      - câu trả lời hoàn chỉnh
+    """
+    app = get_compiled_graph()
+    for mode, chunk in _run_graph_steps(app.stream(inputs, stream_mode=["updates", "messages"])):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") == "answer" and isinstance(message.content, str) and message.content:
+                yield "token", message.content
+            continue
+
+        for node, update in (chunk or {}).items():
+            if not update: continue
+            if node == "search" and update.get("search_cursor") is not None:
+                yield "cursor", update["search_cursor"]
+            if node in ("search", "recommend") and "recommendations" in update:
+                yield "results", update["recommendations"]
+            elif node == "answer" and "answer_vi" in update:
+                yield "answer", update["answer_vi"]
+
+def _run_graph_steps(stream):
+    """
+    Chỉ mở ngân sách thời gian (request_budget) và đồng hồ graph_run quanh từng next() của graph:
+    thời gian bên tiêu thụ (UI vẽ kết quả giữa các sự kiện) không bị tính vào, và hạn chót
+    không lọt ra ngoài generator. Mọi truy vấn database trong lượt hỏi dùng chung phần ngân sách còn lại.
+    """
+    remaining, elapsed = REQUEST_BUDGET_SECONDS, 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                with request_budget(remaining):
+                    event = next(stream, None)
+            except Exception:
+                metrics.inc("graph_run_errors_total")
+                raise
+            finally:
+                step = time.perf_counter() - start
+                remaining -= step
+                elapsed += step
+            if event is None: return
+            yield event
+    finally:
+        stream.close()
+        metrics.observe("graph_run_seconds", elapsed)
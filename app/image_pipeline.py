@@ -0,0 +1,63 @@
+"""
+Xử lý ảnh người dùng tải lên ở thread pool riêng, giải mã đúng 1 lần:
+- JPEG được giải mã thẳng ở độ phân giải gần kích thước đầu vào CLIP (Image.draft),
+- CLIPProcessor tạo tensor pixel_values ngay trong worker,
+- kèm một ảnh preview JPEG nhỏ cho lịch sử chat.
+
+Sau bước này không còn giữ bản full-resolution nào (session_state chỉ lưu preview,
+graph chỉ nhận tensor 3x224x224).
+"""
+import base64
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, NamedTuple, Optional
+
+from PIL import Image
+
+from app.config import IMAGE_WORKERS, IMAGE_PREVIEW_SIZE, THUMBNAIL_QUALITY
+from app.startup import run_once
+from app.utils import get_clip_model
+
+
+class PreparedImage(NamedTuple):
+    digest: str          # SHA-256 của bytes gốc -> khoá cache embedding (kèm chế độ tiền xử lý "draft")
+    pixel_values: Any    # tensor đầu vào CLIP (3, H, W)
+    preview_base64: str  # JPEG nhỏ (data URI) cho lịch sử chat
+
+
+@run_once
+def get_image_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+def _clip_input_size(processor) -> int:
+    size = processor.image_processor.size
+    return size.get("shortest_edge") or size.get("height") or 224
+
+
+def _prepare_image(image_bytes: bytes, digest: Optional[str] = None) -> PreparedImage:
+    _, processor, _ = get_clip_model()
+    target = _clip_input_size(processor)
+
+    image = Image.open(BytesIO(image_bytes))
+    image.draft("RGB", (target, target))  # JPEG: chỉ giải mã ở tỉ lệ vừa đủ >= đầu vào CLIP
+    image = image.convert("RGB")
+
+    preview = image.copy()
+    preview.thumbnail(IMAGE_PREVIEW_SIZE)
+    buffer = BytesIO()
+    preview.save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY)
+    preview_base64 = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    pixel_values = processor(images=image, return_tensors="pt")["pixel_values"][0]
+    return PreparedImage(digest or hashlib.sha256(image_bytes).hexdigest(), pixel_values, preview_base64)
+
+
+def prepare_image_async(image_bytes: bytes, digest: Optional[str] = None) -> Future:
+    """Đưa ảnh vào worker pool; Future trả về PreparedImage. digest: SHA-256 của bytes nếu bên gọi đã tính."""
+    return get_image_executor().submit(_prepare_image, image_bytes, digest)
+
+
+def prepare_image(image_bytes: bytes) -> PreparedImage:
+    return prepare_image_async(image_bytes).result()
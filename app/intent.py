@@ -0,0 +1,132 @@
+"""
+Đường nhanh không cần LLM cho bước hiểu ý định:
+1. Phát hiện ngôn ngữ bằng dấu tiếng Việt + từ vựng tiếng Anh.
+2. Trích từ khoá: bỏ từ đệm ("show me", "i want"...).
+3. Phân loại book / fashion bằng prototype gần nhất trên embedding CLIP text.
+
+Chỉ trả lời khi đủ tự tin; còn lại (vd: câu tiếng Việt cần dịch) để Gemini xử lý.
+"""
+import math
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.startup import run_once
+from app.utils import embed_texts, get_query_embedding
+
+VI_DIACRITICS = set(
+    "àáảãạăằắẳẵặâầấẩẫậèéẻẽẹêềếểễệìíỉĩịòóỏõọôồốổỗộơờớởỡợùúủũụưừứửữựỳýỷỹỵđ"
+)
+
+# Từ tiếng Việt không dấu hay gặp -> câu ASCII nhưng không phải tiếng Anh.
+# Không đưa vào các từ trùng từ tiếng Anh ("do", "can", "ban", "dam", "den"): 1 từ là đủ
+# kết luận 'vi', nên "can you find..." sẽ bị đẩy sang Gemini một cách oan uổng.
+VI_ASCII_WORDS = {
+    "tim", "kiem", "cho", "toi", "minh", "mua", "ao", "quan", "vay", "giay", "dep",
+    "sach", "truyen", "mau", "xanh", "trang", "nu", "nam", "cua", "va",
+    "nhung", "mot", "cai", "chiec", "muon", "gia", "re", "co", "khong",
+}
+
+FILLER_WORDS = {
+    "i", "im", "i'm", "me", "my", "we", "you", "a", "an", "the", "some", "any", "please", "pls",
+    "want", "wanna", "need", "would", "like", "to", "buy", "find", "search", "show", "looking",
+    "look", "for", "get", "recommend", "suggest", "can", "could", "give", "is", "are", "there",
+    "do", "have", "something", "anything", "good", "nice", "best", "and", "or", "of", "with", "in",
+}
+
+# Từ vựng tiếng Anh dùng để đo độ tự tin "đây là câu tiếng Anh"
+EN_VOCAB = FILLER_WORDS | {
+    "dress", "dresses", "shirt", "shirts", "t-shirt", "tshirt", "shoe", "shoes", "sneaker",
+    "sneakers", "boot", "boots", "watch", "watches", "bag", "bags", "jacket", "jackets", "coat",
+    "jeans", "pants", "trousers", "skirt", "shorts", "hoodie", "sweater", "hat", "cap", "socks",
+    "sandals", "heels", "blouse", "top", "suit", "scarf", "belt", "wallet", "necklace", "ring",
+    "men", "mens", "women", "womens", "kids", "girl", "girls", "boy", "boys", "baby",
+    "red", "blue", "green", "black", "white", "pink", "yellow", "purple", "brown", "grey", "gray",
+    "floral", "summer", "winter", "casual", "formal", "party", "wedding", "running", "sport",
+    "leather", "cotton", "denim", "silk", "wool", "vintage", "cheap", "long", "short", "sleeve",
+    "book", "books", "novel", "novels", "story", "stories", "fiction", "nonfiction", "horror",
+    "romance", "fantasy", "mystery", "thriller", "history", "biography", "science", "cookbook",
+    "poetry", "comic", "comics", "manga", "children", "learning", "guide", "about", "on", "by",
+}
+
+BOOK_CUES = {"book", "books", "novel", "novels", "author", "fiction", "nonfiction", "biography",
+             "cookbook", "poetry", "comic", "comics", "manga", "read", "reading", "ebook"}
+
+PROTOTYPES = {
+    "book": [
+        "a book", "a novel", "a horror novel", "a romance book", "a science fiction book",
+        "a history book", "a children's book", "a cookbook", "a self-help book", "a comic book",
+    ],
+    "fashion": [
+        "a dress", "a shirt", "a pair of shoes", "a watch", "a handbag", "a jacket",
+        "a pair of jeans", "a skirt", "sneakers", "a summer outfit",
+    ],
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9'\-]+")
+
+
+def detect_language(text: str) -> Tuple[Optional[str], float]:
+    """Trả về (mã ngôn ngữ, độ tự tin). Chỉ nhận ra 'vi' và 'en'."""
+    lowered = text.lower()
+    if any(ch in VI_DIACRITICS for ch in lowered):
+        return "vi", 0.99
+    tokens = TOKEN_RE.findall(lowered)
+    if not tokens or not lowered.isascii():
+        return None, 0.0
+    if any(tok in VI_ASCII_WORDS for tok in tokens):
+        return "vi", 0.5
+    known = sum(tok in EN_VOCAB for tok in tokens)
+    return "en", known / len(tokens)
+
+
+def extract_keywords(text: str) -> str:
+    tokens = TOKEN_RE.findall(text.lower())
+    keywords = [tok for tok in tokens if tok not in FILLER_WORDS]
+    return " ".join(keywords or tokens)
+
+
+@run_once
+def get_intent_prototypes() -> Tuple[List[str], np.ndarray]:
+    """Vector trung bình (chuẩn hoá) của các câu mẫu cho từng intent, tính 1 lần."""
+    labels, centers = [], []
+    for label, phrases in PROTOTYPES.items():
+        center = np.asarray(embed_texts(phrases), dtype=np.float32).mean(axis=0)
+        labels.append(label)
+        centers.append(center / np.linalg.norm(center))
+    return labels, np.stack(centers)
+
+
+def classify_intent(keywords: str) -> Tuple[str, float]:
+    """Prototype gần nhất; độ tự tin = softmax với logit scale của CLIP (100)."""
+    tokens = set(keywords.split())
+    if tokens & BOOK_CUES:
+        return "book", 0.99
+
+    vector = get_query_embedding(text=keywords)
+    if vector is None:
+        return "fashion", 0.0
+    labels, centers = get_intent_prototypes()
+    logits = 100.0 * (centers @ np.asarray(vector, dtype=np.float32))
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    best = int(np.argmax(probs))
+    return labels[best], float(probs[best])
+
+
+def understand_locally(question: str, threshold: float) -> Optional[dict]:
+    """
+    Kết quả cùng dạng với understand_query_node nếu đủ tự tin (>= threshold), ngược lại None.
+    """
+    lang, lang_conf = detect_language(question)
+    # Chỉ câu tiếng Anh mới bỏ qua được LLM (câu khác cần dịch sang từ khoá tiếng Anh)
+    if lang != "en" or lang_conf < threshold:
+        return None
+
+    keywords = extract_keywords(question)
+    intent, intent_conf = classify_intent(keywords)
+    confidence = min(lang_conf, intent_conf)
+    if math.isnan(confidence) or confidence < threshold:
+        return None
+    return {"question_en": keywords, "category_intent": intent, "user_lang": lang, "confidence": confidence}
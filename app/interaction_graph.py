@@ -0,0 +1,177 @@
+"""
+Graph mua kèm (product_interactions) trong RAM dạng CSR.
+
+- indptr[i]:indptr[i+1] là lát cắt các hàng xóm của node i trong `neighbors` / `scores`,
+  đã sắp theo score giảm dần, nên top-k chỉ là một lát cắt mảng.
+- Các lượt cộng điểm mới (từ feedback_loop_tool) được giữ trong một overlay nhỏ
+  và gộp vào CSR khi overlay đủ lớn. Mảng CSR không bao giờ bị sửa tại chỗ: lượt gộp dựng
+  mảng mới ngoài lock (numpy) rồi chỉ tráo tham chiếu dưới lock, truy vấn không phải chờ.
+
+Nạp từ bản export CSV (item_a,item_b,score) hoặc đọc toàn bộ bảng theo trang.
+"""
+import csv
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class InteractionGraph:
+    def __init__(self, edges: Iterable[Tuple[str, str, float]] = (), compact_every: int = 5000):
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._overlay: Dict[str, Dict[str, float]] = {}
+        self._overlay_size = 0
+        self._build(edges)
+
+    # --- XÂY CSR ---
+    def _build(self, edges: Iterable[Tuple[str, str, float]]):
+        node_ids: Dict[str, int] = {}
+        src, dst, weights = [], [], []
+        for item_a, item_b, score in edges:
+            src.append(node_ids.setdefault(item_a, len(node_ids)))
+            dst.append(node_ids.setdefault(item_b, len(node_ids)))
+            weights.append(score)
+
+        self._install(node_ids, *_csr(len(node_ids), np.asarray(src, dtype=np.int32),
+                                      np.asarray(dst, dtype=np.int32), np.asarray(weights, dtype=np.float32)))
+
+    def _install(self, node_ids: Dict[str, int], indptr, neighbors, scores):
+        self.node_ids = node_ids
+        self.id_list = list(node_ids)
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def compact(self):
+        """Gộp overlay vào CSR. Lock chỉ giữ lúc chụp overlay và lúc tráo mảng mới vào."""
+        if not self._compact_lock.acquire(blocking=False): return  # đang có lượt gộp khác
+        try:
+            with self._lock:
+                if not self._overlay: return
+                frozen = {item_a: dict(row) for item_a, row in self._overlay.items()}
+                node_ids, indptr, neighbors, scores = self.node_ids, self.indptr, self.neighbors, self.scores
+
+            # Ngoài lock: cạnh CSR cũ + overlay (cạnh trùng được _csr cộng dồn)
+            node_ids = dict(node_ids)
+            extra_src, extra_dst, extra_weights = [], [], []
+            for item_a, row in frozen.items():
+                a = node_ids.setdefault(item_a, len(node_ids))
+                for item_b, delta in row.items():
+                    extra_src.append(a)
+                    extra_dst.append(node_ids.setdefault(item_b, len(node_ids)))
+                    extra_weights.append(delta)
+            src = np.concatenate([np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr)),
+                                  np.asarray(extra_src, dtype=np.int32)])
+            dst = np.concatenate([neighbors, np.asarray(extra_dst, dtype=np.int32)])
+            weights = np.concatenate([scores, np.asarray(extra_weights, dtype=np.float32)])
+            csr = _csr(len(node_ids), src, dst, weights)
+
+            with self._lock:
+                # Lượt cộng tới trong lúc dựng mảng vẫn nằm lại overlay
+                for item_a, row in frozen.items():
+                    live = self._overlay[item_a]
+                    for item_b, delta in row.items():
+                        if live[item_b] == delta:
+                            del live[item_b]
+                            self._overlay_size -= 1
+                        else:
+                            live[item_b] -= delta
+                    if not live: del self._overlay[item_a]
+                self._install(node_ids, *csr)
+        finally:
+            self._compact_lock.release()
+
+    # --- CẬP NHẬT & TRUY VẤN ---
+    def apply_increment(self, item_a: str, item_b: str, weight: float = 1):
+        with self._lock:
+            row = self._overlay.setdefault(item_a, {})
+            if item_b not in row: self._overlay_size += 1
+            row[item_b] = row.get(item_b, 0.0) + weight
+            needs_compact = self._overlay_size >= self.compact_every
+        if needs_compact:
+            self.compact()
+
+    def top_neighbors(self, item_a: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (item_b, score) theo score giảm dần."""
+        with self._lock:
+            node = self.node_ids.get(item_a)
+            row_overlay = self._overlay.get(item_a)
+            if node is None and not row_overlay: return []
+
+            if node is not None:
+                start, end = self.indptr[node], self.indptr[node + 1]
+                if not row_overlay:
+                    # Đường nhanh: chỉ là một lát cắt mảng
+                    end = min(end, start + k)
+                    return [(self.id_list[n], float(s))
+                            for n, s in zip(self.neighbors[start:end], self.scores[start:end])]
+                base = {self.id_list[n]: float(s)
+                        for n, s in zip(self.neighbors[start:end], self.scores[start:end])}
+            else:
+                base = {}
+
+            for item_b, delta in row_overlay.items():
+                base[item_b] = base.get(item_b, 0.0) + delta
+        return sorted(base.items(), key=lambda kv: -kv[1])[:k]
+
+    def item_scores(self) -> Dict[str, float]:
+        """Tổng score theo item_b (cộng mọi cạnh đi vào), dùng cho trending."""
+        with self._lock:
+            totals = np.bincount(self.neighbors, weights=self.scores, minlength=len(self.id_list))
+            result = {self.id_list[i]: float(totals[i]) for i in np.flatnonzero(totals)}
+            for row in self._overlay.values():
+                for item_b, delta in row.items():
+                    result[item_b] = result.get(item_b, 0.0) + delta
+        return result
+
+    def __len__(self):
+        return len(self.neighbors) + self._overlay_size
+
+
+def _csr(n_nodes: int, src: np.ndarray, dst: np.ndarray, weights: np.ndarray):
+    """
+    (indptr, neighbors, scores). Cạnh trùng (a, b) được cộng dồn thành 1; sắp theo
+    (nguồn tăng dần, score giảm dần) -> mỗi hàng đã theo thứ tự score.
+    """
+    keys, inverse = np.unique(src.astype(np.int64) * n_nodes + dst, return_inverse=True)
+    src = (keys // n_nodes).astype(np.int32)
+    dst = (keys % n_nodes).astype(np.int32)
+    weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys)).astype(np.float32)
+    order = np.lexsort((-weights, src))
+    counts = np.bincount(src, minlength=n_nodes)
+    indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    return indptr, dst[order], weights[order]
+
+
+# ==================================================
+# NẠP DỮ LIỆU
+# ==================================================
+
+def load_edges_from_csv(path: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield row["item_a"], row["item_b"], float(row["score"])
+
+
+def load_edges_from_supabase(client, page_size: int = 1000):
+    start = 0
+    while True:
+        page = client.table("product_interactions") \
+            .select("item_a, item_b, score") \
+            .order("item_a") \
+            .order("item_b") \
+            .range(start, start + page_size - 1) \
+            .execute()
+        if not page.data: break
+        for row in page.data:
+            yield row["item_a"], row["item_b"], float(row["score"])
+        start += page_size
+
+
+def build_interaction_graph(client=None, csv_path: Optional[str] = None) -> InteractionGraph:
+    edges = load_edges_from_csv(csv_path) if csv_path else load_edges_from_supabase(client)
+    graph = InteractionGraph(edges)
+    print(f"✅ Đã nạp graph tương tác: {len(graph.id_list)} node, {len(graph)} cạnh")
+    return graph
@@ -0,0 +1,135 @@
+"""
+Cache bền vững (SQLite) cho phản hồi Gemini.
+
+- Khoá = SHA-256 của input đã chuẩn hoá (câu hỏi, hoặc câu hỏi + id sản phẩm + ngôn ngữ).
+- Giới hạn số entry: vượt ngưỡng thì xoá các entry lâu không dùng nhất (LRU theo last_access).
+- Chế độ semantic (tuỳ chọn): nếu không trúng khoá chính xác, dùng lại kết quả của câu
+  hỏi có embedding đủ gần (cosine >= ngưỡng) trong cùng namespace và cùng `tag`. Embedding
+  CLIP của "red dress" và "blue dress" rất gần nhau, nên tag (vd: tập từ khoá) là điều kiện bắt buộc.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    embedding BLOB,
+    tag TEXT,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access);
+"""
+
+
+def make_key(namespace: str, *parts) -> str:
+    raw = "\x1f".join([namespace] + [str(p) for p in parts])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: str, max_entries: int = 5000, ttl: Optional[float] = None,
+                 semantic_threshold: float = 0.95):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+        if "tag" not in columns:
+            # File cache cũ: entry không có tag sẽ không bao giờ được so khớp semantic
+            self._conn.execute("ALTER TABLE llm_cache ADD COLUMN tag TEXT")
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+        # (namespace, tag) -> (danh sách key, ma trận embedding) để so khớp semantic trong RAM
+        self._semantic: Dict[str, tuple] = {}
+
+    def _count(self, namespace: str, kind: str):
+        counters = self._counters.setdefault(namespace, {"hits": 0, "semantic_hits": 0, "misses": 0})
+        counters[kind] += 1
+
+    def _is_expired(self, created_at: float) -> bool:
+        return bool(self.ttl) and time.time() - created_at > self.ttl
+
+    def _load_semantic(self, namespace: str, tag: str):
+        if (namespace, tag) not in self._semantic:
+            rows = self._conn.execute(
+                "SELECT key, embedding FROM llm_cache WHERE namespace = ? AND tag = ? AND embedding IS NOT NULL",
+                (namespace, tag)
+            ).fetchall()
+            keys = [k for k, _ in rows]
+            matrix = np.stack([np.frombuffer(e, dtype=np.float32) for _, e in rows]) if rows else None
+            self._semantic[(namespace, tag)] = (keys, matrix)
+        return self._semantic[(namespace, tag)]
+
+    def get(self, namespace: str, key: str, embedding: Optional[List[float]] = None,
+            tag: Optional[str] = None) -> Optional[Any]:
+        """Tra khoá chính xác; nếu có cả `embedding` và `tag` thì thử tiếp so khớp semantic (chỉ giữa các entry cùng tag)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            kind = "hits"
+
+            if row is None and embedding is not None and tag is not None:
+                keys, matrix = self._load_semantic(namespace, tag)
+                if matrix is not None:
+                    scores = matrix @ np.asarray(embedding, dtype=np.float32)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.semantic_threshold:
+                        key = keys[best]
+                        row = self._conn.execute(
+                            "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+                        ).fetchone()
+                        kind = "semantic_hits"
+
+            if row is None or self._is_expired(row[1]):
+                self._count(namespace, "misses")
+                return None
+
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._count(namespace, kind)
+            return json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value: Any, embedding: Optional[List[float]] = None,
+            tag: Optional[str] = None):
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, value, embedding, tag, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, json.dumps(value, ensure_ascii=False), blob, tag, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+            self._semantic.pop((namespace, tag), None)
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            self._semantic.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        result = {}
+        for namespace, c in self._counters.items():
+            total = c["hits"] + c["semantic_hits"] + c["misses"]
+            result[namespace] = dict(c, hit_ratio=(c["hits"] + c["semantic_hits"]) / total if total else 0.0)
+        return result
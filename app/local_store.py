@@ -0,0 +1,371 @@
+"""
+Backend lưu trữ nhúng (SQLite + numpy) cho triển khai 1 máy, thay cho Supabase khi
+STORAGE_BACKEND=local. Phục vụ đúng các bảng và RPC mà app dùng:
+- bảng fashion_clip_index, books_index, product_interactions;
+- RPC match_fashion_clip, match_books, increment_interaction_score(s).
+
+API giống client Supabase (.table().select().eq()...execute(), .rpc(name, params).execute())
+nên tools không cần biết đang chạy backend nào.
+
+Lưu trữ:
+- Bảng sản phẩm: (id, doc JSON chứa các cột còn lại, embedding float32 BLOB).
+  Lọc / sắp xếp theo cột khác id dùng json_extract trên doc.
+- product_interactions: bảng thường, khoá chính (item_a, item_b).
+- RPC vector: quét chính xác cosine trên ma trận float32 trong RAM (nạp lười từ SQLite,
+  nạp lại sau khi bảng bị ghi), giống kết quả RPC pgvector.
+
+Chép dữ liệu từ Supabase sang: python -m app.local_store import [đường dẫn .sqlite3]
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.vector_index import parse_embedding
+
+PRODUCT_TABLES = ("fashion_clip_index", "books_index")
+# RPC vector -> (bảng, trả về cả dòng sản phẩm hay chỉ id + similarity)
+VECTOR_RPCS = {"match_fashion_clip": ("fashion_clip_index", False), "match_books": ("books_index", True)}
+# RPC cộng điểm: 1 cặp / cả lô (p_items: [{item_a, item_b, increment}], 1 transaction)
+WRITE_RPCS = ("increment_interaction_score", "increment_interaction_scores")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fashion_clip_index (id TEXT PRIMARY KEY, doc TEXT NOT NULL, embedding BLOB);
+CREATE TABLE IF NOT EXISTS books_index (id TEXT PRIMARY KEY, doc TEXT NOT NULL, embedding BLOB);
+CREATE TABLE IF NOT EXISTS product_interactions (
+    item_a TEXT NOT NULL,
+    item_b TEXT NOT NULL,
+    score REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (item_a, item_b)
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_score ON product_interactions (score DESC);
+"""
+INTERACTION_COLUMNS = ("item_a", "item_b", "score")
+_COLUMN_NAME = re.compile(r"^\w+$")
+
+
+class LocalResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+def _encode_embedding(value) -> Optional[bytes]:
+    if value is None: return None
+    return np.asarray(parse_embedding(value), dtype=np.float32).tobytes()
+
+
+def _decode_embedding(blob: Optional[bytes]) -> Optional[List[float]]:
+    if blob is None: return None
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class LocalQuery:
+    def __init__(self, store: "LocalStore", table: str):
+        if table not in PRODUCT_TABLES and table != "product_interactions":
+            raise ValueError(f"Bảng không có trong local store: {table}")
+        self.store = store
+        self.table = table
+        self.columns = None
+        self.where, self.params = [], []
+        self.orders = []
+        self.offset, self.count = 0, None
+        self.write = None  # ("upsert" | "insert" | "update", payload)
+
+    def _column(self, name: str) -> str:
+        """Biểu thức SQL của 1 cột (cột thật, hoặc json_extract trên doc với bảng sản phẩm)."""
+        if not _COLUMN_NAME.match(name):
+            raise ValueError(f"Tên cột không hợp lệ: {name}")
+        if self.table == "product_interactions":
+            if name not in INTERACTION_COLUMNS:
+                raise ValueError(f"product_interactions không có cột {name}")
+            return name
+        if name == "id": return "id"
+        if name == "embedding": return "embedding"
+        return f"json_extract(doc, '$.{name}')"
+
+    # --- builder ---
+    def select(self, columns: str = "*", **kwargs):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self.where.append(f"{self._column(column)} = ?")
+        self.params.append(value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        if not values:
+            self.where.append("0")
+            return self
+        self.where.append(f"{self._column(column)} IN ({', '.join('?' * len(values))})")
+        self.params.extend(values)
+        return self
+
+    def is_(self, column, value):
+        if value not in (None, "null"):
+            raise ValueError("Local store chỉ hỗ trợ is_(cột, 'null')")
+        self.where.append(f"{self._column(column)} IS NULL")
+        return self
+
+    def order(self, column, desc: bool = False):
+        self.orders.append(f"{self._column(column)} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, n: int):
+        self.count = n
+        return self
+
+    def range(self, start: int, end: int):
+        self.offset, self.count = start, end - start + 1
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id"):
+        self.write = ("upsert", rows if isinstance(rows, list) else [rows])
+        return self
+
+    def insert(self, rows):
+        self.write = ("insert", rows if isinstance(rows, list) else [rows])
+        return self
+
+    def update(self, values: dict):
+        self.write = ("update", values)
+        return self
+
+    # --- thực thi ---
+    def _where_sql(self) -> str:
+        return f" WHERE {' AND '.join(self.where)}" if self.where else ""
+
+    def _select_sql(self, fields: str) -> str:
+        sql = f"SELECT {fields} FROM {self.table}{self._where_sql()}"
+        if self.orders: sql += " ORDER BY " + ", ".join(self.orders)
+        if self.count is not None or self.offset:
+            sql += f" LIMIT {-1 if self.count is None else int(self.count)} OFFSET {int(self.offset)}"
+        return sql
+
+    def _project(self, row: dict) -> dict:
+        if self.columns is None: return row
+        return {c: row.get(c) for c in self.columns}
+
+    def execute(self) -> LocalResponse:
+        if self.write:
+            kind, payload = self.write
+            data = self.store.write(self, kind, payload)
+            return self.store.respond(f"table:{self.table}", payload, data)
+
+        if self.table == "product_interactions":
+            with self.store.lock:
+                rows = self.store.conn.execute(self._select_sql(", ".join(INTERACTION_COLUMNS)), self.params).fetchall()
+            data = [self._project(dict(zip(INTERACTION_COLUMNS, r))) for r in rows]
+        else:
+            want_embedding = self.columns is None or "embedding" in self.columns
+            fields = "id, doc, embedding" if want_embedding else "id, doc"
+            with self.store.lock:
+                rows = self.store.conn.execute(self._select_sql(fields), self.params).fetchall()
+            data = []
+            for r in rows:
+                row = dict(json.loads(r[1]), id=r[0])
+                if want_embedding: row["embedding"] = _decode_embedding(r[2])
+                data.append(self._project(row))
+        return self.store.respond(f"table:{self.table}", None, data)
+
+
+class LocalRPC:
+    def __init__(self, store: "LocalStore", name: str, params: dict):
+        if name not in WRITE_RPCS and name not in VECTOR_RPCS:
+            raise ValueError(f"RPC không có trong local store: {name}")
+        self.store, self.name, self.params = store, name, params
+
+    def execute(self) -> LocalResponse:
+        p = self.params
+        if self.name == "increment_interaction_score":
+            self.store.increment_interactions([(p["p_item_a"], p["p_item_b"], p["p_increment"])])
+            data = None
+        elif self.name == "increment_interaction_scores":
+            self.store.increment_interactions([(r["item_a"], r["item_b"], r["increment"]) for r in p["p_items"]])
+            data = None
+        else:
+            table, full_rows = VECTOR_RPCS[self.name]
+            data = self.store.match(table, p["query_embedding"], p["match_threshold"], p["match_count"],
+                                    full_rows=full_rows)
+        return self.store.respond(f"rpc:{self.name}", p, data)
+
+
+class LocalStore:
+    def __init__(self, path: str):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        # bảng -> (danh sách id, ma trận embedding đã chuẩn hoá)
+        self._matrices: Dict[str, tuple] = {}
+
+    # --- API giống supabase.Client ---
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> LocalRPC:
+        return LocalRPC(self, name, params)
+
+    def respond(self, endpoint: str, request, data) -> LocalResponse:
+        """Điểm móc cho lớp con (vd: benchmark đếm round trip / byte)."""
+        return LocalResponse(data)
+
+    # --- ghi ---
+    def write(self, query: LocalQuery, kind: str, payload) -> list:
+        with self.lock:
+            if query.table == "product_interactions":
+                data = self._write_interactions(query, kind, payload)
+            else:
+                data = self._write_products(query, kind, payload)
+                self._matrices.pop(query.table, None)
+            self.conn.commit()
+        return data
+
+    def _write_interactions(self, query: LocalQuery, kind: str, payload) -> list:
+        if kind == "update":
+            sets = ", ".join(f"{query._column(c)} = ?" for c in payload)
+            self.conn.execute(f"UPDATE product_interactions SET {sets}{query._where_sql()}",
+                              list(payload.values()) + query.params)
+            return [payload]
+        conflict = " ON CONFLICT (item_a, item_b) DO UPDATE SET score = excluded.score" if kind == "upsert" else ""
+        self.conn.executemany(
+            f"INSERT INTO product_interactions (item_a, item_b, score) VALUES (?, ?, ?){conflict}",
+            [(r["item_a"], r["item_b"], float(r.get("score", 0.0))) for r in payload]
+        )
+        return payload
+
+    def _write_products(self, query: LocalQuery, kind: str, payload) -> list:
+        table = query.table
+        if kind == "update":
+            rows = self.conn.execute(f"SELECT id, doc, embedding FROM {table}{query._where_sql()}", query.params).fetchall()
+            changes = [dict(payload, id=r[0]) for r in rows]
+            existing = {r[0]: (json.loads(r[1]), r[2]) for r in rows}
+        else:
+            changes = payload
+            ids = [r["id"] for r in payload]
+            existing = {}
+            if kind == "upsert" and ids:
+                # Giống upsert của PostgREST: cột không có trong payload giữ giá trị cũ
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    for r in self.conn.execute(
+                        f"SELECT id, doc, embedding FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    ):
+                        existing[r[0]] = (json.loads(r[1]), r[2])
+
+        records = []
+        for change in changes:
+            change = dict(change)
+            product_id = change.pop("id")
+            doc, embedding = existing.get(product_id, ({}, None))
+            if "embedding" in change:
+                embedding = _encode_embedding(change.pop("embedding"))
+            doc = dict(doc, **change)
+            records.append((product_id, json.dumps(doc, ensure_ascii=False), embedding))
+
+        verb = "INSERT" if kind == "insert" else "INSERT OR REPLACE"
+        self.conn.executemany(f"{verb} INTO {table} (id, doc, embedding) VALUES (?, ?, ?)", records)
+        return [dict(json.loads(doc), id=product_id) for product_id, doc, _ in records]
+
+    def increment_interactions(self, rows: List[tuple]):
+        """Cộng điểm cho các cặp (item_a, item_b, increment) trong 1 transaction."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO product_interactions (item_a, item_b, score) VALUES (?, ?, ?) "
+                "ON CONFLICT (item_a, item_b) DO UPDATE SET score = score + excluded.score",
+                [(item_a, item_b, float(increment)) for item_a, item_b, increment in rows]
+            )
+
+    # --- RPC vector ---
+    def _matrix(self, table: str) -> tuple:
+        with self.lock:
+            if table not in self._matrices:
+                rows = self.conn.execute(
+                    f"SELECT id, embedding FROM {table} WHERE embedding IS NOT NULL ORDER BY rowid"
+                ).fetchall()
+                ids = [r[0] for r in rows]
+                if rows:
+                    matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+                    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+                else:
+                    matrix = np.zeros((0, 0), dtype=np.float32)
+                self._matrices[table] = (ids, matrix)
+            return self._matrices[table]
+
+    def match(self, table: str, query, threshold: float, count: int, full_rows: bool = False) -> list:
+        """Top-count theo cosine, lọc similarity >= threshold (giống RPC pgvector)."""
+        ids, matrix = self._matrix(table)
+        if not ids or count <= 0: return []
+        query = np.asarray(parse_embedding(query), dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        k = min(count, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = [int(i) for i in top[np.argsort(-scores[top])] if scores[i] >= threshold]
+        if not full_rows:
+            return [{"id": ids[i], "similarity": float(scores[i])} for i in top]
+
+        hits = [ids[i] for i in top]
+        with self.lock:
+            docs = dict(self.conn.execute(
+                f"SELECT id, doc FROM {table} WHERE id IN ({', '.join('?' * len(hits))})", hits
+            ).fetchall()) if hits else {}
+        return [dict(json.loads(docs[ids[i]]), id=ids[i], similarity=float(scores[i])) for i in top if ids[i] in docs]
+
+    def vectors(self, table: str) -> tuple:
+        """(danh sách id, ma trận embedding đã chuẩn hoá) của 1 bảng sản phẩm."""
+        return self._matrix(table)
+
+    # --- nạp dữ liệu ---
+    def load(self, table: str, rows: List[dict]):
+        """Ghi hàng loạt (thay thế dòng trùng khoá) - dùng khi nạp dữ liệu ban đầu."""
+        if not rows: return
+        query = self.table(table)
+        with self.lock:
+            if table == "product_interactions":
+                self._write_interactions(query, "upsert", rows)
+            else:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} (id, doc, embedding) VALUES (?, ?, ?)",
+                    [(r["id"], json.dumps({k: v for k, v in r.items() if k not in ("id", "embedding")}, ensure_ascii=False),
+                      _encode_embedding(r.get("embedding"))) for r in rows]
+                )
+                self._matrices.pop(table, None)
+            self.conn.commit()
+
+
+def copy_from_supabase(client, store: LocalStore, page_size: int = 1000) -> Dict[str, int]:
+    """Chép toàn bộ 3 bảng từ Supabase sang local store (phân trang theo khoá chính)."""
+    copied = {}
+    for table, order in [("fashion_clip_index", ["id"]), ("books_index", ["id"]),
+                         ("product_interactions", ["item_a", "item_b"])]:
+        copied[table] = 0
+        while True:
+            query = client.table(table).select("*")
+            for column in order: query = query.order(column)
+            page = query.range(copied[table], copied[table] + page_size - 1).execute()
+            if not page.data: break
+            store.load(table, page.data)
+            copied[table] += len(page.data)
+            print(f"⏳ {table}: đã chép {copied[table]} dòng...")
+        print(f"✅ {table}: xong {copied[table]} dòng")
+    return copied
+
+
+if __name__ == "__main__":
+    import sys
+    from app.config import LOCAL_STORE_PATH
+    from app.utils import get_supabase_client
+
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Cách dùng: python -m app.local_store import [đường dẫn .sqlite3]")
+        sys.exit(1)
+    copy_from_supabase(get_supabase_client(), LocalStore(sys.argv[2] if len(sys.argv) > 2 else LOCAL_STORE_PATH))
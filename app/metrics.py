@@ -0,0 +1,219 @@
+"""
+Đo đạc trong process với chi phí thấp (đủ nhẹ để bật thường trực):
+- span(name, **labels): đo thời gian 1 đoạn code vào histogram `<name>_seconds`.
+- observe / inc: histogram và counter tuỳ ý (số dòng, số byte, batch size...).
+- register_collector: gauge tính lúc export (vd: thống kê cache).
+
+Histogram dùng bucket cố định (mỗi lần observe chỉ là 1 bisect + cộng dồn dưới lock),
+percentile được nội suy từ bucket. export_prometheus() trả về text format của Prometheus;
+đặt METRICS_PORT để có endpoint /metrics cho Prometheus scrape.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.cache import all_cache_stats
+from app.config import METRICS_PORT
+from app.startup import run_once
+
+# Bucket (giây) cho độ trễ: 1 ms -> 60 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Bucket cho số lượng (dòng, byte, batch size): lũy thừa của 4
+SIZE_BUCKETS = tuple(4 ** i for i in range(13))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs: return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ô cuối = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Nội suy tuyến tính trong bucket chứa phân vị q (như histogram_quantile của Prometheus)."""
+        if self.count == 0: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets): return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+    # --- ghi ---
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Đo thời gian vào `<name>_seconds`; lỗi được đếm vào `<name>_errors_total`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator dạng span."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, dict, float]]]):
+        """collector() trả về các (tên gauge, labels, giá trị), được gọi lúc export."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    # --- đọc ---
+    def percentiles(self, name: str, quantiles=(0.5, 0.95, 0.99)) -> Dict[LabelKey, dict]:
+        with self._lock:
+            series = dict(self._histograms.get(name, {}))
+            return {
+                key: dict({f"p{int(q * 100)}": h.quantile(q) for q in quantiles}, count=h.count, sum=h.sum)
+                for key, h in series.items()
+            }
+
+    def summary(self, prefix: str = "") -> str:
+        """Bảng p50/p95/p99 (ms) của mọi histogram độ trễ, để in ra log / sidebar."""
+        lines = []
+        with self._lock:
+            names = sorted(self._histograms)
+        for name in names:
+            if not name.startswith(prefix) or not name.endswith("_seconds"): continue
+            for key, p in sorted(self.percentiles(name).items()):
+                label = name[:-len("_seconds")] + _format_labels(key)
+                lines.append(f"{label:<60} n={p['count']:<6} p50={p['p50'] * 1000:8.1f}ms "
+                             f"p95={p['p95'] * 1000:8.1f}ms p99={p['p99'] * 1000:8.1f}ms")
+        return "\n".join(lines)
+
+    def export_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: list(series.items()) for name, series in self._histograms.items()}
+            collectors = list(self._collectors)
+
+        for name, series in sorted(counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for key, h in series:
+                cumulative = 0
+                for bound, n in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {h.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+
+        gauges: Dict[str, list] = {}
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, []).append((_label_key(labels), value))
+            except Exception as e:
+                print(f"Lỗi thu thập metrics: {e}")
+        for name, series in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series:
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def _cache_gauges():
+    for stats in all_cache_stats():
+        labels = {"cache": stats["name"]}
+        yield "cache_size", labels, stats["size"]
+        yield "cache_hits", labels, stats["hits"]
+        yield "cache_misses", labels, stats["misses"]
+        yield "cache_hit_ratio", labels, stats["hit_ratio"]
+
+
+metrics.register_collector(_cache_gauges)
+
+
+# --- ENDPOINT /metrics ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.export_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@run_once
+def start_metrics_server() -> Optional[ThreadingHTTPServer]:
+    """Mở http://0.0.0.0:METRICS_PORT/metrics ở thread nền (1 lần / process). METRICS_PORT=0 -> tắt."""
+    if not METRICS_PORT: return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", METRICS_PORT), _MetricsHandler)
+    except OSError as e:
+        # Streamlit có thể chạy nhiều process; process đến sau không mở được cổng
+        print(f"⚠️ Không mở được cổng metrics {METRICS_PORT}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics tại http://0.0.0.0:{METRICS_PORT}/metrics")
+    return server
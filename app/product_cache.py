@@ -0,0 +1,67 @@
+"""
+Cache bản ghi sản phẩm theo id cho fashion_clip_index và books_index.
+Chỉ các id chưa có trong cache mới được lấy từ Supabase (1 truy vấn .in_ cho cả lô).
+"""
+from typing import Iterable, List, Optional
+
+from app.cache import LRUCache
+from app.config import PRODUCT_CACHE_SIZE, PRODUCT_CACHE_TTL, THUMBNAIL_COLUMN_ENABLED
+from app.thumbnails import attach_thumbnail
+from app.utils import run_query
+
+# Cột cần cho card / trang chi tiết. Không lấy cột embedding (512 số thực) về cache;
+# ảnh gốc chỉ được lấy khi chưa có cột thumbnail (sẽ bị thay bằng thumbnail trước khi vào cache).
+PRODUCT_COLUMNS = {
+    "fashion_clip_index": "id, title, metadata, "
+                          + ("thumbnail_base64" if THUMBNAIL_COLUMN_ENABLED else "image_base64"),
+    "books_index": "*",
+}
+
+_caches = {
+    table: LRUCache(maxsize=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL, name=f"products:{table}")
+    for table in PRODUCT_COLUMNS
+}
+
+
+def get_products(client, table: str, ids: Iterable[str]) -> List[dict]:
+    """
+    Trả về bản ghi của các id theo đúng thứ tự truyền vào (bỏ qua id không tồn tại).
+    Mỗi bản ghi là một bản sao nên tool có thể gắn thêm 'reason', 'type' thoải mái.
+    Bản ghi chỉ mang thumbnail_base64; ảnh gốc lấy riêng bằng thumbnails.get_full_image().
+    """
+    ids = list(dict.fromkeys(ids))
+    cache = _caches[table]
+
+    found = {}
+    for pid in ids:
+        record = cache.get(pid)
+        if record is not None:
+            found[pid] = record
+
+    missing = [pid for pid in ids if pid not in found]
+    if missing:
+        rows = run_query(f"{table}.details", client.table(table)
+            .select(PRODUCT_COLUMNS[table])
+            .in_("id", missing), idempotent=True)
+        for row in rows.data:
+            row.pop("embedding", None)
+            attach_thumbnail(row)
+            cache.set(row["id"], row)
+            found[row["id"]] = row
+
+    return [dict(found[pid]) for pid in ids if pid in found]
+
+
+def invalidate_products(table: Optional[str] = None, ids: Optional[Iterable[str]] = None):
+    """Xoá cache của một số id (hoặc cả bảng / toàn bộ nếu không truyền)."""
+    tables = [table] if table else list(_caches)
+    for name in tables:
+        if ids is None:
+            _caches[name].clear()
+        else:
+            for pid in ids:
+                _caches[name].invalidate(pid)
+
+
+def product_cache_stats() -> List[dict]:
+    return [cache.stats() for cache in _caches.values()]
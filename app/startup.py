@@ -0,0 +1,59 @@
+"""
+Hỗ trợ khởi động nhanh:
+- run_once: khởi tạo tài nguyên nặng đúng 1 lần kể cả khi nhiều session gọi cùng lúc.
+- StartupReport: đo thời gian từng phase khởi động (import, compile graph, nạp model...).
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+def run_once(fn):
+    """
+    Như functools.lru_cache cho hàm không tham số, nhưng thread-safe kiểu single-flight:
+    các thread đến sau chờ thread đầu khởi tạo xong thay vì tự khởi tạo thêm lần nữa.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(fn)
+    def wrapper():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(fn())
+        return result[0]
+
+    wrapper.is_initialized = lambda: bool(result)
+    wrapper.cache_clear = result.clear
+    return wrapper
+
+
+class StartupReport:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Đo 1 phase; chỉ ghi lần chạy đầu tiên (Streamlit chạy lại script ở mỗi rerun)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases.setdefault(name, elapsed)
+
+    def summary(self) -> str:
+        lines = ["⏱️ Startup report:"]
+        for name, elapsed in self.phases.items():
+            lines.append(f"   {name:<28} {elapsed * 1000:9.1f} ms")
+        lines.append(f"   {'(từ lúc import app)':<28} {(time.perf_counter() - self.t0) * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+
+startup_report = StartupReport()
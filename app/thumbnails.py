@@ -0,0 +1,137 @@
+"""
+Ảnh thu nhỏ (thumbnail) cho grid / card và tải ảnh gốc lười (chỉ ở trang chi tiết).
+
+- Nếu bảng đã có cột `thumbnail_base64` (THUMBNAIL_COLUMN_ENABLED=1, tạo bằng
+  `python -m app.thumbnails backfill <table>`), card chỉ select cột này.
+- Nếu chưa, thumbnail được tạo tại chỗ từ image_base64 khi bản ghi vào cache
+  và ảnh gốc bị bỏ khỏi bản ghi, nên Streamlit không phải gửi ảnh full cho mỗi card.
+"""
+import base64
+import sys
+from io import BytesIO
+from typing import List, Optional
+
+from PIL import Image
+
+from app.cache import LRUCache
+from app.config import THUMBNAIL_SIZE, THUMBNAIL_QUALITY
+from app.utils import run_query
+
+THUMBNAIL_FIELD = "thumbnail_base64"
+
+# Cột chứa ảnh gốc cho trang chi tiết (bảng thời trang có thể để ảnh trong metadata)
+FULL_IMAGE_COLUMNS = {
+    "fashion_clip_index": "image_base64, metadata",
+    "books_index": "image_base64",
+}
+
+# Ảnh gốc chỉ dùng cho trang chi tiết nên chỉ giữ vài ảnh gần nhất
+_full_image_cache = LRUCache(maxsize=32, name="full_images")
+
+
+def _strip_data_uri(img_str: str) -> str:
+    return img_str.split(",", 1)[1] if img_str.startswith("data:image") else img_str
+
+
+def make_thumbnail_base64(img_str: str, size=THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY) -> Optional[str]:
+    """Giải mã ảnh base64, thu nhỏ trong khung `size` và mã hoá lại JPEG base64."""
+    try:
+        image = Image.open(BytesIO(base64.b64decode(_strip_data_uri(img_str))))
+        image.draft("RGB", size)  # JPEG: giải mã thẳng ở độ phân giải thấp
+        image = image.convert("RGB")
+        image.thumbnail(size)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    except Exception as e:
+        print(f"Lỗi tạo thumbnail: {e}")
+        return None
+
+
+def attach_thumbnail(record: dict) -> dict:
+    """
+    Đảm bảo bản ghi có `thumbnail_base64` và bỏ ảnh gốc (cả trong metadata) khỏi bản ghi.
+    Trả về chính record (metadata được thay bằng bản sao, không sửa dict dùng chung).
+    """
+    metadata = record.get("metadata")
+    original = record.pop("image_base64", None)
+    if isinstance(metadata, dict) and "image_base64" in metadata:
+        metadata = dict(metadata)
+        original = original or metadata.pop("image_base64")
+        metadata.pop("image_base64", None)
+        record["metadata"] = metadata
+
+    if not record.get(THUMBNAIL_FIELD) and original:
+        record[THUMBNAIL_FIELD] = make_thumbnail_base64(original)
+    return record
+
+
+def get_card_image(product: dict) -> Optional[str]:
+    """Ảnh cho card: ưu tiên thumbnail, bản ghi cũ (chưa qua cache) thì dùng ảnh gốc."""
+    return product.get(THUMBNAIL_FIELD) or product.get("image_base64") \
+        or (product.get("metadata") or {}).get("image_base64")
+
+
+def get_full_image(client, table: str, product_id: str) -> Optional[str]:
+    """Lấy ảnh gốc của 1 sản phẩm (chỉ gọi ở trang chi tiết)."""
+    img_str = _full_image_cache.get((table, product_id))
+    if img_str is not None:
+        return img_str
+
+    rows = run_query(f"{table}.full_image", client.table(table)
+        .select(FULL_IMAGE_COLUMNS[table])
+        .eq("id", product_id), idempotent=True)
+    if not rows.data: return None
+
+    row = rows.data[0]
+    img_str = row.get("image_base64") or (row.get("metadata") or {}).get("image_base64")
+    if img_str:
+        _full_image_cache.set((table, product_id), img_str)
+    return img_str
+
+
+def image_payload_bytes(products: List[dict], field: str) -> int:
+    """Tổng số byte ảnh base64 (theo field) mà một danh sách card sẽ gửi xuống trình duyệt."""
+    total = 0
+    for p in products:
+        value = p.get(field) or (p.get("metadata") or {}).get(field)
+        total += len(value) if value else 0
+    return total
+
+
+# ==================================================
+# BACKFILL CỘT thumbnail_base64
+# ==================================================
+
+def backfill_thumbnails(client, table: str, page_size: int = 200) -> int:
+    """
+    Ghi thumbnail vào cột thumbnail_base64 cho các dòng chưa có.
+    Cần tạo cột trước: ALTER TABLE <table> ADD COLUMN thumbnail_base64 text;
+    """
+    updated = 0
+    while True:
+        page = client.table(table) \
+            .select(f"id, {FULL_IMAGE_COLUMNS[table]}") \
+            .is_(THUMBNAIL_FIELD, "null") \
+            .limit(page_size) \
+            .execute()
+        if not page.data: break
+
+        for row in page.data:
+            img_str = row.get("image_base64") or (row.get("metadata") or {}).get("image_base64")
+            # Ảnh lỗi vẫn ghi chuỗi rỗng để không bị chọn lại ở trang sau
+            thumb = make_thumbnail_base64(img_str) if img_str else None
+            client.table(table).update({THUMBNAIL_FIELD: thumb or ""}).eq("id", row["id"]).execute()
+            updated += 1
+        print(f"⏳ {table}: đã tạo {updated} thumbnail...")
+    print(f"✅ {table}: xong {updated} thumbnail")
+    return updated
+
+
+if __name__ == "__main__":
+    from app.utils import get_db
+
+    if len(sys.argv) < 3 or sys.argv[1] != "backfill" or sys.argv[2] not in FULL_IMAGE_COLUMNS:
+        print("Cách dùng: python -m app.thumbnails backfill fashion_clip_index|books_index")
+        sys.exit(1)
+    backfill_thumbnails(get_db(), sys.argv[2])
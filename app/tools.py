@@ -1,154 +1,288 @@
 import functools
+import threading
+import time
 from typing import TypedDict, List, Optional, Any
 from langchain_community.chat_models import ChatOllama
-from app.utils import get_supabase_client, create_clip_embedding
+from app.utils import (
+    get_db, get_query_embedding, get_fashion_index, get_io_executor, get_interaction_graph,
+    run_query
+)
+from app.startup import run_once
+from app.config import (
+    FASHION_INDEX_MAX_AGE, FASHION_INDEX_NPROBE, FEEDBACK_MAX_PENDING, FEEDBACK_FLUSH_INTERVAL,
+    FEEDBACK_MAX_RETRIES, FEEDBACK_MAX_BACKOFF, PRODUCT_CACHE_SIZE, TRENDING_CAPACITY, TRENDING_REFRESH, FASHION_PAGE_SIZE, BOOK_PAGE_SIZE,
+    SEARCH_FASHION_CANDIDATES, SEARCH_BOOK_CANDIDATES, SEARCH_MAX_CANDIDATES
+)
+from app.feedback_buffer import FeedbackBuffer
+from app.cache import LRUCache
+from app.metrics import metrics
+from app.product_cache import get_products
+from app.thumbnails import attach_thumbnail, get_full_image
+from app.trending import TrendingIndex
+from app.vector_index import detect_fallback_category, has_category, parse_embedding
 from langchain_google_genai import ChatGoogleGenerativeAI
 # --- ĐỊNH NGHĨA STATE ---
 class AgentState(TypedDict):
     question: str           
     image_bytes: Optional[bytes] 
+    image: Optional[Any] # PreparedImage: ảnh tải lên đã giải mã + thu nhỏ ở worker pool
     question_en: Optional[str]
     category_intent: Optional[str]
     user_lang: Optional[str] # <-- THÊM DÒNG NÀY
+    query_vector: Optional[List[float]] # Embedding ảnh tính song song với bước hiểu ý định
     recommendations: Optional[List[dict]] 
     answer_en: Optional[str]     
     answer_vi: Optional[str]   
+    search_cursor: Optional[Any] # SearchCursor: để lấy trang kết quả tiếp theo không cần tìm lại
+
+# id -> 'book' / 'fashion' (loại sản phẩm không đổi nên không cần TTL)
+product_type_cache = LRUCache(maxsize=PRODUCT_CACHE_SIZE, name="product_type")
 
 # ==================================================
 # NHÓM TOOL CƠ BẢN
 # ==================================================
 
-def search_fashion_tool(state: AgentState, top_k: int = 10) -> List[dict]:
-    print("--- TOOL: Tìm kiếm (Có lọc Category) ---")
-    client = get_supabase_client()
-    
-    query_text = state.get("question_en", "").lower()
-    
-    detected_category = None
-    if "dress" in query_text: detected_category = "Dress"
-    elif "shirt" in query_text: detected_category = "Shirt"
-    elif "shoe" in query_text: detected_category = "Shoe"
-    elif "watch" in query_text: detected_category = "Watch"
-    
-    vector = None
+def query_vector_for(state: AgentState):
+    """Vector truy vấn: dùng vector đã tính sẵn trong state nếu có, không thì embed ảnh / câu hỏi."""
+    if state.get("query_vector"):
+        return state["query_vector"]
+    if state.get("image") is not None:
+        return get_query_embedding(image=state["image"])
     if state.get("image_bytes"):
-        vector = create_clip_embedding(image_data=state["image_bytes"])
-    elif state.get("question_en"):
-        vector = create_clip_embedding(text=state["question_en"])
-    
-    if not vector: return []
+        return get_query_embedding(image_data=state["image_bytes"])
+    if state.get("question_en"):
+        return get_query_embedding(text=state["question_en"])
+    return None
+
+def get_usable_fashion_index():
+    """Chỉ mục vector cục bộ nếu đã build và chưa quá cũ, ngược lại None."""
+    index = get_fashion_index()
+    if index is not None and not index.is_stale(FASHION_INDEX_MAX_AGE):
+        return index
+    return None
+
+def match_fashion_vectors(client, vector, match_threshold: float, match_count: int) -> List[dict]:
+    """
+    Tìm vector gần nhất trong fashion_clip_index.
+    Ưu tiên chỉ mục cục bộ; chỉ gọi RPC match_fashion_clip khi chưa có chỉ mục hoặc chỉ mục đã cũ.
+    """
+    index = get_usable_fashion_index()
+    if index is not None:
+        return index.search(vector, match_threshold, match_count, nprobe=FASHION_INDEX_NPROBE)
+
+    response = run_query("rpc.match_fashion_clip", client.rpc(
+        "match_fashion_clip",
+        {
+            "query_embedding": vector,
+            "match_threshold": match_threshold,
+            "match_count": match_count
+        }
+    ), idempotent=True)
+    return response.data
+
+def rank_fashion_candidates(client, vector, query_text: str, count: int):
+    """
+    Ứng viên thời trang đã xếp hạng [{'id', 'similarity'}] + category cần lọc sau (hoặc None).
+    Có chỉ mục: lọc category ngay khi sinh ứng viên. Không có: lấy dư từ RPC rồi lọc sau.
+    """
+    index = get_usable_fashion_index()
+    if index is not None:
+        detected_category = index.detect_category(query_text)
+        matches = index.search(vector, match_threshold=0.2, match_count=count,
+                               nprobe=FASHION_INDEX_NPROBE, category=detected_category)
+        return matches, None
+
+    post_filter = detect_fallback_category(query_text)
+    return match_fashion_vectors(client, vector, match_threshold=0.2, match_count=count), post_filter
 
+def match_book_rows(client, vector, count: int) -> List[dict]:
+    """RPC match_books trả luôn dòng đầy đủ; thay ảnh gốc bằng thumbnail trước khi giữ lại."""
+    response = run_query("rpc.match_books", client.rpc(
+        "match_books",
+        {
+            "query_embedding": vector,
+            "match_threshold": 0.2,
+            "match_count": count
+        }
+    ), idempotent=True)
+    return [attach_thumbnail(item) for item in response.data]
+
+class SearchCursor:
+    """
+    Con trỏ phân trang của 1 lượt tìm kiếm (giữ trong session): embedding truy vấn + danh sách
+    ứng viên đã xếp hạng. Trang sau lấy tiếp từ danh sách này, không chạy lại LLM / embedding /
+    vector search; chỉ khi dùng hết ứng viên mới hỏi lại nguồn với số lượng gấp đôi.
+    """
+    def __init__(self, kind: str, vector, query_text: str, page_size: int):
+        self.kind = kind  # 'fashion' | 'book'
+        self.vector = vector
+        self.query_text = query_text
+        self.page_size = page_size
+        self.fetch_count = SEARCH_FASHION_CANDIDATES if kind == "fashion" else SEARCH_BOOK_CANDIDATES
+        self.candidates: List[dict] = []  # thời trang: {'id', 'similarity'}; sách: dòng đầy đủ
+        self.position = 0  # số ứng viên đã xét (kể cả bị lọc)
+        self.exhausted = False
+        self.post_filter = None
+        self._lock = threading.Lock()  # 2 lần bấm "Xem thêm" liên tiếp không lấy trùng trang
+
+    @property
+    def has_more(self) -> bool:
+        return self.position < len(self.candidates) or not self.exhausted
+
+    def _refill(self, client) -> bool:
+        """Lấy thêm ứng viên từ nguồn; False nếu không còn ứng viên mới."""
+        if self.exhausted: return False
+        if self.candidates:
+            self.fetch_count = min(self.fetch_count * 2, SEARCH_MAX_CANDIDATES)
+        count = self.fetch_count
+        if self.kind == "book":
+            matches = match_book_rows(client, self.vector, count)
+        else:
+            matches, self.post_filter = rank_fashion_candidates(client, self.vector, self.query_text, count)
+
+        known = {c['id'] for c in self.candidates}
+        fresh = [m for m in matches if m['id'] not in known]
+        self.candidates.extend(fresh)
+        if len(matches) < count or count >= SEARCH_MAX_CANDIDATES or not fresh:
+            self.exhausted = True
+        return bool(fresh)
+
+    def _accept(self, item: dict, details: dict) -> Optional[dict]:
+        """Bản ghi hiển thị cho 1 ứng viên (None nếu không còn tồn tại / bị lọc category)."""
+        if self.kind == "book":
+            product = dict(item, type='book', reason=f"Phù hợp nội dung ({int(item['similarity']*100)}%)")
+            product_type_cache.set(product['id'], 'book')
+            return product
+
+        product = details.get(item['id'])
+        if product is None: return None
+        if self.post_filter and not has_category(product, self.post_filter):
+            return None
+        product['reason'] = f"Độ giống: {int(item['similarity']*100)}%"
+        product_type_cache.set(product['id'], 'fashion')
+        return product
+
+    def next_page(self, client) -> List[dict]:
+        with self._lock:
+            results = []
+            while len(results) < self.page_size:
+                if self.position >= len(self.candidates) and not self._refill(client):
+                    break
+                # Lấy chi tiết theo lô (có lọc category nên lấy dư); ứng viên chưa xét vẫn để lại cho trang sau
+                batch = self.candidates[self.position:self.position + 2 * self.page_size]
+                details = {}
+                if self.kind == "fashion":
+                    details = {d['id']: d for d in get_products(client, "fashion_clip_index", [c['id'] for c in batch])}
+                for item in batch:
+                    self.position += 1
+                    product = self._accept(item, details)
+                    if product is not None:
+                        results.append(product)
+                        if len(results) >= self.page_size: break
+            return results
+
+def new_search_cursor(state: AgentState, kind: str, page_size: int) -> Optional[SearchCursor]:
+    vector = query_vector_for(state)
+    if not vector: return None
+    return SearchCursor(kind, vector, state.get("question_en", "").lower(), page_size)
+
+def next_search_page(cursor: Optional[SearchCursor]) -> List[dict]:
+    """Trang kế tiếp của con trỏ tìm kiếm (rỗng nếu đã hết hoặc lỗi)."""
+    if cursor is None: return []
     try:
-        response = client.rpc(
-            "match_fashion_clip",
-            {
-                "query_embedding": vector,
-                "match_threshold": 0.2,
-                "match_count": 50 
-            }
-        ).execute()
-        
-        ids = [item['id'] for item in response.data]
-        
-        details = client.table("fashion_clip_index") \
-            .select("id, title, metadata, image_base64") \
-            .in_("id", ids) \
-            .execute()
-            
-        results = []
-        detail_map = {d['id']: d for d in details.data}
-        
-        for item in response.data:
-            if item['id'] in detail_map:
-                full_item = detail_map[item['id']]
-                
-                if detected_category:
-                    prod_cats = str(full_item.get('metadata', {}).get('categories', '')).lower()
-                    title = full_item['title'].lower()
-                    if detected_category.lower() not in prod_cats and detected_category.lower() not in title:
-                        continue 
-
-                full_item['reason'] = f"Độ giống: {int(item['similarity']*100)}%"
-                results.append(full_item)
-                if len(results) >= top_k: break
-            
-        return results
+        return cursor.next_page(get_db())
     except Exception as e:
-        print(f"Lỗi: {e}")
+        print(f"Lỗi tìm kiếm ({cursor.kind}): {e}")
         return []
 
+def search_fashion_tool(state: AgentState, top_k: int = FASHION_PAGE_SIZE) -> List[dict]:
+    print("--- TOOL: Tìm kiếm (Có lọc Category) ---")
+    return next_search_page(new_search_cursor(state, "fashion", top_k))
+
 # --- TOOL GỢI Ý MUA KÈM (ĐÃ SỬA: Thêm tham số product_type) ---
+def fetch_interactions(client, product_id: str, limit: int) -> List[dict]:
+    """
+    Các cạnh (item_b, score) mạnh nhất đi ra từ product_id trong bảng Graph.
+    Đọc từ graph CSR trong RAM nếu đã nạp, không thì truy vấn product_interactions.
+    """
+    graph = get_interaction_graph()
+    if graph is not None:
+        return [{"item_b": item_b, "score": score} for item_b, score in graph.top_neighbors(product_id, limit)]
+
+    interactions = run_query("product_interactions.neighbors", client.table("product_interactions")
+        .select("item_b, score")
+        .eq("item_a", product_id)
+        .order("score", desc=True)
+        .limit(limit), idempotent=True)
+    return interactions.data
+
+def related_products(client, related_ids: List[str], product_type: str = 'fashion') -> List[dict]:
+    """Chi tiết (qua cache sản phẩm) cho các ID lấy từ Graph, giữ thứ tự theo score."""
+    # Chọn bảng dữ liệu dựa trên loại sản phẩm
+    if product_type == 'book':
+        table_name = "books_index"
+        reason_text = "Thường mua kèm (Sách)"
+    else:
+        table_name = "fashion_clip_index"
+        reason_text = "Phối đồ (Outfit)"
+
+    results = []
+    for item in get_products(client, table_name, related_ids):
+        item['reason'] = reason_text
+        item['type'] = product_type
+        results.append(item)
+    return results
+
+def fetch_outfit(product_id: str, top_k: int = 4, product_type: str = 'fashion') -> List[dict]:
+    """Như recommend_outfit_tool nhưng để lỗi nổi lên (bên prefetch cần phân biệt lỗi với kết quả rỗng)."""
+    client = get_db()
+    # 1. Tìm ID liên quan trong bảng Graph (Dùng chung)
+    interactions = fetch_interactions(client, product_id, top_k)
+    if not interactions: return []
+
+    related_ids = [row['item_b'] for row in interactions]
+
+    # 2. Lấy thông tin chi tiết (qua cache sản phẩm)
+    return related_products(client, related_ids, product_type)
+
 def recommend_outfit_tool(product_id: str, top_k: int = 4, product_type: str = 'fashion') -> List[dict]:
     """
     Gợi ý sản phẩm liên quan từ Graph.
     - product_type='fashion': Gợi ý phối đồ.
     - product_type='book': Gợi ý sách đọc kèm.
     """
-    client = get_supabase_client()
     try:
-        # 1. Tìm ID liên quan trong bảng Graph (Dùng chung)
-        interactions = client.table("product_interactions") \
-            .select("item_b, score") \
-            .eq("item_a", product_id) \
-            .order("score", desc=True) \
-            .limit(top_k) \
-            .execute()
-            
-        if not interactions.data: return []
-            
-        related_ids = [row['item_b'] for row in interactions.data]
-        
-        # 2. Chọn bảng dữ liệu dựa trên loại sản phẩm
-        if product_type == 'book':
-            table_name = "books_index"
-            reason_text = "Thường mua kèm (Sách)"
-        else:
-            table_name = "fashion_clip_index"
-            reason_text = "Phối đồ (Outfit)"
-
-        # 3. Lấy thông tin chi tiết
-        products = client.table(table_name) \
-            .select("*") \
-            .in_("id", related_ids) \
-            .execute()
-            
-        results = []
-        for item in products.data:
-            item['reason'] = reason_text
-            item['type'] = product_type
-            results.append(item)
-            
-        return results
+        return fetch_outfit(product_id, top_k, product_type)
     except Exception as e:
         print(f"Lỗi gợi ý Graph: {e}")
         return []
 
+def get_product_full_image(product_id: str, product_type: str = 'fashion') -> Optional[str]:
+    """Ảnh gốc cho trang chi tiết (card chỉ dùng thumbnail)."""
+    table_name = "books_index" if product_type == 'book' else "fashion_clip_index"
+    try:
+        return get_full_image(get_db(), table_name, product_id)
+    except Exception as e:
+        print(f"Lỗi tải ảnh gốc: {e}")
+        return None
+
 def get_similar_products_by_id(product_id: str, top_k: int = 20) -> List[dict]:
-    client = get_supabase_client()
+    client = get_db()
     try:
-        source = client.table("fashion_clip_index").select("embedding").eq("id", product_id).execute()
-        if not source.data: return []
+        index = get_fashion_index()
+        vector = index.get_vector(product_id) if index is not None else None
+        if vector is None:
+            source = run_query("fashion_clip_index.embedding",
+                               client.table("fashion_clip_index").select("embedding").eq("id", product_id), idempotent=True)
+            if not source.data: return []
+            vector = parse_embedding(source.data[0]['embedding'])
         
-        vector = source.data[0]['embedding']
-        
-        response = client.rpc(
-            "match_fashion_clip",
-            {
-                "query_embedding": vector,
-                "match_threshold": 0.4,
-                "match_count": top_k + 1
-            }
-        ).execute()
-
-        ids = [item['id'] for item in response.data if item['id'] != product_id][:top_k]
+        matches = match_fashion_vectors(client, vector, match_threshold=0.4, match_count=top_k + 1)
+
+        ids = [item['id'] for item in matches if item['id'] != product_id][:top_k]
         if not ids: return []
         
-        details = client.table("fashion_clip_index") \
-            .select("id, title, metadata, image_base64") \
-            .in_("id", ids) \
-            .execute()
-            
-        return details.data
+        return get_products(client, "fashion_clip_index", ids)
     except Exception as e:
         return []
 
@@ -158,41 +292,75 @@ def get_similar_products_by_id(product_id: str, top_k: int = 20) -> List[dict]:
 
 # Sửa lại hàm này trong app/tools.py
 
+def resolve_product_type(client, product_id: str) -> str:
+    """'book' nếu id nằm trong books_index, ngược lại 'fashion'. Kết quả được cache (loại SP không đổi)."""
+    product_type = product_type_cache.get(product_id)
+    if product_type is None:
+        check_book = run_query("books_index.exists", client.table("books_index").select("id").eq("id", product_id), idempotent=True)
+        product_type = 'book' if check_book.data else 'fashion'
+        product_type_cache.set(product_id, product_type)
+    return product_type
+
+def resolve_product_types(client, product_ids: List[str]) -> dict:
+    """Bản theo lô của resolve_product_type: 1 truy vấn books_index cho mọi id chưa có trong cache."""
+    result, unknown = {}, []
+    for pid in product_ids:
+        product_type = product_type_cache.get(pid)
+        if product_type is None: unknown.append(pid)
+        else: result[pid] = product_type
+
+    if unknown:
+        books = run_query("books_index.exists", client.table("books_index").select("id").in_("id", unknown), idempotent=True)
+        book_ids = {row['id'] for row in books.data}
+        for pid in unknown:
+            result[pid] = 'book' if pid in book_ids else 'fashion'
+            product_type_cache.set(pid, result[pid])
+    return result
+
 def switching_hybrid_tool(product_id: str, top_k: int = 4) -> List[dict]:
+    """
+    Gợi ý "có thể bạn cũng thích" cho trang chi tiết.
+    Loại sản phẩm, ứng viên Graph và ứng viên Vector được lấy song song;
+    khi cả hai trả về mới quyết định chiến lược, nên panel chỉ tốn ~1 round trip.
+    """
     print(f"--- TOOL: Switching Hybrid cho {product_id} ---")
-    client = get_supabase_client()
-    
-    # --- BƯỚC 0: Xác định loại sản phẩm (Book hay Fashion) ---
-    # Cách đơn giản: Thử tìm trong bảng books trước
-    is_book = False
-    check_book = client.table("books_index").select("id").eq("id", product_id).execute()
-    if check_book.data: is_book = True
-    
-    target_type = 'book' if is_book else 'fashion'
-
-    # 1. Kiểm tra Graph
-    check = client.table("product_interactions") \
-        .select("item_b, score", count="exact") \
-        .eq("item_a", product_id) \
-        .order("score", desc=True) \
-        .execute()
-        
-    interaction_count = check.count if check.count else 0
+    client = get_db()
     THRESHOLD = 2 
+    executor = get_io_executor()
+
+    # --- BƯỚC 0: Chạy song song ---
+    # Không cần count="exact": chỉ lấy đủ số dòng để biết đã vượt ngưỡng hay chưa
+    type_future = executor.submit(resolve_product_type, client, product_id)
+    graph_future = executor.submit(fetch_interactions, client, product_id, max(top_k, THRESHOLD))
+    vector_future = executor.submit(get_similar_products_by_id, product_id, top_k)
+
+    try:
+        target_type = type_future.result()
+    except Exception as e:
+        print(f"Lỗi xác định loại sản phẩm: {e}")
+        target_type = 'fashion'
+    try:
+        interactions = graph_future.result()
+    except Exception as e:
+        print(f"Lỗi gợi ý Graph: {e}")
+        interactions = []
     
     results = []
     
     # CHIẾN LƯỢC 1: GRAPH (Ưu tiên 1)
-    if interaction_count >= THRESHOLD:
-        print(f"👉 Dùng chiến lược GRAPH ({interaction_count} tương tác)")
-        # Gọi hàm recommend cũ, nhớ truyền product_type
-        results = recommend_outfit_tool(product_id, top_k, product_type=target_type)
+    if len(interactions) >= THRESHOLD:
+        print(f"👉 Dùng chiến lược GRAPH (>= {len(interactions)} tương tác)")
+        related_ids = [row['item_b'] for row in interactions[:top_k]]
+        try:
+            results = related_products(client, related_ids, product_type=target_type)
+        except Exception as e:
+            print(f"Lỗi gợi ý Graph: {e}")
         for item in results: item['reason'] = "🔥 Gợi ý theo xu hướng (Hot)"
 
     # CHIẾN LƯỢC 2: VECTOR (Ưu tiên 2 - Cold Start)
     if not results:
         print(f"👉 Dùng chiến lược VECTOR (Cold Start)")
-        results = get_similar_products_by_id(product_id, top_k)
+        results = vector_future.result()
         for item in results: item['reason'] = "✨ Gợi ý theo kiểu dáng (Visual)"
 
     # CHIẾN LƯỢC 3: TRENDING (Ưu tiên 3 - Fallback cuối cùng)
@@ -202,38 +370,9 @@ def switching_hybrid_tool(product_id: str, top_k: int = 4) -> List[dict]:
     
     return results[:top_k]
 
-def search_books_tool(state: AgentState, top_k: int = 5) -> List[dict]:
+def search_books_tool(state: AgentState, top_k: int = BOOK_PAGE_SIZE) -> List[dict]:
     print("--- TOOL: Tìm kiếm SÁCH ---")
-    client = get_supabase_client()
-    
-    vector = None
-    if state.get("image_bytes"):
-        vector = create_clip_embedding(image_data=state["image_bytes"])
-    elif state.get("question_en"):
-        vector = create_clip_embedding(text=state["question_en"])
-    
-    if not vector: return []
-
-    try:
-        response = client.rpc(
-            "match_books",
-            {
-                "query_embedding": vector,
-                "match_threshold": 0.2,
-                "match_count": top_k
-            }
-        ).execute()
-        
-        results = []
-        for item in response.data:
-            item['type'] = 'book'
-            item['reason'] = f"Phù hợp nội dung ({int(item['similarity']*100)}%)"
-            results.append(item)
-            
-        return results
-    except Exception as e:
-        print(f"Lỗi tìm sách: {e}")
-        return []
+    return next_search_page(new_search_cursor(state, "book", top_k))
 
 def generate_stylist_answer(state: AgentState):
     # llm = ChatOllama(model="llama3", temperature=0.7)
@@ -252,60 +391,145 @@ def generate_stylist_answer(state: AgentState):
     Write a short, friendly, and persuasive response in English.
     About description and price in data
     """
-    return llm.invoke(prompt).content
+    with metrics.span("llm_request", purpose="stylist"):
+        return llm.invoke(prompt).content
+
+def _write_feedback_batch(batch: dict) -> dict:
+    """
+    Ghi 1 lô feedback đã gộp bằng 1 RPC increment_interaction_scores (1 round trip, 1 transaction:
+    cả lô cùng thành công hoặc cùng lỗi); trả về các cặp lỗi để bộ đệm thử lại.
+    """
+    items = [{"item_a": item_a, "item_b": item_b, "increment": weight} for (item_a, item_b), weight in batch.items()]
+    try:
+        run_query("rpc.increment_interaction_scores",
+                  get_db().rpc("increment_interaction_scores", {"p_items": items}))
+    except Exception as e:
+        print(f"❌ Lỗi Feedback Loop ({len(batch)} cặp): {e}")
+        return dict(batch)
+    print(f"✅ Feedback: đã ghi {len(batch)} cặp")
+    return {}
+
+def _apply_feedback_to_graph(item_a: str, item_b: str, weight: int):
+    """Giữ graph trong RAM khớp với các lượt cộng điểm chưa kịp ghi xuống Supabase."""
+    graph = get_interaction_graph()
+    if graph is not None:
+        graph.apply_increment(item_a, item_b, weight)
+
+def _apply_feedback_to_trending(item_a: str, item_b: str, weight: int):
+    get_trending_index().apply_delta(item_b, weight)
+
+@run_once
+def get_feedback_buffer() -> FeedbackBuffer:
+    buffer = FeedbackBuffer(_write_feedback_batch, max_pending=FEEDBACK_MAX_PENDING,
+                            flush_interval=FEEDBACK_FLUSH_INTERVAL, max_retries=FEEDBACK_MAX_RETRIES,
+                            max_backoff=FEEDBACK_MAX_BACKOFF)
+    buffer.add_listener(_apply_feedback_to_graph)
+    buffer.add_listener(_apply_feedback_to_trending)
+    return buffer
+
+# Click được đưa vào bộ đệm + graph + trending trong cùng 1 lock (xem _trending_totals)
+_feedback_lock = threading.Lock()
 
 def feedback_loop_tool(current_item_id: str, clicked_item_id: str, weight: int = 1):
-    client = get_supabase_client()
+    """Ghi nhận click vào bộ đệm (không chờ Supabase); thread nền sẽ ghi theo lô."""
     try:
-        client.rpc("increment_interaction_score", {
-            "p_item_a": current_item_id,
-            "p_item_b": clicked_item_id,
-            "p_increment": weight
-        }).execute()
-        print(f"✅ Feedback: {current_item_id} -> {clicked_item_id} (+{weight})")
+        buffer = get_feedback_buffer()
+        with _feedback_lock:
+            buffer.add(current_item_id, clicked_item_id, weight)
         return True
     except Exception as e:
         print(f"❌ Lỗi Feedback Loop: {e}")
         return False
 
-# Thêm vào app/tools.py
+# ==================================================
+# TRENDING (duy trì sẵn theo loại sản phẩm)
+# ==================================================
+
+def _trending_totals(index: TrendingIndex, client) -> dict:
+    """
+    Tổng score theo item_b cho 1 lượt rebuild trending. Mở cửa sổ delta (begin_rebuild) cùng lúc
+    chụp snapshot, dưới _feedback_lock, nên mỗi click nằm đúng 1 phía (snapshot hoặc delta):
+    - có graph trong RAM: graph đã gồm mọi click đã áp (kể cả chưa ghi xuống DB);
+    - không có: đọc bảng trong lúc tạm dừng flush (không lô nào commit giữa chừng), rồi cộng thêm
+      các cặp còn nằm trong bộ đệm lúc mở cửa sổ.
+    """
+    graph = get_interaction_graph()
+    if graph is not None:
+        with _feedback_lock:
+            index.begin_rebuild()
+            return graph.item_scores()
+
+    buffer = get_feedback_buffer()
+    with buffer.paused():
+        with _feedback_lock:
+            index.begin_rebuild()
+            unwritten = buffer.pending_items()
+        totals = _scan_item_scores(client)
+    for (_, item_b), weight in unwritten.items():
+        totals[item_b] = totals.get(item_b, 0.0) + weight
+    return totals
+
+def _scan_item_scores(client, page_size: int = 1000) -> dict:
+    """Tổng score theo item_b, đọc bảng product_interactions theo trang."""
+    totals, start = {}, 0
+    while True:
+        page = run_query("product_interactions.scan", client.table("product_interactions")
+            .select("item_b, score")
+            .order("item_a")
+            .order("item_b")
+            .range(start, start + page_size - 1), idempotent=True)
+        if not page.data: break
+        for row in page.data:
+            totals[row['item_b']] = totals.get(row['item_b'], 0.0) + float(row['score'])
+        start += page_size
+    return totals
+
+def _refresh_trending_loop(index: TrendingIndex):
+    client = get_db()
+    classify = lambda ids: resolve_product_types(client, ids)
+    while True:
+        try:
+            index.rebuild(_trending_totals(index, client), classify)
+        except Exception as e:
+            print(f"Lỗi cập nhật Trending: {e}")
+        # Giữa 2 lần rebuild, phân loại dần các item mới xuất hiện qua feedback
+        deadline = time.monotonic() + TRENDING_REFRESH
+        while time.monotonic() < deadline:
+            time.sleep(min(5.0, TRENDING_REFRESH))
+            try:
+                index.classify_pending(classify)
+            except Exception as e:
+                print(f"Lỗi cập nhật Trending: {e}")
+
+@run_once
+def get_trending_index() -> TrendingIndex:
+    """TrendingIndex của process; lần gọi đầu khởi động thread tính lại định kỳ."""
+    index = TrendingIndex(capacity=TRENDING_CAPACITY)
+    threading.Thread(target=_refresh_trending_loop, args=(index,), name="trending-refresh", daemon=True).start()
+    return index
 
 def get_trending_products_tool(top_k: int = 4, product_type: str = 'fashion') -> List[dict]:
     """
-    Fallback: Lấy sản phẩm có điểm tương tác (score) cao nhất trong kho.
+    Fallback: Lấy sản phẩm có điểm tương tác (score) cao nhất trong kho, đúng loại sản phẩm.
     Dùng khi không tìm thấy gợi ý nào khác.
     """
-    client = get_supabase_client()
+    client = get_db()
     try:
-        # 1. Lấy danh sách ID có score cao nhất từ bảng Graph
-        # (Lấy item_b vì đây là đích đến của việc mua sắm)
-        trending = client.table("product_interactions") \
-            .select("item_b, score") \
-            .order("score", desc=True) \
-            .limit(20) \
-            .execute() # Lấy dư ra để lọc trùng
-            
-        if not trending.data: return []
-        
-        # Lọc trùng ID (vì 1 sản phẩm hot có thể xuất hiện nhiều lần)
-        seen = set()
-        unique_ids = []
-        for item in trending.data:
-            if item['item_b'] not in seen:
-                unique_ids.append(item['item_b'])
-                seen.add(item['item_b'])
-            if len(unique_ids) >= top_k: break
+        index = get_trending_index()
+        if index.ready:
+            # Lấy dư một chút phòng khi có id đã bị xoá khỏi bảng sản phẩm
+            unique_ids = index.top(product_type, top_k * 2)
+        else:
+            unique_ids = _trending_ids_from_query(client, top_k)
+        if not unique_ids: return []
             
         # 2. Lấy thông tin chi tiết
         table_name = "books_index" if product_type == 'book' else "fashion_clip_index"
         
-        products = client.table(table_name) \
-            .select("*") \
-            .in_("id", unique_ids) \
-            .execute()
+        products = get_products(client, table_name, unique_ids)
             
         results = []
-        for item in products.data:
+        for item in products[:top_k]:
             item['reason'] = "🔥 Xu hướng (Được mua nhiều nhất)"
             item['type'] = product_type
             results.append(item)
@@ -313,4 +537,23 @@ def get_trending_products_tool(top_k: int = 4, product_type: str = 'fashion') ->
         return results
     except Exception as e:
         print(f"Lỗi Trending Tool: {e}")
-        return []
\ No newline at end of file
+        return []
+
+def _trending_ids_from_query(client, top_k: int) -> List[str]:
+    """Đường cũ, chỉ dùng khi TrendingIndex chưa tính xong lần đầu."""
+    # 1. Lấy danh sách ID có score cao nhất từ bảng Graph
+    # (Lấy item_b vì đây là đích đến của việc mua sắm)
+    trending = run_query("product_interactions.top", client.table("product_interactions")
+        .select("item_b, score")
+        .order("score", desc=True)
+        .limit(20), idempotent=True) # Lấy dư ra để lọc trùng
+        
+    # Lọc trùng ID (vì 1 sản phẩm hot có thể xuất hiện nhiều lần)
+    seen = set()
+    unique_ids = []
+    for item in trending.data:
+        if item['item_b'] not in seen:
+            unique_ids.append(item['item_b'])
+            seen.add(item['item_b'])
+        if len(unique_ids) >= top_k: break
+    return unique_ids
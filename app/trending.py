@@ -0,0 +1,118 @@
+"""
+Trending theo loại sản phẩm (book / fashion), duy trì sẵn trong RAM.
+
+- Tổng score theo item (cộng dồn mọi cạnh đi vào item_b) được tính lại định kỳ.
+- Mỗi loại giữ top-`capacity` item; feedback mới cộng thẳng vào tổng và cập nhật top
+  ngay (score chỉ tăng nên item ngoài top chỉ có thể chen vào, không cần sắp lại cả kho).
+- Phục vụ fallback bằng một lát cắt danh sách đã sắp sẵn.
+"""
+import threading
+from typing import Callable, Dict, List
+
+PRODUCT_TYPES = ("fashion", "book")
+
+
+class TrendingIndex:
+    def __init__(self, capacity: int = 50, max_classify: int = 5000, classify_chunk: int = 200):
+        """
+        capacity: số item giữ cho mỗi loại.
+        max_classify: số item hot nhất tối đa được phân loại khi rebuild.
+        """
+        self.capacity = capacity
+        self.max_classify = max_classify
+        self.classify_chunk = classify_chunk
+        self.ready = False
+        self._totals: Dict[str, float] = {}
+        self._types: Dict[str, str] = {}
+        self._top: Dict[str, Dict[str, float]] = {t: {} for t in PRODUCT_TYPES}
+        self._sorted: Dict[str, List[str]] = {t: [] for t in PRODUCT_TYPES}
+        self._unclassified = set()
+        # Delta nhận được từ lúc bắt đầu đọc snapshot tới lúc rebuild xong (None = không rebuild)
+        self._deltas_during_rebuild = None
+        self._lock = threading.Lock()
+
+    def begin_rebuild(self):
+        """Gọi trước khi đọc snapshot totals: feedback tới sau đó được cộng bù vào bản rebuild."""
+        with self._lock:
+            self._deltas_during_rebuild = {}
+
+    def rebuild(self, totals: Dict[str, float], classify: Callable[[List[str]], Dict[str, str]]):
+        """
+        totals: {item_id: tổng score}. classify(ids) -> {item_id: 'book'/'fashion'}.
+        Chỉ phân loại theo thứ tự score giảm dần cho tới khi mọi loại đủ `capacity`.
+        Delta tới trong lúc rebuild (từ begin_rebuild, hoặc từ đầu hàm nếu chưa gọi) không bị mất.
+        """
+        if self._deltas_during_rebuild is None:
+            self.begin_rebuild()
+        ranked = sorted(totals, key=totals.get, reverse=True)[:self.max_classify]
+        types = {}
+        top = {t: {} for t in PRODUCT_TYPES}
+        for start in range(0, len(ranked), self.classify_chunk):
+            chunk = ranked[start:start + self.classify_chunk]
+            unknown = [pid for pid in chunk if pid not in self._types]
+            types.update({pid: self._types[pid] for pid in chunk if pid in self._types})
+            if unknown:
+                types.update(classify(unknown))
+            for pid in chunk:
+                bucket = top.setdefault(types.get(pid, "fashion"), {})
+                if len(bucket) < self.capacity:
+                    bucket[pid] = totals[pid]
+            if all(len(top[t]) >= self.capacity for t in PRODUCT_TYPES):
+                break
+
+        with self._lock:
+            carried, self._deltas_during_rebuild = self._deltas_during_rebuild, None
+            new_totals = dict(totals)
+            for pid, weight in carried.items():
+                new_totals[pid] = new_totals.get(pid, 0.0) + weight
+            self._totals = new_totals
+            self._types.update(types)
+            self._top = top
+            self._sorted = {t: self._rank(bucket) for t, bucket in top.items()}
+            for pid in carried:
+                if pid in self._types:
+                    self._offer(self._types[pid], pid)
+            self._unclassified = {pid for pid in self._unclassified | set(carried) if pid not in self._types}
+            self.ready = True
+
+    @staticmethod
+    def _rank(bucket: Dict[str, float]) -> List[str]:
+        return sorted(bucket, key=bucket.get, reverse=True)
+
+    def _offer(self, product_type: str, item_id: str):
+        bucket = self._top.setdefault(product_type, {})
+        score = self._totals.get(item_id, 0.0)
+        if item_id in bucket or len(bucket) < self.capacity:
+            bucket[item_id] = score
+        else:
+            weakest = min(bucket, key=bucket.get)
+            if score <= bucket[weakest]: return
+            del bucket[weakest]
+            bucket[item_id] = score
+        self._sorted[product_type] = self._rank(bucket)
+
+    def apply_delta(self, item_id: str, weight: float):
+        """Cộng score cho item_b của một feedback mới và cập nhật top của loại tương ứng."""
+        with self._lock:
+            self._totals[item_id] = self._totals.get(item_id, 0.0) + weight
+            if self._deltas_during_rebuild is not None:
+                self._deltas_during_rebuild[item_id] = self._deltas_during_rebuild.get(item_id, 0.0) + weight
+            product_type = self._types.get(item_id)
+            if product_type is None:
+                self._unclassified.add(item_id)
+            else:
+                self._offer(product_type, item_id)
+
+    def classify_pending(self, classify: Callable[[List[str]], Dict[str, str]]):
+        """Phân loại các item mới xuất hiện qua feedback rồi đưa vào top."""
+        with self._lock:
+            pending, self._unclassified = list(self._unclassified), set()
+        if not pending: return
+        types = classify(pending)
+        with self._lock:
+            self._types.update(types)
+            for pid in pending:
+                self._offer(types.get(pid, "fashion"), pid)
+
+    def top(self, product_type: str, k: int) -> List[str]:
+        return self._sorted.get(product_type, [])[:k]
@@ -3,102 +3,404 @@ import os
 import base64
 import requests
 import numpy as np
-import functools
+import hashlib
+import json
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from PIL import Image
 from io import BytesIO
-import torch
 
 # Supabase & LangChain
 from supabase.client import Client, create_client
-from app.config import SUPABASE_URL, SUPABASE_KEY, EMBEDDING_MODEL_NAME, CLIP_MODEL_NAME
+from app.config import (
+    SUPABASE_URL, SUPABASE_KEY, EMBEDDING_MODEL_NAME, CLIP_MODEL_NAME, FASHION_INDEX_DIR,
+    CLIP_BATCH_WAIT_MS, CLIP_MAX_BATCH, CLIP_TIMEOUT, QUERY_EMBEDDING_CACHE_SIZE, QUERY_EMBEDDING_CACHE_TTL,
+    IO_WORKERS, INTERACTION_GRAPH_ENABLED, INTERACTION_GRAPH_CSV, INTERACTION_GRAPH_REFRESH,
+    STT_BATCH_WAIT_MS, STT_MAX_BATCH, STT_TIMEOUT, VAD_ENABLED, VAD_THRESHOLD_DB, STT_CHUNK_SECONDS,
+    METRICS_PAYLOAD_SAMPLE_RATE, STORAGE_BACKEND, LOCAL_STORE_PATH
+)
+from app.audio import decode_audio, split_chunks, trim_silence
+from app.vector_index import FashionVectorIndex, META_FILE
+from app.batching import MicroBatcher
+from app.cache import LRUCache
+from app.interaction_graph import build_interaction_graph
+from app.startup import run_once, startup_report
+from app.metrics import metrics, SIZE_BUCKETS
+from app.db_client import ContextThreadPoolExecutor, execute, make_supabase_options
 
-# CLIP & Transformers
-from transformers import CLIPProcessor, CLIPModel, pipeline # Thêm pipeline
+# torch / transformers được import lười bên trong các hàm nạp model
+# để import app.* không tốn vài giây trước khi UI kịp hiện ra.
 
 # --- KẾT NỐI SUPABASE ---
-@functools.lru_cache(maxsize=None)
+@run_once
 def get_supabase_client() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=make_supabase_options())
+
+@run_once
+def get_db():
+    """
+    Backend lưu trữ theo STORAGE_BACKEND: client Supabase (mặc định) hoặc LocalStore (SQLite).
+    Cả hai cùng API .table()/.rpc() nên tools gọi như nhau.
+    """
+    if STORAGE_BACKEND == "local":
+        from app.local_store import LocalStore
+        return LocalStore(LOCAL_STORE_PATH)
+    if STORAGE_BACKEND != "supabase":
+        raise ValueError(f"STORAGE_BACKEND không hợp lệ: {STORAGE_BACKEND}")
+    return get_supabase_client()
+
+def run_query(endpoint: str, query, idempotent: bool = False):
+    """
+    query.execute() có hạn chót (app.db_client.execute) kèm đo đạc: thời gian (db_request_seconds),
+    số dòng trả về và kích thước payload JSON (chỉ lấy mẫu METRICS_PAYLOAD_SAMPLE_RATE request).
+    endpoint: nhãn ngắn, vd 'fashion_clip_index.details', 'rpc.match_fashion_clip'.
+    idempotent=True (truy vấn đọc): được hedge / thử lại khi lỗi kết nối.
+    """
+    with metrics.span("db_request", endpoint=endpoint):
+        response = execute(endpoint, query, idempotent=idempotent)
+    data = response.data
+    rows = len(data) if isinstance(data, list) else int(data is not None)
+    metrics.observe("db_response_rows", rows, buckets=SIZE_BUCKETS, endpoint=endpoint)
+    if random.random() < METRICS_PAYLOAD_SAMPLE_RATE:
+        payload = len(json.dumps(data, ensure_ascii=False, default=str))
+        metrics.observe("db_response_bytes", payload, buckets=SIZE_BUCKETS, endpoint=endpoint)
+    return response
+
+@run_once
+def get_io_executor() -> ThreadPoolExecutor:
+    """Thread pool dùng chung để chạy song song các truy vấn Supabase độc lập (giữ hạn chót của request)."""
+    return ContextThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
 
 # --- MODEL CLIP ---
-@functools.lru_cache(maxsize=None)
+@run_once
 def get_clip_model():
     print("⏳ Đang tải model CLIP (chỉ 1 lần)...")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(device)
-    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    with startup_report.phase("import torch/transformers"):
+        import torch
+        from transformers import CLIPProcessor, CLIPModel
+    with startup_report.phase("load CLIP"):
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(device)
+        processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
     return model, processor, device
 
-def create_clip_embedding(text: str = None, image_data: bytes = None):
+# --- CHỈ MỤC VECTOR CỤC BỘ (giữ ấm cùng model CLIP) ---
+_fashion_index = None
+_fashion_index_mtime = None
+_fashion_index_lock = threading.Lock()
+
+def get_fashion_index():
+    """
+    Trả về FashionVectorIndex đã nạp (1 lần cho mỗi process), hoặc None nếu chưa build.
+    Khi có bản build mới trên đĩa (meta.json thay đổi) thì tự nạp lại.
+    """
+    global _fashion_index, _fashion_index_mtime
+    meta_path = os.path.join(FASHION_INDEX_DIR, META_FILE)
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        return None
+
+    if mtime != _fashion_index_mtime:
+        with _fashion_index_lock:
+            if mtime != _fashion_index_mtime:
+                try:
+                    print("⏳ Đang nạp chỉ mục vector cục bộ...")
+                    _fashion_index = FashionVectorIndex(FASHION_INDEX_DIR)
+                except Exception as e:
+                    print(f"Lỗi nạp chỉ mục vector: {e}")
+                    _fashion_index = None
+                _fashion_index_mtime = mtime
+    return _fashion_index
+
+def _normalized_features(outputs) -> list:
+    outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
+    return outputs.cpu().numpy().tolist()
+
+def embed_texts(texts: list) -> list:
+    """Embedding CLIP (đã chuẩn hoá L2) cho nhiều câu trong 1 lượt forward."""
+    import torch
+    if not texts: return []
+    model, processor, device = get_clip_model()
+    with metrics.span("model_inference", model="clip", kind="text"):
+        inputs = processor(text=[t[:77] for t in texts], return_tensors="pt", padding=True).to(device)
+        with torch.no_grad():
+            return _normalized_features(model.get_text_features(**inputs))
+
+def embed_images(images: list) -> list:
+    """Embedding CLIP (đã chuẩn hoá L2) cho nhiều ảnh (bytes) trong 1 lượt forward."""
+    import torch
+    if not images: return []
     model, processor, device = get_clip_model()
+    with metrics.span("model_inference", model="clip", kind="image"):
+        pil_images = [Image.open(BytesIO(data)).convert("RGB") for data in images]
+        inputs = processor(images=pil_images, return_tensors="pt").to(device)
+        with torch.no_grad():
+            return _normalized_features(model.get_image_features(**inputs))
+
+def embed_pixel_values(pixel_values: list) -> list:
+    """Embedding CLIP cho các tensor pixel_values đã tiền xử lý sẵn (xem app.image_pipeline)."""
+    import torch
+    if not pixel_values: return []
+    model, _, device = get_clip_model()
+    with metrics.span("model_inference", model="clip", kind="pixels"), torch.no_grad():
+        return _normalized_features(model.get_image_features(pixel_values=torch.stack(pixel_values).to(device)))
+
+def _run_clip_batch(items: list) -> list:
+    """Chạy 1 batch hỗn hợp ('text', str) / ('image', bytes) / ('pixels', tensor), trả kết quả theo đúng thứ tự."""
+    metrics.observe("model_batch_size", len(items), buckets=SIZE_BUCKETS, model="clip")
+    results = [None] * len(items)
+    for kind, embed_fn in (("text", embed_texts), ("image", embed_images), ("pixels", embed_pixel_values)):
+        positions = [i for i, (k, _) in enumerate(items) if k == kind]
+        if not positions: continue
+        payloads = [items[i][1] for i in positions]
+        try:
+            vectors = embed_fn(payloads)
+        except Exception:
+            # Một input lỗi (vd: ảnh hỏng) không được làm hỏng cả batch -> chạy lại từng cái
+            vectors = []
+            for payload in payloads:
+                try:
+                    vectors.append(embed_fn([payload])[0])
+                except Exception as e:
+                    print(f"Lỗi tạo CLIP embedding: {e}")
+                    vectors.append(None)
+        for i, vector in zip(positions, vectors):
+            results[i] = vector
+    return results
+
+@run_once
+def get_clip_batcher() -> MicroBatcher:
+    return MicroBatcher(_run_clip_batch, max_batch_size=CLIP_MAX_BATCH,
+                        max_wait_ms=CLIP_BATCH_WAIT_MS, name="clip-batcher")
+
+# --- GRAPH TƯƠNG TÁC TRONG RAM ---
+_interaction_graph = None
+_interaction_graph_started = False
+_interaction_graph_lock = threading.Lock()
+
+def _load_interaction_graph():
+    """
+    Nạp graph 1 lần; nếu đặt INTERACTION_GRAPH_REFRESH > 0 thì nạp lại toàn bộ bảng sau mỗi
+    khoảng đó (đồng bộ điểm từ các process khác). CSV export chỉ dùng cho lần nạp đầu.
+    """
+    global _interaction_graph
+    while True:
+        try:
+            csv_path = INTERACTION_GRAPH_CSV if _interaction_graph is None else None
+            _interaction_graph = build_interaction_graph(get_db(), csv_path=csv_path)
+            if INTERACTION_GRAPH_REFRESH <= 0: return
+        except Exception as e:
+            print(f"Lỗi nạp graph tương tác: {e}")
+        time.sleep(INTERACTION_GRAPH_REFRESH if INTERACTION_GRAPH_REFRESH > 0 else 60)
+
+def get_interaction_graph():
+    """
+    Graph CSR của product_interactions, nạp nền 1 lần cho mỗi process.
+    Trả về None khi đang nạp / bị tắt -> tool tự truy vấn Supabase như cũ.
+    """
+    global _interaction_graph_started
+    if not INTERACTION_GRAPH_ENABLED: return None
+    if not _interaction_graph_started:
+        with _interaction_graph_lock:
+            if not _interaction_graph_started:
+                _interaction_graph_started = True
+                threading.Thread(target=_load_interaction_graph, name="interaction-graph-loader", daemon=True).start()
+    return _interaction_graph
+
+class EmbeddingTimeout(TimeoutError):
+    pass
+
+def create_clip_embedding(text: str = None, image_data: bytes = None, pixel_values=None):
+    """
+    Embedding cho 1 câu hoặc 1 ảnh; các lời gọi đồng thời được gom batch qua get_clip_batcher().
+    Chờ model nạp xong trước (lần đầu / warm-up nền), CLIP_TIMEOUT chỉ tính phần xếp hàng + forward.
+    Quá hạn thì ném EmbeddingTimeout để UI báo lỗi, thay vì trả None làm kết quả tìm kiếm rỗng âm thầm.
+    """
+    if text:
+        item = ("text", text)
+    elif pixel_values is not None:
+        item = ("pixels", pixel_values)
+    elif image_data:
+        item = ("image", image_data)
+    else:
+        return None
+    try:
+        get_clip_model()
+        future = get_clip_batcher().submit(item)
+    except Exception as e:
+        print(f"Lỗi tạo CLIP embedding: {e!r}")
+        return None
     try:
-        inputs = None
-        if text:
-            text = text[:77] 
-            inputs = processor(text=[text], return_tensors="pt", padding=True).to(device)
-        elif image_data:
-            image = Image.open(BytesIO(image_data)).convert("RGB")
-            inputs = processor(images=image, return_tensors="pt").to(device)
-            
-        if inputs:
-            with torch.no_grad():
-                if text:
-                    outputs = model.get_text_features(**inputs)
-                else:
-                    outputs = model.get_image_features(**inputs)
-                outputs = outputs / outputs.norm(p=2, dim=-1, keepdim=True)
-                return outputs.cpu().numpy()[0].tolist()
+        return future.result(timeout=CLIP_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        metrics.inc("clip_timeouts_total")
+        raise EmbeddingTimeout(f"CLIP không trả embedding sau {CLIP_TIMEOUT:g}s")
     except Exception as e:
-        print(f"Lỗi tạo CLIP embedding: {e}")
+        print(f"Lỗi tạo CLIP embedding: {e!r}")
         return None
-    return None
+
+# --- CACHE EMBEDDING TRUY VẤN (dùng chung cho mọi luồng tìm kiếm) ---
+query_embedding_cache = LRUCache(
+    maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL, name="query_embedding"
+)
+
+def normalize_query_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def get_query_embedding(text: str = None, image_data: bytes = None, image=None):
+    """
+    Giống create_clip_embedding nhưng có cache: text được chuẩn hoá (lowercase, gộp khoảng trắng),
+    ảnh được nhận diện bằng SHA-256 của bytes nên ảnh tải lên lại không bị embed lần nữa.
+    image: PreparedImage (app.image_pipeline) đã giải mã + tiền xử lý sẵn ở worker pool. Pixel của nó
+    đến từ bản giải mã thu nhỏ (Image.draft) nên có khoá riêng, không dùng lẫn với embedding từ bytes gốc.
+    """
+    if image is not None:
+        key = ("image_draft", image.digest)
+    elif image_data:
+        key = ("image", hashlib.sha256(image_data).hexdigest())
+    elif text and text.strip():
+        text = normalize_query_text(text)
+        key = ("text", text)
+    else:
+        return None
+
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        if image is not None:
+            vector = create_clip_embedding(pixel_values=image.pixel_values)
+        elif key[0] == "text":
+            vector = create_clip_embedding(text=text)
+        else:
+            vector = create_clip_embedding(image_data=image_data)
+        if vector is not None:
+            query_embedding_cache.set(key, vector)
+    return vector
 
 # --- XỬ LÝ GIỌNG NÓI (WHISPER AI - MỚI) ---
-@functools.lru_cache(maxsize=None)
+@run_once
 def load_stt_model():
     """Load model Whisper-Tiny (Nhanh, nhẹ, hỗ trợ đa ngôn ngữ bao gồm tiếng Việt)"""
     print("⏳ Đang tải model Whisper...")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    # Sử dụng openai/whisper-tiny hoặc whisper-small
-    pipe = pipeline("automatic-speech-recognition", model="openai/whisper-tiny", device=device)
+    with startup_report.phase("import torch/transformers"):
+        import torch
+        from transformers import pipeline
+    with startup_report.phase("load Whisper"):
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Sử dụng openai/whisper-tiny hoặc whisper-small
+        pipe = pipeline("automatic-speech-recognition", model="openai/whisper-tiny", device=device)
     return pipe
 
-def process_voice_input(audio_input):
+# --- KHỞI ĐỘNG NỀN ---
+def _warm_up():
+    try:
+        with startup_report.phase("warm-up CLIP"):
+            get_clip_model()
+            # Chạy thử 1 lượt forward để khởi tạo kernel / bộ nhớ trước request đầu tiên
+            embed_texts(["warm up"])
+        get_fashion_index()
+        get_interaction_graph()
+        load_stt_model()
+    except Exception as e:
+        print(f"Lỗi khởi động nền: {e}")
+    print(startup_report.summary())
+
+@run_once
+def warm_up_models() -> threading.Thread:
+    """Nạp CLIP, Whisper, chỉ mục vector và graph tương tác ở thread nền (1 lần / process)."""
+    thread = threading.Thread(target=_warm_up, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def _run_stt_batch(items: list) -> list:
+    """Chạy 1 batch {'raw', 'sampling_rate'} qua pipeline Whisper, trả text theo đúng thứ tự."""
+    stt_pipeline = load_stt_model()
+    metrics.observe("model_batch_size", len(items), buckets=SIZE_BUCKETS, model="whisper")
+    # Pipeline có thể pop key khỏi dict input -> truyền bản sao để còn chạy lại từng cái khi lỗi
+    try:
+        with metrics.span("model_inference", model="whisper", kind="batch"):
+            outputs = stt_pipeline([dict(item) for item in items], batch_size=len(items))
+        return [out.get("text", "").strip() for out in outputs]
+    except Exception:
+        texts = []
+        for item in items:
+            try:
+                with metrics.span("model_inference", model="whisper", kind="single"):
+                    texts.append(stt_pipeline(dict(item)).get("text", "").strip())
+            except Exception as e:
+                print(f"Lỗi STT: {e}")
+                texts.append(None)
+        return texts
+
+@run_once
+def get_stt_batcher() -> MicroBatcher:
+    return MicroBatcher(_run_stt_batch, max_batch_size=STT_MAX_BATCH,
+                        max_wait_ms=STT_BATCH_WAIT_MS, name="stt-batcher")
+
+def _transcribe_via_file(audio_bytes: bytes) -> str:
+    """Đường dự phòng cho định dạng soundfile không đọc được (vd: webm): ffmpeg qua file tạm riêng."""
+    with tempfile.NamedTemporaryFile(suffix=".audio", delete=False) as f:
+        f.write(audio_bytes)
+        temp_filename = f.name
+    try:
+        with metrics.span("model_inference", model="whisper", kind="file"):
+            return load_stt_model()(temp_filename).get("text", "").strip()
+    finally:
+        os.remove(temp_filename)
+
+def transcribe_audio_stream(audio_bytes: bytes):
     """
-    Chuyển đổi âm thanh thành văn bản.
+    Decode trong RAM, cắt khoảng lặng (VAD) rồi gửi từng đoạn vào batcher Whisper
+    (an toàn khi nhiều session gọi cùng lúc). Yield bản ghi cộng dồn sau mỗi đoạn.
+    Mảng giữ sampling rate gốc: pipeline tự resample về 16 kHz như với mọi đầu vào khác.
+    """
+    try:
+        audio, sampling_rate = decode_audio(audio_bytes)
+    except Exception:
+        yield _transcribe_via_file(audio_bytes)
+        return
+    if VAD_ENABLED:
+        audio = trim_silence(audio, sampling_rate, VAD_THRESHOLD_DB)
+
+    text = ""
+    load_stt_model()  # nạp model không tính vào STT_TIMEOUT
+    for chunk in split_chunks(audio, sampling_rate, STT_CHUNK_SECONDS, VAD_THRESHOLD_DB):
+        future = get_stt_batcher().submit({"raw": chunk, "sampling_rate": sampling_rate})
+        try:
+            part = future.result(timeout=STT_TIMEOUT)
+        except Exception:
+            future.cancel()
+            raise
+        if part:
+            text = f"{text} {part}".strip()
+            yield text
+
+def stream_voice_input(audio_input):
+    """
+    Giống process_voice_input nhưng yield bản ghi tạm sau mỗi đoạn để UI hiện sớm.
     Chấp nhận đầu vào là: bytes HOẶC Streamlit UploadedFile
     """
     if not audio_input:
-        return None
-    
+        return
     try:
-        # --- FIX LỖI 'bytes-like object' TẠI ĐÂY ---
         # Nếu là UploadedFile (từ st.audio_input), lấy bytes ra
-        if hasattr(audio_input, "getvalue"):
-            audio_bytes = audio_input.getvalue()
-        else:
-            # Nếu đã là bytes rồi thì dùng luôn
-            audio_bytes = audio_input
-            
-        stt_pipeline = load_stt_model()
-        
-        # Ghi ra file tạm
-        temp_filename = "temp_voice_input.wav"
-        with open(temp_filename, "wb") as f:
-            f.write(audio_bytes)
-            
-        # Chạy model
-        result = stt_pipeline(temp_filename)
-        text = result.get("text", "").strip()
-        
-        # Dọn dẹp
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
-            
-        return text
+        audio_bytes = audio_input.getvalue() if hasattr(audio_input, "getvalue") else audio_input
+        yield from transcribe_audio_stream(audio_bytes)
     except Exception as e:
         print(f"Lỗi STT: {e}")
-        return None
+
+def process_voice_input(audio_input):
+    """
+    Chuyển đổi âm thanh thành văn bản.
+    Chấp nhận đầu vào là: bytes HOẶC Streamlit UploadedFile
+    """
+    text = None
+    for text in stream_voice_input(audio_input): pass
+    return text
 
 # Hàm cũ (nếu còn dùng ở đâu đó, nhưng khuyến khích dùng hàm trên)
 def process_voice(audio_bytes):
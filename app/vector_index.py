@@ -0,0 +1,349 @@
+"""
+Chỉ mục vector cục bộ (IVF) cho bảng fashion_clip_index.
+
+Toàn bộ embedding CLIP được lưu thành một ma trận memory-mapped (float32, float16
+hoặc int8 + scale theo INDEX_DTYPE, xem app.quantization), các dòng được sắp theo
+cụm (inverted list) nên mỗi cụm là một lát cắt liền mạch trên đĩa. Khi tìm kiếm
+chỉ quét `nprobe` cụm gần nhất với câu truy vấn.
+
+Kèm theo là chỉ mục ngược category: từ (trong metadata.categories và title) -> các dòng,
+để lọc theo category ngay từ bước sinh ứng viên thay vì lọc sau.
+
+Build:  python -m app.vector_index build [thư_mục_đích] [float32|float16|int8]
+"""
+import ast
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from app.quantization import DTYPES, FILE_SUFFIX, CompactEmbeddings, quantize
+
+META_FILE = "meta.json"
+IDS_FILE = "ids.json"
+VECTORS_FILE = "vectors.{suffix}"
+SCALES_FILE = "scales.npy"
+CENTROIDS_FILE = "centroids.npy"
+OFFSETS_FILE = "list_offsets.npy"
+POSTINGS_FILE = "postings.npz"
+
+# Lọc category: tập ứng viên nhỏ hơn ngưỡng này thì quét chính xác toàn bộ tập
+EXACT_FILTER_MAX_ROWS = 20000
+# Từ category xuất hiện ở quá nhiều sản phẩm (vd: "clothing", "women") không dùng để lọc
+MAX_CATEGORY_SHARE = 0.3
+# Không có chỉ mục (RPC match_fashion_clip): chỉ lọc sau theo vài loại sản phẩm phổ biến
+FALLBACK_CATEGORY_WORDS = ("dress", "shirt", "shoe", "watch")
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def parse_embedding(value) -> List[float]:
+    """pgvector trả embedding qua PostgREST dưới dạng chuỗi "[0.1,0.2,...]"."""
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def normalize_word(word: str) -> str:
+    """Chuẩn hoá số nhiều đơn giản: dresses -> dress, shoes -> shoe, watches -> watch."""
+    if word.endswith(("sses", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def text_words(text) -> set:
+    return {normalize_word(w) for w in WORD_RE.findall(str(text).lower())}
+
+
+def detect_fallback_category(query_text: str) -> Optional[str]:
+    """Loại sản phẩm đầu tiên trong FALLBACK_CATEGORY_WORDS là 1 từ trọn vẹn của câu truy vấn."""
+    words = text_words(query_text)
+    return next((word for word in FALLBACK_CATEGORY_WORDS if word in words), None)
+
+
+def has_category(product: dict, word: str) -> bool:
+    """`word` là 1 từ trong categories hoặc title (cùng cách tách từ với chỉ mục ngược)."""
+    return word in category_words(product.get("metadata")) | text_words(product.get("title") or "")
+
+
+def category_words(metadata) -> set:
+    """Các từ trong metadata.categories (list hoặc chuỗi dạng list)."""
+    categories = (metadata or {}).get("categories") if isinstance(metadata, dict) else None
+    if isinstance(categories, str):
+        try:
+            categories = ast.literal_eval(categories)
+        except (ValueError, SyntaxError):
+            pass
+    if isinstance(categories, (list, tuple)):
+        categories = " ".join(str(c) for c in categories)
+    return text_words(categories) if categories else set()
+
+
+class FashionVectorIndex:
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(index_dir, IDS_FILE), encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+
+        self.index_dir = index_dir
+        self.built_at = meta["built_at"]
+        self.dim = meta["dim"]
+        # Bản build cũ không ghi dtype -> float32
+        dtype = meta.get("dtype", "float32")
+        codes = np.memmap(
+            os.path.join(index_dir, VECTORS_FILE.format(suffix=FILE_SUFFIX[dtype])),
+            dtype=DTYPES[dtype], mode="r", shape=(meta["count"], self.dim)
+        )
+        scales = np.load(os.path.join(index_dir, SCALES_FILE)) if dtype == "int8" else None
+        self.vectors = CompactEmbeddings(codes, scales)
+        self.centroids = np.load(os.path.join(index_dir, CENTROIDS_FILE))
+        self.list_offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        self.id_to_row = {pid: row for row, pid in enumerate(self.ids)}
+
+        # Chỉ mục ngược category (bản build cũ không có thì bỏ qua lọc)
+        self.postings, self.category_vocab = {}, set()
+        postings_path = os.path.join(index_dir, POSTINGS_FILE)
+        if os.path.exists(postings_path):
+            data = np.load(postings_path)
+            self.posting_rows = data["rows"]
+            offsets = data["offsets"]
+            self.postings = {
+                str(word): (offsets[i], offsets[i + 1]) for i, word in enumerate(data["words"])
+            }
+            self.category_vocab = set(str(w) for w in data["category_words"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self, max_age: float) -> bool:
+        return time.time() - self.built_at > max_age
+
+    def get_vector(self, product_id: str) -> Optional[List[float]]:
+        row = self.id_to_row.get(product_id)
+        if row is None: return None
+        return self.vectors.vector(row).tolist()
+
+    # --- CATEGORY ---
+    def category_rows(self, word: str) -> np.ndarray:
+        """Các dòng (đã sắp tăng dần) có `word` trong categories hoặc title."""
+        start, end = self.postings.get(word, (0, 0))
+        return self.posting_rows[start:end] if end > start else np.empty(0, dtype=np.int64)
+
+    def detect_category(self, query_text: str) -> Optional[str]:
+        """
+        Từ category (lấy từ metadata.categories) có trong câu truy vấn. Bỏ từ chung chung phủ quá
+        MAX_CATEGORY_SHARE catalog; còn nhiều từ thì chọn từ phủ nhiều sản phẩm nhất (loại sản phẩm,
+        vd: "dress") thay vì từ hiếm (thường là thuộc tính như "beach", "lace") để không lọc quá hẹp.
+        """
+        best, best_size = None, 0
+        for word in text_words(query_text) & self.category_vocab:
+            start, end = self.postings.get(word, (0, 0))
+            size = end - start
+            if size > MAX_CATEGORY_SHARE * len(self.ids): continue
+            if size > best_size or (size == best_size and best is not None and word < best):
+                best, best_size = word, size
+        return best
+
+    # --- TÌM KIẾM ---
+    def _candidate_rows(self, query: np.ndarray, nprobe: int, allowed: Optional[np.ndarray] = None,
+                        min_rows: int = 0) -> np.ndarray:
+        """
+        Quét các cụm theo thứ tự gần truy vấn nhất. Có `allowed` thì chỉ lấy các dòng thuộc
+        tập đó (giao với mỗi cụm là một lát searchsorted vì cả hai đều đã sắp), và quét thêm
+        cụm cho tới khi đủ `min_rows` ứng viên.
+        """
+        n_lists = len(self.centroids)
+        if nprobe >= n_lists and allowed is None:
+            return np.arange(len(self.ids))
+
+        chunks, total = [], 0
+        for i, c in enumerate(np.argsort(-(self.centroids @ query))):
+            start, end = self.list_offsets[c], self.list_offsets[c + 1]
+            if allowed is None:
+                chunk = np.arange(start, end)
+            else:
+                chunk = allowed[np.searchsorted(allowed, start):np.searchsorted(allowed, end)]
+            chunks.append(chunk)
+            total += len(chunk)
+            if i + 1 >= nprobe and total >= min_rows: break
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def search(self, vector, match_threshold: float, match_count: int, nprobe: int = 8,
+               category: Optional[str] = None) -> List[dict]:
+        """
+        Trả kết quả cùng dạng với RPC match_fashion_clip: [{'id', 'similarity'}].
+        category: chỉ tìm trong các sản phẩm thuộc category đó (lọc ngay khi sinh ứng viên).
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        if category:
+            allowed = self.category_rows(category)
+            if len(allowed) <= EXACT_FILTER_MAX_ROWS:
+                rows = allowed
+            else:
+                rows = self._candidate_rows(query, nprobe, allowed, min_rows=match_count)
+        else:
+            rows = self._candidate_rows(query, nprobe)
+        if len(rows) == 0: return []
+
+        scores = self.vectors.scores(rows, query)
+        keep = scores >= match_threshold
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > match_count:
+            top = np.argpartition(-scores, match_count - 1)[:match_count]
+            rows, scores = rows[top], scores[top]
+
+        order = np.argsort(-scores)
+        return [{"id": self.ids[rows[i]], "similarity": float(scores[i])} for i in order]
+
+
+# ==================================================
+# BUILD CHỈ MỤC TỪ SUPABASE
+# ==================================================
+
+def _spherical_kmeans(sample: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = sample[assign == c]
+            if len(members) == 0:
+                centroids[c] = sample[rng.integers(len(sample))]
+                continue
+            center = members.sum(axis=0)
+            centroids[c] = center / (np.linalg.norm(center) + 1e-12)
+    return centroids
+
+
+def _assign_lists(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk])
+        assign[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def build_fashion_index(client, index_dir: str, n_lists: Optional[int] = None, page_size: int = 1000,
+                        dtype: str = "float32") -> int:
+    """
+    Đọc toàn bộ embedding của fashion_clip_index theo từng trang, ghi ra đĩa
+    và dựng IVF. Bản build mới được ghi vào thư mục tạm rồi mới thay thế bản cũ.
+    dtype: kiểu lưu vector (float32 / float16 / int8), tâm cụm luôn là float32.
+    """
+    tmp_dir = index_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # 1. Tải embedding theo trang, ghi thẳng ra file thô (không giữ hết trong RAM)
+    raw_path = os.path.join(tmp_dir, "raw.f32")
+    ids, dim, start = [], None, 0
+    row_words, category_vocab = [], set()
+    with open(raw_path, "wb") as raw:
+        while True:
+            page = client.table("fashion_clip_index") \
+                .select("id, embedding, title, metadata") \
+                .order("id") \
+                .range(start, start + page_size - 1) \
+                .execute()
+            if not page.data: break
+            for row in page.data:
+                vec = np.asarray(parse_embedding(row["embedding"]), dtype=np.float32)
+                vec /= (np.linalg.norm(vec) + 1e-12)
+                dim = dim or len(vec)
+                raw.write(vec.tobytes())
+                ids.append(row["id"])
+                cats = category_words(row.get("metadata"))
+                category_vocab |= cats
+                row_words.append(cats | text_words(row.get("title") or ""))
+            start += page_size
+            print(f"⏳ Đã tải {len(ids)} embedding...")
+
+    if not ids:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print("⚠️ fashion_clip_index rỗng, không build chỉ mục.")
+        return 0
+
+    raw_vectors = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(len(ids), dim))
+
+    # 2. Huấn luyện tâm cụm trên một mẫu, ~sqrt(N) cụm
+    n_lists = n_lists or max(1, int(np.sqrt(len(ids))))
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(len(ids), min(len(ids), 20000), replace=False))
+    centroids = _spherical_kmeans(np.asarray(raw_vectors[sample_rows]), min(n_lists, len(sample_rows)))
+
+    # 3. Sắp các dòng theo cụm để mỗi inverted list là một lát cắt liền mạch
+    assign = _assign_lists(raw_vectors, centroids)
+    order = np.argsort(assign, kind="stable")
+    counts = np.bincount(assign, minlength=len(centroids))
+    list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    vectors = np.memmap(os.path.join(tmp_dir, VECTORS_FILE.format(suffix=FILE_SUFFIX[dtype])),
+                        dtype=DTYPES[dtype], mode="w+", shape=(len(ids), dim))
+    scales = np.empty(len(ids), dtype=np.float32)
+    for start in range(0, len(order), 8192):
+        rows = order[start:start + 8192]
+        codes, block_scales = quantize(raw_vectors[rows], dtype)
+        vectors[start:start + len(rows)] = codes
+        if block_scales is not None:
+            scales[start:start + len(rows)] = block_scales
+    vectors.flush()
+    if dtype == "int8":
+        np.save(os.path.join(tmp_dir, SCALES_FILE), scales)
+    del vectors, raw_vectors
+    os.remove(raw_path)
+
+    # Chỉ mục ngược category theo vị trí dòng mới (sau khi sắp theo cụm)
+    new_position = np.empty(len(order), dtype=np.int64)
+    new_position[order] = np.arange(len(order))
+    postings = {}
+    for old_row, words in enumerate(row_words):
+        for word in words:
+            postings.setdefault(word, []).append(new_position[old_row])
+    words = sorted(postings)
+    posting_rows = [np.sort(np.asarray(postings[w], dtype=np.int64)) for w in words]
+    np.savez(
+        os.path.join(tmp_dir, POSTINGS_FILE),
+        words=np.asarray(words, dtype=str),
+        offsets=np.concatenate([[0], np.cumsum([len(r) for r in posting_rows])]).astype(np.int64),
+        rows=np.concatenate(posting_rows) if posting_rows else np.empty(0, dtype=np.int64),
+        category_words=np.asarray(sorted(category_vocab), dtype=str),
+    )
+
+    np.save(os.path.join(tmp_dir, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), list_offsets)
+    with open(os.path.join(tmp_dir, IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump([ids[i] for i in order], f)
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"built_at": time.time(), "dim": dim, "count": len(ids), "n_lists": len(centroids),
+                   "dtype": dtype}, f)
+
+    # 4. Thay thế bản cũ
+    old_dir = index_dir.rstrip("/") + ".old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"✅ Đã build chỉ mục {len(ids)} vector ({dtype}), {len(centroids)} cụm -> {index_dir}")
+    return len(ids)
+
+
+if __name__ == "__main__":
+    from app.config import FASHION_INDEX_DIR, INDEX_DTYPE
+    from app.utils import get_db
+
+    if len(sys.argv) < 2 or sys.argv[1] != "build" or (len(sys.argv) > 3 and sys.argv[3] not in DTYPES):
+        print("Cách dùng: python -m app.vector_index build [thư_mục_đích] [float32|float16|int8]")
+        sys.exit(1)
+    target = sys.argv[2] if len(sys.argv) > 2 else FASHION_INDEX_DIR
+    dtype = sys.argv[3] if len(sys.argv) > 3 else INDEX_DTYPE
+    build_fashion_index(get_db(), target, dtype=dtype)
@@ -0,0 +1,195 @@
+"""
+Benchmark các đường nóng của hệ gợi ý trên Supabase giả lập (benchmarks.local_supabase)
+với catalog tổng hợp, không cần project Supabase thật:
+search_fashion_tool, search_books_tool, recommend_outfit_tool, switching_hybrid_tool
+(+ create_clip_embedding khi có --clip, cần tải model CLIP).
+
+Mỗi hàm: độ trễ p50/p95/p99, số round trip và số byte mỗi lần gọi, recall@k (tìm kiếm vector).
+Lưu kết quả bằng --save và so với lần chạy trước bằng --compare để thấy tiến / lùi.
+
+Chạy: python -m benchmarks.bench_hot_paths [--fashion 5000] [--books 2000] [--queries 200]
+        [--rtt-ms 0] [--local-index] [--memory-graph] [--warm] [--clip]
+        [--save kq.json] [--compare kq_truoc.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Benchmark không gọi Supabase thật (get_db được thay bằng LocalSupabase bên dưới)
+os.environ.setdefault("STORAGE_BACKEND", "local")
+
+import app.tools as tools
+import app.utils as utils
+from app.interaction_graph import build_interaction_graph
+from app.product_cache import invalidate_products
+from app.vector_index import FashionVectorIndex, build_fashion_index
+from benchmarks.local_supabase import LocalSupabase
+from benchmarks.synthetic_catalog import make_catalog
+
+
+class Recorder:
+    def __init__(self, db: LocalSupabase, warm: bool):
+        self.db = db
+        self.warm = warm
+        self.results = {}
+
+    def call(self, name: str, fn, *args, **kwargs):
+        if not self.warm:
+            invalidate_products()
+            tools.product_type_cache.clear()
+        # Executor riêng cho mỗi lần gọi: chờ cả các future chạy nền (vd: nhánh vector của
+        # switching_hybrid) xong rồi mới chốt số round trip, không tính vào độ trễ
+        executor = ThreadPoolExecutor(max_workers=8)
+        tools.get_io_executor = lambda: executor
+        trips, size = self.db.snapshot()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            executor.shutdown(wait=True)
+        new_trips, new_size = self.db.snapshot()
+        stats = self.results.setdefault(name, {"ms": [], "trips": [], "bytes": [], "recall": []})
+        stats["ms"].append(elapsed)
+        stats["trips"].append(new_trips - trips)
+        stats["bytes"].append(new_size - size)
+        return result
+
+    def recall(self, name: str, value: float):
+        self.results[name]["recall"].append(value)
+
+    def summary(self) -> dict:
+        out = {}
+        for name, s in self.results.items():
+            p50, p95, p99 = np.percentile(s["ms"], [50, 95, 99])
+            out[name] = {
+                "calls": len(s["ms"]), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+                "round_trips": float(np.mean(s["trips"])), "kb": float(np.mean(s["bytes"])) / 1024,
+                "recall": float(np.mean(s["recall"])) if s["recall"] else None,
+            }
+        return out
+
+
+def exact_top_k(ids, matrix, query, k: int, threshold: float) -> list:
+    scores = matrix @ query
+    return [ids[i] for i in np.argsort(-scores)[:k] if scores[i] >= threshold]
+
+
+def noisy_queries(matrix: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    queries = matrix[rng.integers(len(matrix), size=n)] + 0.02 * rng.standard_normal((n, matrix.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def print_summary(summary: dict, previous: dict = None):
+    print(f"\n{'hàm':28} {'p50':>8} {'p95':>8} {'p99':>8} {'RT/lần':>7} {'KB/lần':>9} {'recall':>7}")
+    for name, s in summary.items():
+        recall = f"{s['recall']:.3f}" if s["recall"] is not None else "-"
+        print(f"{name:28} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} {s['p99_ms']:8.2f} "
+              f"{s['round_trips']:7.2f} {s['kb']:9.1f} {recall:>7}")
+        old = (previous or {}).get(name)
+        if old:
+            delta = lambda key: (s[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"{'  so với lần trước':28} {delta('p50_ms'):+7.1f}% {delta('p95_ms'):+7.1f}% "
+                  f"{delta('p99_ms'):+7.1f}% {s['round_trips'] - old['round_trips']:+7.2f} {delta('kb'):+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fashion", type=int, default=5000)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="độ trễ mạng giả lập mỗi round trip")
+    parser.add_argument("--local-index", action="store_true", help="dùng chỉ mục IVF cục bộ thay cho RPC")
+    parser.add_argument("--memory-graph", action="store_true", help="dùng graph tương tác CSR trong RAM")
+    parser.add_argument("--warm", action="store_true", help="giữ cache sản phẩm giữa các lần gọi")
+    parser.add_argument("--clip", action="store_true", help="đo thêm create_clip_embedding (nạp model thật)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    print(f"⏳ Sinh catalog: {args.fashion} thời trang, {args.books} sách, {args.dim} chiều...")
+    catalog = make_catalog(args.fashion, args.books, args.dim, seed=args.seed)
+    db = LocalSupabase(catalog, rtt_ms=args.rtt_ms)
+
+    tools.get_db = lambda: db
+    utils.get_db = lambda: db
+    index_dir = None
+    if args.local_index:
+        index_dir = tempfile.mkdtemp(prefix="bench_index_")
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_fashion_index(db, index_dir)
+        index = FashionVectorIndex(index_dir)
+        tools.get_fashion_index = lambda: index
+    else:
+        tools.get_fashion_index = lambda: None
+    graph = build_interaction_graph(db) if args.memory_graph else None
+    tools.get_interaction_graph = lambda: graph
+
+    # TrendingIndex tính lần đầu trước khi đo (thread nền của nó cũng gọi Supabase giả lập)
+    trending = tools.get_trending_index()
+    deadline = time.monotonic() + 30
+    while not trending.ready and time.monotonic() < deadline: time.sleep(0.05)
+    db.reset_stats()
+
+    rng = np.random.default_rng(args.seed + 1)
+    recorder = Recorder(db, args.warm)
+
+    fashion_ids, fashion_matrix = db.vectors("fashion_clip_index")
+    for query in noisy_queries(fashion_matrix, args.queries, rng):
+        state = {"question_en": "", "query_vector": query.tolist()}
+        found = recorder.call("search_fashion_tool", tools.search_fashion_tool, state, top_k=args.k)
+        truth = exact_top_k(fashion_ids, fashion_matrix, query, args.k, 0.2)
+        if truth:
+            recorder.recall("search_fashion_tool", len({p["id"] for p in found} & set(truth)) / len(truth))
+
+    book_ids, book_matrix = db.vectors("books_index")
+    for query in noisy_queries(book_matrix, args.queries, rng):
+        state = {"question_en": "", "query_vector": query.tolist()}
+        found = recorder.call("search_books_tool", tools.search_books_tool, state, top_k=5)
+        truth = exact_top_k(book_ids, book_matrix, query, 5, 0.2)
+        if truth:
+            recorder.recall("search_books_tool", len({p["id"] for p in found} & set(truth)) / len(truth))
+
+    hot_ids = sorted({e["item_a"] for e in catalog["product_interactions"] if e["item_a"].startswith("F")})
+    pick = random.Random(args.seed)
+    for _ in range(args.queries):
+        recorder.call("recommend_outfit_tool", tools.recommend_outfit_tool, pick.choice(hot_ids), 4)
+    for i in range(args.queries):
+        # Nửa sản phẩm hot (chiến lược Graph), nửa ngẫu nhiên (phần lớn cold start -> Vector)
+        product_id = pick.choice(hot_ids) if i % 2 == 0 else pick.choice(fashion_ids)
+        recorder.call("switching_hybrid_tool", tools.switching_hybrid_tool, product_id, 4)
+
+    if args.clip:
+        utils.create_clip_embedding(text="warm up")
+        for i in range(args.queries):
+            recorder.call("create_clip_embedding", utils.create_clip_embedding, text=f"red summer dress {i}")
+
+    summary = recorder.summary()
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+    print_summary(summary, previous)
+    print(f"\nRound trip theo endpoint: {db.calls}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": summary}, f, indent=2)
+        print(f"💾 Đã lưu kết quả -> {args.save}")
+    if index_dir:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Đo đường nhanh hiểu ý định (app.intent) so với Gemini:
+tỉ lệ câu được trả lời tại chỗ, độ trùng khớp intent / ngôn ngữ với LLM, và độ trễ.
+
+Chạy: python -m benchmarks.bench_intent [file_câu_hỏi.txt] [--threshold 0.85]
+(mỗi dòng một câu hỏi; không truyền file thì dùng bộ câu mẫu bên dưới)
+"""
+import argparse
+import time
+
+from app.config import INTENT_CONFIDENCE_THRESHOLD
+from app.graph import understand_with_llm
+from app.intent import understand_locally
+
+SAMPLE_QUERIES = [
+    "red floral dress", "show me black leather boots", "I want a horror novel",
+    "running shoes for men", "summer dress for women", "a science fiction book about space",
+    "cotton t-shirt", "gold watch", "books about history", "romance novel",
+    "denim jacket", "cookbook for beginners", "kids sneakers", "wedding dress",
+    "tìm áo sơ mi trắng", "sách kinh dị", "giày thể thao nữ", "tiểu thuyết lãng mạn",
+    "Nike Air Max 270", "something for my mom",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries_file", nargs="?")
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE_THRESHOLD)
+    args = parser.parse_args()
+
+    queries = SAMPLE_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    covered, intent_agree, lang_agree = 0, 0, 0
+    local_ms, llm_ms = [], []
+    for q in queries:
+        start = time.perf_counter()
+        local = understand_locally(q, args.threshold)
+        local_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        ref = understand_with_llm(q, use_cache=False)
+        llm_ms.append((time.perf_counter() - start) * 1000)
+
+        mark = "LLM"
+        if local is not None:
+            covered += 1
+            intent_agree += local["category_intent"] == ref["category_intent"]
+            lang_agree += local["user_lang"] == ref["user_lang"]
+            mark = "OK " if local["category_intent"] == ref["category_intent"] else "DIFF"
+            mark += f" {local['confidence']:.2f} '{local['question_en']}'"
+        print(f"[{mark}] {q!r} -> LLM: {ref['category_intent']}/{ref['user_lang']} '{ref['question_en']}'")
+
+    n = len(queries)
+    print(f"\nNgưỡng tự tin:          {args.threshold}")
+    print(f"Trả lời tại chỗ:        {covered}/{n} ({100 * covered / n:.0f}%)")
+    if covered:
+        print(f"Trùng intent với LLM:   {intent_agree}/{covered} ({100 * intent_agree / covered:.0f}%)")
+        print(f"Trùng ngôn ngữ với LLM: {lang_agree}/{covered} ({100 * lang_agree / covered:.0f}%)")
+    # Lượt đầu của đường nhanh có tính cả thời gian tính prototype
+    print(f"Độ trễ TB local:        {sum(local_ms[1:]) / max(1, n - 1):.1f} ms")
+    print(f"Độ trễ TB Gemini:       {sum(llm_ms) / n:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
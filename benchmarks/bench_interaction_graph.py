@@ -0,0 +1,83 @@
+"""
+So sánh tra cứu top-k hàng xóm: graph CSR trong RAM vs truy vấn product_interactions.
+
+Chạy: python -m benchmarks.bench_interaction_graph [--live] [--edges N] [--queries Q]
+  --live: đo thêm đường truy vấn Supabase hiện tại trên dữ liệu thật.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.interaction_graph import InteractionGraph
+
+
+def _percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return f"p50={p50:.3f}ms p95={p95:.3f}ms p99={p99:.3f}ms"
+
+
+def synthetic_edges(n_edges: int, n_items: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n_edges):
+        yield f"item{rng.randrange(n_items)}", f"item{rng.randrange(n_items)}", float(rng.randint(1, 50))
+
+
+def bench_local(graph: InteractionGraph, item_ids, k: int):
+    samples = []
+    for item_id in item_ids:
+        start = time.perf_counter()
+        graph.top_neighbors(item_id, k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_query(client, item_ids, k: int):
+    samples = []
+    for item_id in item_ids:
+        start = time.perf_counter()
+        client.table("product_interactions") \
+            .select("item_b, score") \
+            .eq("item_a", item_id) \
+            .order("score", desc=True) \
+            .limit(k) \
+            .execute()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--edges", type=int, default=500_000)
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.live:
+        from app.interaction_graph import build_interaction_graph
+        from app.utils import get_db
+        client = get_db()
+        start = time.perf_counter()
+        graph = build_interaction_graph(client)
+    else:
+        start = time.perf_counter()
+        graph = InteractionGraph(synthetic_edges(args.edges, args.items))
+    print(f"Nạp graph: {time.perf_counter() - start:.2f}s, {len(graph.id_list)} node, {len(graph)} cạnh")
+
+    item_ids = random.Random(1).choices(graph.id_list, k=args.queries)
+    print(f"CSR trong RAM:   {_percentiles(bench_local(graph, item_ids, args.k))}")
+
+    # Overlay (các lượt feedback chưa gộp) làm chậm đường nhanh bao nhiêu
+    for item_id in item_ids[: len(item_ids) // 2]:
+        graph.apply_increment(item_id, item_ids[0], 1)
+    print(f"CSR + overlay:   {_percentiles(bench_local(graph, item_ids, args.k))}")
+
+    if args.live:
+        print(f"Truy vấn Supabase: {_percentiles(bench_query(client, item_ids, args.k))}")
+
+
+if __name__ == "__main__":
+    main()
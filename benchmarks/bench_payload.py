@@ -0,0 +1,43 @@
+"""
+Đo lượng dữ liệu ảnh mà UI gửi xuống trình duyệt mỗi lần rerun:
+ảnh gốc trong mọi card (trước) so với thumbnail cho card + 1 ảnh gốc ở trang chi tiết (sau).
+
+Chạy: python -m benchmarks.bench_payload [số_sản_phẩm]
+"""
+import sys
+import time
+
+from app.thumbnails import attach_thumbnail, image_payload_bytes
+from app.utils import get_db
+
+
+def main(sample_size: int = 18):
+    client = get_db()
+    rows = client.table("fashion_clip_index") \
+        .select("id, title, metadata, image_base64") \
+        .limit(sample_size) \
+        .execute().data
+    if not rows:
+        print("fashion_clip_index rỗng.")
+        return
+
+    # Gallery 10 card + trang chi tiết có 2 hàng x 4 card và 1 ảnh lớn
+    gallery, pdp_rows = rows[:10], rows[10:18]
+    hero = rows[0]
+
+    before = image_payload_bytes(gallery + pdp_rows + [hero], "image_base64")
+
+    start = time.perf_counter()
+    thumbs = [attach_thumbnail(dict(r)) for r in gallery + pdp_rows]
+    elapsed = time.perf_counter() - start
+    after = image_payload_bytes(thumbs, "thumbnail_base64") + image_payload_bytes([hero], "image_base64")
+
+    print(f"Sản phẩm mẫu:        {len(rows)}")
+    print(f"Trước (ảnh gốc):     {before / 1024:,.1f} KB / rerun")
+    print(f"Sau (thumbnail):     {after / 1024:,.1f} KB / rerun")
+    print(f"Giảm:                {100 * (1 - after / max(before, 1)):.1f}%")
+    print(f"Tạo thumbnail:       {1000 * elapsed / len(thumbs):.1f} ms / ảnh (chỉ khi cache miss)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 18)
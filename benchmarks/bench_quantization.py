@@ -0,0 +1,73 @@
+"""
+So sánh cách lưu embedding: list Python vs float32 / float16 / int8 (+ scale):
+bộ nhớ, độ trễ quét toàn bộ ma trận cho 1 truy vấn và recall@k so với float32.
+
+Chạy: python -m benchmarks.bench_quantization [--n 100000] [--dim 512] [--queries 200] [--k 10]
+      python -m benchmarks.bench_quantization --index-dir data/fashion_index   (vector thật, bản build float32)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.quantization import DTYPES, CompactEmbeddings
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Vector chuẩn hoá có cấu trúc cụm (gần với embedding CLIP hơn nhiễu thuần)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(n_clusters, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_index_vectors(index_dir: str) -> np.ndarray:
+    with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("dtype", "float32") != "float32":
+        sys.exit("Cần bản build float32 để làm chuẩn so sánh")
+    return np.array(np.memmap(os.path.join(index_dir, "vectors.f32"), dtype=np.float32, mode="r",
+                              shape=(meta["count"], meta["dim"])))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-dir")
+    args = parser.parse_args()
+
+    vectors = load_index_vectors(args.index_dir) if args.index_dir else synthetic_vectors(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    # Truy vấn = vector trong catalog + nhiễu (giống ảnh chụp lại một sản phẩm có sẵn)
+    queries = vectors[rng.integers(n, size=args.queries)] + 0.3 * rng.normal(size=(args.queries, dim)).astype(np.float32) / np.sqrt(dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    exact = CompactEmbeddings.from_float32(vectors, "float32")
+    truth = [set(top_k(exact.scores(None, q), args.k)) for q in queries]
+
+    list_bytes = sys.getsizeof(vectors[0].tolist()) + dim * sys.getsizeof(0.1)
+    print(f"{n} vector x {dim} chiều, {args.queries} truy vấn, recall@{args.k} so với float32\n")
+    print(f"{'kiểu':8} {'bộ nhớ':>12} {'byte/vector':>12} {'ms/truy vấn':>12} {'recall@k':>9}")
+    print(f"{'list':8} {n * list_bytes / 2**20:10.1f} MB {list_bytes:12d} {'-':>12} {'-':>9}")
+    for dtype in DTYPES:
+        store = CompactEmbeddings.from_float32(vectors, dtype)
+        start = time.perf_counter()
+        found = [set(top_k(store.scores(None, q), args.k)) for q in queries]
+        per_query = (time.perf_counter() - start) * 1000 / args.queries
+        recall = np.mean([len(f & t) / args.k for f, t in zip(found, truth)])
+        print(f"{dtype:8} {store.nbytes / 2**20:10.1f} MB {store.nbytes // n:12d} {per_query:12.2f} {recall:9.4f}")
+
+
+if __name__ == "__main__":
+    main()
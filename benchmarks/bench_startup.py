@@ -0,0 +1,50 @@
+"""
+Đo thời gian khởi động theo phase: import app (torch/transformers import lười vs import sẵn
+như trước), compile graph mỗi query vs dùng lại graph đã compile, và nạp model nền.
+
+Chạy: python -m benchmarks.bench_startup
+"""
+import subprocess
+import sys
+import time
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+{pre}
+import app.graph, app.tools
+print(time.perf_counter() - t)
+"""
+
+
+def _import_time(pre: str) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(pre=pre)],
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    eager = _import_time("import torch, transformers; from transformers import CLIPModel, CLIPProcessor, pipeline")
+    lazy = _import_time("")
+    print(f"import app (eager torch/transformers): {eager * 1000:9.1f} ms")
+    print(f"import app (lazy):                     {lazy * 1000:9.1f} ms")
+
+    from app.graph import build_fashion_graph, get_compiled_graph
+    start = time.perf_counter()
+    for _ in range(10): build_fashion_graph()
+    per_query = (time.perf_counter() - start) / 10
+    get_compiled_graph()
+    start = time.perf_counter()
+    for _ in range(10): get_compiled_graph()
+    reuse = (time.perf_counter() - start) / 10
+    print(f"compile graph mỗi query:               {per_query * 1000:9.3f} ms")
+    print(f"dùng lại graph đã compile:             {reuse * 1000:9.3f} ms")
+
+    from app.startup import startup_report
+    from app.utils import warm_up_models
+    warm_up_models().join()
+    print(startup_report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Đo độ trễ voice search trên các bản ghi mẫu: cả bản ghi vào Whisper một lượt (như trước)
+so với cắt khoảng lặng (VAD) + decode từng đoạn: thời gian tới bản ghi tạm đầu tiên,
+tổng thời gian và số giây âm thanh thực sự đưa vào model.
+
+Chạy: python -m benchmarks.bench_voice mau1.wav mau2.wav ... [--pad-silence 1.5] [--repeat 3]
+(--pad-silence thêm khoảng lặng đầu / cuối để giả lập bản ghi thật từ st.audio_input)
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+
+from app.audio import WHISPER_SAMPLING_RATE, decode_audio, split_chunks, trim_silence
+from app.config import STT_CHUNK_SECONDS, VAD_THRESHOLD_DB
+from app.utils import load_stt_model, transcribe_audio_stream
+
+
+def _to_wav_bytes(audio: np.ndarray, sampling_rate: int) -> bytes:
+    import soundfile as sf
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, sampling_rate, format="WAV")
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--pad-silence", type=float, default=0.0, help="giây lặng thêm mỗi bên")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    stt_pipeline = load_stt_model()
+    stt_pipeline({"raw": np.zeros(WHISPER_SAMPLING_RATE, dtype=np.float32), "sampling_rate": WHISPER_SAMPLING_RATE})
+
+    totals = {"whole": 0.0, "first": 0.0, "vad": 0.0}
+    for path in args.files:
+        with open(path, "rb") as f:
+            audio, sampling_rate = decode_audio(f.read())
+        pad = np.zeros(int(args.pad_silence * sampling_rate), dtype=np.float32)
+        audio = np.concatenate([pad, audio, pad])
+        audio_bytes = _to_wav_bytes(audio, sampling_rate)
+
+        trimmed = trim_silence(audio, sampling_rate, VAD_THRESHOLD_DB)
+        chunks = split_chunks(trimmed, sampling_rate, STT_CHUNK_SECONDS, VAD_THRESHOLD_DB)
+        speech_seconds = sum(len(c) for c in chunks) / sampling_rate
+
+        whole_ms, first_ms, vad_ms = [], [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            whole_text = stt_pipeline({"raw": audio, "sampling_rate": sampling_rate})["text"].strip()
+            whole_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            first, text = None, ""
+            for text in transcribe_audio_stream(audio_bytes):
+                if first is None: first = time.perf_counter() - start
+            vad_ms.append((time.perf_counter() - start) * 1000)
+            first_ms.append((first if first is not None else 0.0) * 1000)
+
+        whole, first, vad = np.median(whole_ms), np.median(first_ms), np.median(vad_ms)
+        totals["whole"] += whole
+        totals["first"] += first
+        totals["vad"] += vad
+        print(f"\n{path}: {len(audio) / sampling_rate:.1f}s âm thanh -> "
+              f"{speech_seconds:.1f}s sau VAD, {len(chunks)} đoạn")
+        print(f"  cả bản ghi:          {whole:8.1f} ms  '{whole_text}'")
+        print(f"  VAD + chia đoạn:     {vad:8.1f} ms  '{text}'")
+        print(f"  bản ghi tạm đầu tiên:{first:8.1f} ms")
+
+    n = len(args.files)
+    print(f"\nTrung bình: cả bản ghi {totals['whole'] / n:.1f} ms | VAD + chia đoạn {totals['vad'] / n:.1f} ms"
+          f" | bản ghi tạm đầu tiên {totals['first'] / n:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Supabase giả lập trong RAM cho benchmark: dùng chính backend nhúng app.local_store.LocalStore
+(SQLite ":memory:"), cùng các bảng và RPC mà app dùng, thêm phần đếm:
+
+Mỗi .execute() được tính là 1 round trip; số byte = JSON của request + response.
+Tuỳ chọn rtt_ms để giả lập độ trễ mạng cho mỗi round trip (rtt_ms=0 ~ STORAGE_BACKEND=local).
+"""
+import json
+import threading
+import time
+from typing import Dict, List
+
+from app.local_store import LocalResponse, LocalStore
+
+
+class LocalSupabase(LocalStore):
+    def __init__(self, tables: Dict[str, List[dict]], rtt_ms: float = 0.0):
+        super().__init__(":memory:")
+        self.rtt = rtt_ms / 1000.0
+        self._stats_lock = threading.Lock()
+        for name, rows in tables.items():
+            self.load(name, rows)
+        self.reset_stats()
+
+    # --- thống kê ---
+    def reset_stats(self):
+        self.round_trips = 0
+        self.bytes = 0
+        self.calls: Dict[str, int] = {}
+
+    def snapshot(self) -> tuple:
+        return self.round_trips, self.bytes
+
+    def respond(self, endpoint: str, request, data) -> LocalResponse:
+        size = len(json.dumps(data)) + (len(json.dumps(request)) if request is not None else 0)
+        with self._stats_lock:
+            self.round_trips += 1
+            self.bytes += size
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.rtt: time.sleep(self.rtt)
+        return LocalResponse(data)
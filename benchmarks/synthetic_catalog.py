@@ -0,0 +1,84 @@
+"""
+Catalog tổng hợp cho benchmark: sản phẩm thời trang + sách với embedding có cấu trúc cụm
+theo category (đã chuẩn hoá L2), ảnh JPEG nhỏ và graph tương tác phân phối lệch
+(ít sản phẩm "hot" có nhiều cạnh, phần lớn không có cạnh nào -> cold start).
+"""
+import base64
+import json
+from io import BytesIO
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+FASHION_CATEGORIES = ["dress", "shirt", "shoe", "watch", "bag", "jacket", "jeans", "skirt"]
+BOOK_CATEGORIES = ["horror", "romance", "history", "fantasy", "cookbook", "science"]
+COLORS = ["red", "blue", "black", "white", "green", "pink"]
+
+
+def _image_base64(rng: np.random.Generator, size=(300, 400)) -> str:
+    pixels = rng.integers(0, 255, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize(size)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _clustered(rng: np.random.Generator, centers: np.ndarray, labels: np.ndarray, noise: float) -> np.ndarray:
+    vectors = centers[labels] + noise * rng.standard_normal((len(labels), centers.shape[1])).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_catalog(n_fashion: int = 5000, n_books: int = 2000, dim: int = 512, edges_per_hot: int = 8,
+                 hot_share: float = 0.1, n_images: int = 32, seed: int = 0) -> Dict[str, List[dict]]:
+    """Các bảng giống schema Supabase; embedding được lưu dạng chuỗi như pgvector trả về."""
+    rng = np.random.default_rng(seed)
+    # Chỉ sinh n_images ảnh khác nhau rồi dùng lại: kích thước payload vẫn thật, sinh nhanh hơn
+    images = [_image_base64(rng) for _ in range(n_images)]
+
+    # Cụm con (category x màu) quanh tâm category -> sản phẩm cùng loại gần nhau hơn
+    n_groups = len(FASHION_CATEGORIES) + len(BOOK_CATEGORIES)
+    centers = rng.standard_normal((n_groups * len(COLORS), dim)).astype(np.float32) * 0.5 \
+        + np.repeat(rng.standard_normal((n_groups, dim)).astype(np.float32), len(COLORS), axis=0)
+
+    fashion_labels = rng.integers(len(FASHION_CATEGORIES) * len(COLORS), size=n_fashion)
+    fashion_vectors = _clustered(rng, centers, fashion_labels, 1.2)
+    fashion = []
+    for i, label in enumerate(fashion_labels):
+        category, color = FASHION_CATEGORIES[label // len(COLORS)], COLORS[label % len(COLORS)]
+        fashion.append({
+            "id": f"F{i:07d}",
+            "title": f"{color.title()} {category} #{i}",
+            "metadata": {"categories": str(["Clothing", category.title()]),
+                         "description": f"A {color} {category} for every occasion."},
+            "image_base64": images[i % n_images],
+            "embedding": json.dumps(np.round(fashion_vectors[i], 6).tolist()),
+        })
+
+    offset = len(FASHION_CATEGORIES) * len(COLORS)
+    book_labels = rng.integers(len(BOOK_CATEGORIES) * len(COLORS), size=n_books) + offset
+    book_vectors = _clustered(rng, centers, book_labels, 1.2)
+    books = []
+    for i, label in enumerate(book_labels):
+        genre = BOOK_CATEGORIES[(label - offset) // len(COLORS)]
+        books.append({
+            "id": f"B{i:07d}",
+            "title": f"The {genre.title()} Book #{i}",
+            "author": f"Author {i % 97}",
+            "categories": str(["Books", genre.title()]),
+            "description": f"A {genre} book.",
+            "image_base64": images[i % n_images],
+            "embedding": json.dumps(np.round(book_vectors[i], 6).tolist()),
+        })
+
+    # Graph: hot_share sản phẩm có cạnh tới sản phẩm cùng loại, score lệch (Zipf)
+    interactions = []
+    for products in (fashion, books):
+        n_hot = int(len(products) * hot_share)
+        for a in rng.choice(len(products), n_hot, replace=False):
+            for b in rng.choice(len(products), edges_per_hot, replace=False):
+                if a == b: continue
+                interactions.append({"item_a": products[a]["id"], "item_b": products[b]["id"],
+                                     "score": float(rng.zipf(1.5) % 100 + 1)})
+
+    return {"fashion_clip_index": fashion, "books_index": books, "product_interactions": interactions}
@@ -1,17 +1,23 @@
 import streamlit as st
-import base64
 import time
 import ast
+import hashlib
 
 # --- LOCAL MODULES ---
-from app.graph import build_fashion_graph
-from app.tools import (
-    recommend_outfit_tool, 
-    get_similar_products_by_id, 
-    switching_hybrid_tool, 
-    feedback_loop_tool
-)
-from app.utils import process_voice_input
+from app.startup import startup_report
+with startup_report.phase("import app modules"):
+    from app.graph import get_compiled_graph, stream_fashion_graph
+    from app.tools import (
+        recommend_outfit_tool, 
+        switching_hybrid_tool, 
+        feedback_loop_tool,
+        get_product_full_image,
+        next_search_page
+    )
+    from app.utils import stream_voice_input, warm_up_models
+    from app.thumbnails import get_card_image
+    from app.image_pipeline import prepare_image_async
+    from app.metrics import metrics, start_metrics_server
 
 # ==========================================
 # 1. CONFIGURATION & SETUP
@@ -23,6 +29,11 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Nạp model ở thread nền ngay khi process khởi động (chỉ 1 lần), compile graph sẵn
+warm_up_models()
+get_compiled_graph()
+start_metrics_server()
+
 # ==========================================
 # 2. PROFESSIONAL CSS (DARK THEME)
 # ==========================================
@@ -178,19 +189,33 @@ if "gallery" not in st.session_state:
     st.session_state.gallery = []
 if "viewing_product" not in st.session_state: 
     st.session_state.viewing_product = None
+if "search_cursor" not in st.session_state: 
+    st.session_state.search_cursor = None
 if "input_id" not in st.session_state: 
     st.session_state.input_id = 0
+if "prepared_upload" not in st.session_state: 
+    st.session_state.prepared_upload = None  # (digest, Future[PreparedImage])
 
 def reset_inputs():
     """Increment key to reset input widgets"""
     st.session_state.input_id += 1
 
+def prepare_upload(uploaded_file):
+    """Future PreparedImage của ảnh đang tải lên; mỗi file (theo SHA-256) chỉ gửi vào worker pool 1 lần dù rerun nhiều lần."""
+    image_bytes = uploaded_file.getvalue()
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    cached = st.session_state.prepared_upload
+    if cached is None or cached[0] != digest:
+        cached = (digest, prepare_image_async(image_bytes, digest=digest))
+        st.session_state.prepared_upload = cached
+    return cached[1]
+
 # --- 4. HÀM HỖ TRỢ UI ---
 def render_product_card(product, key_prefix=""):
     """Renders a single product card with HTML/CSS"""
     with st.container():
         # --- 1. Image Logic ---
-        img_str = product.get('image_base64') or (product.get('metadata') or {}).get('image_base64')
+        img_str = get_card_image(product) # Thumbnail, không nhúng ảnh gốc vào từng card
         if img_str:
             prefix = "data:image/jpeg;base64," if not img_str.startswith("data:image") else ""
             img_src = f"{prefix}{img_str}"
@@ -238,6 +263,24 @@ def render_product_card(product, key_prefix=""):
                     parent_id = st.session_state.viewing_product['id']
                     feedback_loop_tool(parent_id, product['id'], weight=5)
 
+def render_gallery(products, key_prefix="search", cursor=None):
+    """Lưới kết quả tìm kiếm (3 cột); có cursor thì thêm nút lấy trang tiếp theo"""
+    st.markdown(f"### 🎯 Kết quả tìm kiếm ({len(products)})")
+    
+    cols = st.columns(3)
+    for i, p in enumerate(products):
+        with cols[i % 3]: 
+            render_product_card(p, key_prefix=key_prefix)
+
+    if cursor is not None and cursor.has_more:
+        if st.button("⬇️ Xem thêm", key=f"{key_prefix}_more_{len(products)}", use_container_width=True):
+            # Trang sau lấy từ danh sách ứng viên đã xếp hạng: không chạy lại LLM / embedding
+            with st.spinner("Đang tải thêm..."):
+                more = next_search_page(cursor)
+            known = {p['id'] for p in products}
+            st.session_state.gallery = products + [p for p in more if p['id'] not in known]
+            st.rerun()
+
 # ==========================================
 # 5. MAIN LAYOUT
 # ==========================================
@@ -254,6 +297,14 @@ with st.sidebar:
         st.caption(f"Đã trao đổi {len(st.session_state.messages)} tin nhắn")
     else:
         st.caption("Chưa có lịch sử")
+    
+    timings = st.session_state.get("last_timings")
+    if timings:
+        st.caption(f"⏱️ Kết quả đầu tiên: {timings['first_result']:.2f}s · Trả lời xong: {timings['full_answer']:.2f}s")
+    latency_summary = metrics.summary()
+    if latency_summary:
+        with st.expander("📈 Độ trễ (p50/p95/p99)"):
+            st.code(latency_summary, language=None)
         
     st.markdown("---")
     st.info("💡 **Mẹo:** Bạn có thể tải ảnh lên để tìm kiếm sản phẩm tương tự!")
@@ -317,17 +368,25 @@ with col_left:
 
     # --- LOGIC: PROCESS INPUTS ---
     final_query = None
-    image_bytes = None
     should_run = False
 
+    # Ảnh được giải mã + thu nhỏ ở worker pool, chạy song song với bước nghe giọng nói bên dưới
+    prepared_image = prepare_upload(uploaded_file) if uploaded_file else None
+    if not uploaded_file: st.session_state.prepared_upload = None  # không giữ tensor của ảnh đã gỡ
+
     # Priority 1: Voice
     if audio_val:
+        partial_box = st.empty()
+        voice_text = None
         with st.spinner("🎧 Đang nghe..."):
-            voice_text = process_voice_input(audio_val) 
-            if voice_text:
-                final_query = voice_text
-                should_run = True
-                st.toast(f"Đã nghe: '{voice_text}'", icon="🗣️")
+            # Bản ghi tạm hiện dần theo từng đoạn đã decode
+            for voice_text in stream_voice_input(audio_val):
+                partial_box.caption(f"🗣️ {voice_text}…")
+        partial_box.empty()
+        if voice_text:
+            final_query = voice_text
+            should_run = True
+            st.toast(f"Đã nghe: '{voice_text}'", icon="🗣️")
 
     # Priority 2: Text
     elif input_text:
@@ -340,43 +399,73 @@ with col_left:
         should_run = True
 
     # Priority 3: Image
-    if uploaded_file:
-        image_bytes = uploaded_file.getvalue()
+    if prepared_image:
         should_run = True
 
     # --- RUN AI GRAPH ---
     if should_run:
         # Update UI User Message
-        if image_bytes:
-            encoded = base64.b64encode(image_bytes).decode('utf-8')
-            st.session_state.messages.append({"role": "user", "content": f"data:image/jpeg;base64,{encoded}", "type": "image"})
-            with chat_container: 
-                with st.chat_message("user"): st.image(uploaded_file, width=180)
+        image = None
+        if prepared_image:
+            try:
+                image = prepared_image.result()
+                # Lịch sử chat chỉ giữ ảnh preview nhỏ, không giữ bản gốc
+                st.session_state.messages.append({"role": "user", "content": image.preview_base64, "type": "image"})
+                with chat_container: 
+                    with st.chat_message("user"): st.image(image.preview_base64, width=180)
+            except Exception as e:
+                st.error(f"Không đọc được ảnh: {e}")
         
         if final_query:
             st.session_state.messages.append({"role": "user", "content": final_query})
             with chat_container: 
                 with st.chat_message("user"): st.markdown(final_query)
 
-        # Execute Graph
-        app = build_fashion_graph()
-        inputs = {"question": final_query or "", "image_bytes": image_bytes}
+        # Execute Graph (streaming): gallery hiện ngay khi search/recommend xong,
+        # câu trả lời hiện dần từng token
+        inputs = {"question": final_query or "", "image": image}
+        live_gallery = col_right.empty()
+        with chat_container:
+            with st.chat_message("assistant"):
+                answer_box = st.empty()
         
         with st.spinner("✨ Đang suy nghĩ..."):
             try:
-                final_state = app.invoke(inputs)
+                t_start = time.perf_counter()
+                t_first_result = None
+                products, tokens, answer, cursor = [], [], None, None
+                n_renders = 0
                 
-                answer = final_state.get("answer_vi", "Xin lỗi, hệ thống đang bận.")
-                products = final_state.get("recommendations", [])
+                for event, payload in stream_fashion_graph(inputs):
+                    if event == "results":
+                        products = payload
+                        if t_first_result is None: t_first_result = time.perf_counter() - t_start
+                        n_renders += 1
+                        with live_gallery.container():
+                            render_gallery(products, key_prefix=f"live_{n_renders}")
+                    elif event == "cursor":
+                        cursor = payload
+                    elif event == "token":
+                        tokens.append(payload)
+                        answer_box.markdown("".join(tokens) + "▌")
+                    elif event == "answer":
+                        answer = payload
+                        answer_box.markdown(answer)
+                
+                t_full_answer = time.perf_counter() - t_start
+                answer = answer or "Xin lỗi, hệ thống đang bận."
+                st.session_state.last_timings = {
+                    "first_result": t_first_result if t_first_result is not None else t_full_answer,
+                    "full_answer": t_full_answer,
+                }
+                print(f"⏱️ time_to_first_result={st.session_state.last_timings['first_result']:.3f}s "
+                      f"time_to_full_answer={t_full_answer:.3f}s")
                 
                 # Update State
                 st.session_state.gallery = products
+                st.session_state.search_cursor = cursor
                 st.session_state.messages.append({"role": "assistant", "content": answer})
                 
-                # Show Answer
-                with chat_container: 
-                    with st.chat_message("assistant"): st.markdown(answer)
-                
                 # Reset Inputs & Refresh
                 reset_inputs() 
                 time.sleep(0.1)
@@ -393,13 +482,16 @@ with col_right:
     if st.session_state.viewing_product:
         p = st.session_state.viewing_product
         
+        # Determine Type (Book or Fashion)
+        p_type = p.get('type') or ('book' if p.get('author') else 'fashion')
+        
         with st.container():
             # Hero Section
             c_img, c_info = st.columns([4, 6], gap="medium")
             
             with c_img:
-                # Large Hero Image
-                img_str = p.get('image_base64') or (p.get('metadata') or {}).get('image_base64')
+                # Large Hero Image (ảnh gốc chỉ tải ở trang chi tiết)
+                img_str = get_product_full_image(p['id'], p_type) or get_card_image(p)
                 if img_str:
                      prefix = "data:image/jpeg;base64," if not img_str.startswith("data:image") else ""
                      st.markdown(f'''
@@ -443,9 +535,6 @@ with col_right:
         # --- RECSYS 1: Graph (Mua kèm) ---
         st.markdown("<div class='section-header'>🛍️ Thường được mua cùng</div>", unsafe_allow_html=True)
         
-        # Determine Type (Book or Fashion)
-        p_type = p.get('type') or ('book' if p.get('author') else 'fashion')
-        
         with st.spinner("Đang tải dữ liệu tương tác..."):
             outfit = recommend_outfit_tool(p['id'], top_k=4, product_type=p_type)
             if outfit:
@@ -470,12 +559,7 @@ with col_right:
     # --- VIEW MODE 2: GRID LIST ---
     else:
         if st.session_state.gallery:
-            st.markdown(f"### 🎯 Kết quả tìm kiếm ({len(st.session_state.gallery)})")
-            
-            cols = st.columns(3)
-            for i, p in enumerate(st.session_state.gallery):
-                with cols[i % 3]: 
-                    render_product_card(p, key_prefix="search")
+            render_gallery(st.session_state.gallery, cursor=st.session_state.search_cursor)
         else:
             # --- HERO SECTION (EMPTY STATE) ---
             st.markdown("""
@@ -0,0 +1,20 @@
+"""
+Cấu hình chung cho test: chạy offline với backend nhúng (không cần SUPABASE_URL / mạng).
+"""
+import os
+
+os.environ.setdefault("STORAGE_BACKEND", "local")
+
+import numpy as np
+import pytest
+
+
+def unit_vectors(n: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def store():
+    from app.local_store import LocalStore
+    return LocalStore(":memory:")
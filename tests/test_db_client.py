@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from app import db_client
+from app.db_client import ContextThreadPoolExecutor, DeadlineExceeded, execute, request_budget, time_left
+from app.metrics import metrics
+
+
+class FakeQuery:
+    """query.execute() lần thứ i chạy steps[i]: số giây ngủ rồi trả về, hoặc exception để ném."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def execute(self):
+        with self._lock:
+            step = self.steps[min(self.calls, len(self.steps) - 1)]
+            self.calls += 1
+            call = self.calls
+        if isinstance(step, Exception):
+            raise step
+        time.sleep(step)
+        return f"response-{call}"
+
+
+def counter(name: str, endpoint: str) -> float:
+    return metrics._counters.get(name, {}).get((("endpoint", endpoint),), 0.0)
+
+
+@pytest.fixture(autouse=True)
+def no_hedge_no_retry(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_HEDGE_AFTER_MS", 0)
+    monkeypatch.setattr(db_client, "DB_READ_RETRIES", 0)
+
+
+def test_budget_caps_wait_and_counts_timeout():
+    query = FakeQuery(1.0)
+    start = time.monotonic()
+    with request_budget(0.1), pytest.raises(DeadlineExceeded):
+        execute("test.deadline", query, idempotent=True)
+    assert time.monotonic() - start < 0.5
+    assert counter("db_timeouts_total", "test.deadline") == 1
+
+
+def test_spent_budget_fails_without_sending():
+    query = FakeQuery(0.0)
+    with request_budget(0.0), pytest.raises(DeadlineExceeded):
+        execute("test.spent", query)
+    assert query.calls == 0
+
+
+def test_nested_budget_keeps_tighter_deadline():
+    with request_budget(0.2):
+        with request_budget(60):
+            assert time_left() <= 0.2
+    assert time_left() == db_client.DB_TIMEOUT
+
+
+def test_pool_threads_inherit_deadline():
+    with ContextThreadPoolExecutor(max_workers=1) as pool, request_budget(0.5):
+        assert pool.submit(time_left).result() <= 0.5
+
+
+def test_slow_read_is_hedged_and_hedge_wins(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_HEDGE_AFTER_MS", 50)
+    query = FakeQuery(1.0, 0.0)
+
+    assert execute("test.hedge", query, idempotent=True) == "response-2"
+    assert query.calls == 2
+    assert counter("db_hedges_total", "test.hedge") == 1
+    assert counter("db_hedge_wins_total", "test.hedge") == 1
+
+
+def test_fast_read_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_HEDGE_AFTER_MS", 200)
+    query = FakeQuery(0.0)
+
+    assert execute("test.fast", query, idempotent=True) == "response-1"
+    assert query.calls == 1
+    assert counter("db_hedges_total", "test.fast") == 0
+
+
+def test_writes_are_never_hedged(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_HEDGE_AFTER_MS", 20)
+    query = FakeQuery(0.2)
+
+    assert execute("test.write", query) == "response-1"
+    assert query.calls == 1
+
+
+def test_write_outliving_budget_returns_real_outcome():
+    query = FakeQuery(0.3)
+    with request_budget(0.05):
+        assert execute("test.slow_write", query) == "response-1"
+    assert query.calls == 1
+    assert counter("db_timeouts_total", "test.slow_write") == 0
+
+
+def test_read_retries_on_connection_error(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_READ_RETRIES", 2)
+    query = FakeQuery(ConnectionError("reset"), 0.0)
+
+    assert execute("test.retry", query, idempotent=True) == "response-2"
+    assert counter("db_retries_total", "test.retry") == 1
+
+
+def test_read_gives_up_after_retries(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_READ_RETRIES", 1)
+    query = FakeQuery(ConnectionError("down"))
+
+    with pytest.raises(ConnectionError):
+        execute("test.down", query, idempotent=True)
+    assert query.calls == 2
+
+
+def test_write_is_not_retried(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_READ_RETRIES", 2)
+    query = FakeQuery(ConnectionError("reset"), 0.0)
+
+    with pytest.raises(ConnectionError):
+        execute("test.write_retry", query)
+    assert query.calls == 1
+
+
+def test_query_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(db_client, "DB_READ_RETRIES", 2)
+    query = FakeQuery(ValueError("bad filter"), 0.0)
+
+    with pytest.raises(ValueError):
+        execute("test.bad", query, idempotent=True)
+    assert query.calls == 1
@@ -0,0 +1,88 @@
+import time
+
+from app.feedback_buffer import FeedbackBuffer
+
+
+class FlakyWriter:
+    """Ghi lô feedback; `fail` lần đầu ném lỗi (cả lô lỗi như 1 transaction)."""
+
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.batches = []
+        self.written = {}
+
+    def __call__(self, batch):
+        self.batches.append(dict(batch))
+        if len(self.batches) <= self.fail:
+            raise ConnectionError("db down")
+        for key, weight in batch.items():
+            self.written[key] = self.written.get(key, 0) + weight
+        return {}
+
+
+def make_buffer(writer, **kwargs):
+    buffer = FeedbackBuffer(writer, flush_interval=3600, **kwargs)
+    buffer._stopped.set()  # test tự gọi flush(), không chạy thread nền
+    buffer._wake.set()
+    buffer._thread.join()
+    return buffer
+
+
+def test_flush_writes_merged_pairs_in_one_batch():
+    writer = FlakyWriter()
+    buffer = make_buffer(writer)
+    buffer.add("a", "b")
+    buffer.add("a", "b", 2)
+    buffer.add("a", "c")
+
+    assert buffer.flush() == 2
+    assert writer.batches == [{("a", "b"): 3, ("a", "c"): 1}]
+    assert buffer.pending_count() == 0
+
+
+def test_failed_batch_is_retried_with_new_clicks_merged():
+    writer = FlakyWriter(fail=1)
+    buffer = make_buffer(writer)
+    buffer.add("a", "b")
+    assert buffer.flush() == 0
+
+    buffer.add("a", "b")
+    assert buffer.flush() == 1
+    assert writer.written == {("a", "b"): 2}
+
+
+def test_backoff_doubles_and_resets_after_success():
+    writer = FlakyWriter(fail=2)
+    buffer = make_buffer(writer, max_backoff=1000)
+    buffer.flush_interval = 1.0
+
+    buffer.add("a", "b")
+    buffer.flush()
+    first = buffer._retry_at - time.monotonic()
+    buffer.flush()
+    second = buffer._retry_at - time.monotonic()
+    assert 1.5 < first <= 2.0 and 3.5 < second <= 4.0
+
+    buffer.flush()
+    assert buffer._retry_at == 0.0
+
+
+def test_backoff_is_capped():
+    buffer = make_buffer(FlakyWriter(fail=100), max_backoff=5.0, max_retries=100)
+    buffer.flush_interval = 1.0
+    for _ in range(10):
+        buffer.add("a", "b")
+        buffer.flush()
+    assert buffer._retry_at - time.monotonic() <= 5.0
+
+
+def test_pairs_are_dropped_after_max_retries():
+    writer = FlakyWriter(fail=100)
+    buffer = make_buffer(writer, max_retries=2)
+    buffer.add("a", "b")
+
+    for _ in range(3):
+        buffer.flush()
+    assert buffer.pending_count() == 0
+    assert buffer.dropped == 1
+    assert len(writer.batches) == 3
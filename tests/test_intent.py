@@ -0,0 +1,27 @@
+import pytest
+
+# app.intent kéo theo app.utils (Streamlit / Supabase); thiếu thì bỏ qua cả file
+for _module in ("streamlit", "supabase"):
+    pytest.importorskip(_module)
+
+from app.intent import VI_ASCII_WORDS, EN_VOCAB, detect_language
+
+
+@pytest.mark.parametrize("query", [
+    "can you find a red dress",
+    "do you have running shoes",
+    "show me a denim jacket",
+])
+def test_english_queries_are_not_taken_for_vietnamese(query):
+    lang, confidence = detect_language(query)
+    assert lang == "en"
+    assert confidence > 0.5
+
+
+@pytest.mark.parametrize("query", ["tim ao so mi trang", "cho toi mua giay", "vay đỏ"])
+def test_vietnamese_queries(query):
+    assert detect_language(query)[0] == "vi"
+
+
+def test_vietnamese_words_do_not_overlap_english_vocab():
+    assert not VI_ASCII_WORDS & EN_VOCAB
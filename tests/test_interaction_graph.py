@@ -0,0 +1,82 @@
+import random
+import threading
+
+import pytest
+
+from app.interaction_graph import InteractionGraph
+
+
+def random_edges(n: int = 400, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [(f"a{rng.randrange(40)}", f"b{rng.randrange(60)}", float(rng.randrange(1, 9))) for _ in range(n)]
+
+
+def expected_scores(*edge_lists) -> dict:
+    scores = {}
+    for edges in edge_lists:
+        for item_a, item_b, score in edges:
+            scores.setdefault(item_a, {})
+            scores[item_a][item_b] = scores[item_a].get(item_b, 0.0) + score
+    return scores
+
+
+def neighbors(graph: InteractionGraph, item_a: str) -> dict:
+    return dict(graph.top_neighbors(item_a, 1000))
+
+
+def test_duplicate_edges_are_merged_at_build():
+    graph = InteractionGraph([("a", "b", 1.0), ("a", "b", 2.0), ("a", "c", 1.5)])
+
+    assert graph.top_neighbors("a", 5) == [("b", 3.0), ("c", 1.5)]
+    assert len(graph) == 2
+
+
+def test_rows_are_sorted_by_score_and_cut_at_k():
+    graph = InteractionGraph([("a", "b", 1.0), ("a", "c", 3.0), ("a", "d", 2.0)])
+
+    assert graph.top_neighbors("a", 2) == [("c", 3.0), ("d", 2.0)]
+    assert graph.top_neighbors("missing", 2) == []
+
+
+def test_overlay_is_visible_before_compaction():
+    graph = InteractionGraph([("a", "b", 1.0), ("a", "c", 2.0)], compact_every=1000)
+    graph.apply_increment("a", "b", 2)
+    graph.apply_increment("new", "b")
+
+    assert graph.top_neighbors("a", 5) == [("b", 3.0), ("c", 2.0)]
+    assert graph.top_neighbors("new", 5) == [("b", 1.0)]
+    assert graph.item_scores() == {"b": 4.0, "c": 2.0}
+
+
+def test_compaction_preserves_scores():
+    edges = random_edges()
+    increments = [(a, b, 1.0) for a, b, _ in random_edges(300, seed=1)]
+    graph = InteractionGraph(edges, compact_every=10 ** 9)
+    for item_a, item_b, weight in increments:
+        graph.apply_increment(item_a, item_b, weight)
+
+    graph.compact()
+    assert graph._overlay == {} and graph._overlay_size == 0
+    for item_a, row in expected_scores(edges, increments).items():
+        assert neighbors(graph, item_a) == pytest.approx(row)
+        scores = [s for _, s in graph.top_neighbors(item_a, 1000)]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_increments_racing_compaction_are_not_lost():
+    edges = random_edges()
+    graph = InteractionGraph(edges, compact_every=50)
+
+    def click(seed):
+        rng = random.Random(seed)
+        for _ in range(2000):
+            graph.apply_increment(f"a{rng.randrange(50)}", f"b{rng.randrange(70)}")
+
+    threads = [threading.Thread(target=click, args=(i,)) for i in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert sum(graph.item_scores().values()) == pytest.approx(sum(s for _, _, s in edges) + 8000)
+    assert graph._overlay_size == sum(len(row) for row in graph._overlay.values())
+    graph.compact()
+    assert sum(graph.item_scores().values()) == pytest.approx(sum(s for _, _, s in edges) + 8000)
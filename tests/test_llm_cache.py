@@ -0,0 +1,55 @@
+import sqlite3
+
+import numpy as np
+
+from app.llm_cache import LLMCache, make_key
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_exact_key_hit(tmp_path):
+    cache = LLMCache(str(tmp_path / "c.sqlite3"))
+    key = make_key("understand", "red dress")
+    cache.set("understand", key, {"q": "red dress"})
+
+    assert cache.get("understand", key) == {"q": "red dress"}
+    assert cache.get("understand", make_key("understand", "blue dress")) is None
+
+
+def test_semantic_hit_requires_same_tag(tmp_path):
+    cache = LLMCache(str(tmp_path / "c.sqlite3"), semantic_threshold=0.95)
+    cache.set("understand", make_key("understand", "red dress"), {"q": "red dress"},
+              embedding=unit(1, 0), tag="dress red")
+
+    near = unit(1, 0.01)  # cosine ~ 1: với CLIP, "blue dress" cũng gần như vậy
+    assert cache.get("understand", make_key("understand", "blue dress"), embedding=near, tag="blue dress") is None
+    assert cache.get("understand", make_key("understand", "a red dress"), embedding=near, tag="dress red") \
+        == {"q": "red dress"}
+    assert cache.get("understand", make_key("understand", "x"), embedding=near) is None
+    assert cache.stats()["understand"]["semantic_hits"] == 1
+
+
+def test_semantic_hit_still_requires_similarity(tmp_path):
+    cache = LLMCache(str(tmp_path / "c.sqlite3"), semantic_threshold=0.95)
+    cache.set("understand", make_key("understand", "red dress"), {"q": "red dress"},
+              embedding=unit(1, 0), tag="dress red")
+
+    assert cache.get("understand", make_key("understand", "dress red"), embedding=unit(0, 1), tag="dress red") is None
+
+
+def test_old_cache_file_gains_tag_column(tmp_path):
+    path = str(tmp_path / "c.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE llm_cache (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, value TEXT NOT NULL, "
+                 "embedding BLOB, created_at REAL NOT NULL, last_access REAL NOT NULL)")
+    conn.execute("INSERT INTO llm_cache VALUES ('k', 'understand', '1', ?, 0, 0)",
+                 (np.asarray(unit(1, 0), dtype=np.float32).tobytes(),))
+    conn.commit()
+    conn.close()
+
+    cache = LLMCache(path)
+    assert cache.get("understand", "k") == 1
+    assert cache.get("understand", "other", embedding=unit(1, 0), tag="") is None
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from app.local_store import LocalStore
+from tests.conftest import unit_vectors
+
+
+def _products(vectors, prefix="p"):
+    return [{"id": f"{prefix}{i}", "title": f"item {i}", "metadata": {"categories": ["Dress"]},
+             "embedding": v.tolist()} for i, v in enumerate(vectors)]
+
+
+def test_match_fashion_clip_returns_top_count_by_cosine(store):
+    vectors = unit_vectors(20)
+    store.load("fashion_clip_index", _products(vectors))
+
+    query = vectors[3] * 5  # RPC tự chuẩn hoá truy vấn
+    data = store.rpc("match_fashion_clip", {
+        "query_embedding": query.tolist(), "match_threshold": -1.0, "match_count": 5
+    }).execute().data
+
+    expected = np.argsort(-(vectors @ vectors[3]))[:5]
+    assert [row["id"] for row in data] == [f"p{i}" for i in expected]
+    assert set(data[0]) == {"id", "similarity"}
+    assert data[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_match_threshold_filters_low_similarity(store):
+    vectors = unit_vectors(20)
+    store.load("fashion_clip_index", _products(vectors))
+
+    data = store.rpc("match_fashion_clip", {
+        "query_embedding": vectors[0].tolist(), "match_threshold": 0.99, "match_count": 10
+    }).execute().data
+    assert [row["id"] for row in data] == ["p0"]
+
+
+def test_match_books_returns_full_rows(store):
+    vectors = unit_vectors(5, seed=1)
+    store.load("books_index", [{"id": f"b{i}", "title": f"Book {i}", "embedding": v.tolist()}
+                               for i, v in enumerate(vectors)])
+
+    data = store.rpc("match_books", {
+        "query_embedding": vectors[2].tolist(), "match_threshold": 0.5, "match_count": 1
+    }).execute().data
+    assert data == [{"id": "b2", "title": "Book 2", "similarity": pytest.approx(1.0, abs=1e-5)}]
+
+
+def test_match_sees_rows_written_after_first_query(store):
+    vectors = unit_vectors(4)
+    store.load("fashion_clip_index", _products(vectors[:3]))
+    params = {"query_embedding": vectors[3].tolist(), "match_threshold": 0.99, "match_count": 1}
+    assert store.rpc("match_fashion_clip", params).execute().data == []
+
+    store.table("fashion_clip_index").upsert({"id": "new", "embedding": vectors[3].tolist()}).execute()
+    assert [row["id"] for row in store.rpc("match_fashion_clip", params).execute().data] == ["new"]
+
+
+def test_increment_interaction_score_accumulates(store):
+    for _ in range(3):
+        store.rpc("increment_interaction_score",
+                  {"p_item_a": "a", "p_item_b": "b", "p_increment": 0.5}).execute()
+
+    rows = store.table("product_interactions").select("item_b, score").eq("item_a", "a").execute().data
+    assert rows == [{"item_b": "b", "score": 1.5}]
+
+
+def test_bulk_increment_writes_all_pairs_in_one_call(store):
+    store.load("product_interactions", [{"item_a": "a", "item_b": "b", "score": 1.0}])
+    store.rpc("increment_interaction_scores", {"p_items": [
+        {"item_a": "a", "item_b": "b", "increment": 2},
+        {"item_a": "a", "item_b": "c", "increment": 1},
+    ]}).execute()
+
+    rows = store.table("product_interactions").select("item_b, score").eq("item_a", "a").order("item_b").execute().data
+    assert rows == [{"item_b": "b", "score": 3.0}, {"item_b": "c", "score": 1.0}]
+
+
+def test_unknown_rpc_and_table_raise(store):
+    with pytest.raises(ValueError):
+        store.rpc("match_everything", {})
+    with pytest.raises(ValueError):
+        store.table("users")
+
+
+def test_upsert_keeps_columns_missing_from_payload(store):
+    store.load("fashion_clip_index", _products(unit_vectors(1)))
+    store.table("fashion_clip_index").upsert({"id": "p0", "title": "renamed"}).execute()
+
+    row = store.table("fashion_clip_index").select("id, title, metadata, embedding").eq("id", "p0").execute().data[0]
+    assert row["title"] == "renamed"
+    assert row["metadata"] == {"categories": ["Dress"]}
+    assert row["embedding"] is not None
+
+
+def test_select_filters_order_and_range(store):
+    store.load("product_interactions", [{"item_a": "a", "item_b": f"b{i}", "score": float(i)} for i in range(5)]
+               + [{"item_a": "z", "item_b": "b0", "score": 9.0}])
+
+    rows = store.table("product_interactions").select("item_b") \
+        .eq("item_a", "a").order("score", desc=True).range(1, 2).execute().data
+    assert rows == [{"item_b": "b3"}, {"item_b": "b2"}]
+    assert store.table("product_interactions").select("*").in_("item_b", []).execute().data == []
+
+
+def test_data_persists_in_file(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    LocalStore(path).load("fashion_clip_index", _products(unit_vectors(2)))
+
+    reopened = LocalStore(path)
+    ids, matrix = reopened.vectors("fashion_clip_index")
+    assert ids == ["p0", "p1"]
+    assert matrix.shape == (2, 16)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from app import quantization
+from app.quantization import CompactEmbeddings, dequantize, quantize
+from tests.conftest import unit_vectors
+
+
+def test_int8_uses_per_vector_scale_of_max_abs():
+    vectors = np.array([[0.5, -1.0, 0.25], [0.02, 0.01, -0.04]], dtype=np.float32)
+    codes, scales = quantize(vectors, "int8")
+
+    assert codes.dtype == np.int8 and scales.dtype == np.float32
+    assert scales == pytest.approx([1.0 / 127, 0.04 / 127])
+    # Thành phần lớn nhất của mỗi vector dùng hết dải [-127, 127]
+    assert np.abs(codes).max(axis=1).tolist() == [127, 127]
+    assert codes[0].tolist() == [64, -127, 32]
+
+
+def test_int8_round_trip_error_is_within_half_step():
+    vectors = unit_vectors(50, dim=64)
+    codes, scales = quantize(vectors, "int8")
+
+    error = np.abs(dequantize(codes, scales) - vectors)
+    assert np.all(error <= scales[:, None] / 2 + 1e-7)
+
+
+def test_zero_vector_does_not_divide_by_zero():
+    codes, scales = quantize(np.zeros((1, 8), dtype=np.float32), "int8")
+    assert scales.tolist() == [1.0]
+    assert not codes.any()
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_float_dtypes_have_no_scales(dtype):
+    codes, scales = quantize(unit_vectors(3), dtype)
+    assert scales is None
+    assert codes.dtype == quantization.DTYPES[dtype]
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-6), ("float16", 2e-3), ("int8", 2e-2)])
+def test_scores_match_float32_dot_product(dtype, tolerance):
+    vectors = unit_vectors(200, dim=64)
+    query = unit_vectors(1, dim=64, seed=5)[0]
+    compact = CompactEmbeddings.from_float32(vectors, dtype)
+
+    assert compact.scores(None, query) == pytest.approx(vectors @ query, abs=tolerance)
+    rows = np.array([7, 3, 150])
+    assert compact.scores(rows, query) == pytest.approx(vectors[rows] @ query, abs=tolerance)
+
+
+def test_scores_cross_block_boundaries(monkeypatch):
+    monkeypatch.setattr(quantization, "BLOCK_ROWS", 16)
+    vectors = unit_vectors(50, dim=8)
+    query = vectors[0]
+    compact = CompactEmbeddings.from_float32(vectors, "int8")
+
+    assert compact.scores(None, query) == pytest.approx(vectors @ query, abs=2e-2)
+    rows = np.arange(49, -1, -3)
+    assert compact.scores(rows, query) == pytest.approx(vectors[rows] @ query, abs=2e-2)
+
+
+def test_int8_is_about_a_quarter_of_float32():
+    vectors = unit_vectors(100, dim=512)
+    int8 = CompactEmbeddings.from_float32(vectors, "int8")
+
+    assert int8.dtype == "int8"
+    assert int8.nbytes == 100 * (512 + 4)
+    assert int8.vector(5) == pytest.approx(vectors[5], abs=float(int8.scales[5]))
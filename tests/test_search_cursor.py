@@ -0,0 +1,122 @@
+import pytest
+
+# app.tools kéo theo LangChain / Streamlit / Supabase; thiếu thì bỏ qua cả file
+for _module in ("langchain_community", "langchain_google_genai", "streamlit", "supabase"):
+    pytest.importorskip(_module)
+
+from app import tools
+from app.tools import SearchCursor
+
+
+class FakeSource:
+    """Nguồn ứng viên xếp hạng cố định; ghi lại số lượng được hỏi ở mỗi lần refill."""
+
+    def __init__(self, n: int, titles=None):
+        self.ranking = [f"p{i}" for i in range(n)]
+        self.titles = titles or {}
+        self.requests = []
+        self.post_filter = None
+
+    def rank(self, client, vector, query_text, count):
+        self.requests.append(count)
+        return [{"id": pid, "similarity": 1 - i / 1000} for i, pid in enumerate(self.ranking[:count])], self.post_filter
+
+    def books(self, client, vector, count):
+        self.requests.append(count)
+        return [{"id": pid, "title": pid, "similarity": 0.9} for pid in self.ranking[:count]]
+
+    def products(self, client, table, ids):
+        return [{"id": pid, "title": self.titles.get(pid, f"item {pid}"), "metadata": {}} for pid in ids]
+
+
+@pytest.fixture
+def source(monkeypatch):
+    source = FakeSource(25)
+    monkeypatch.setattr(tools, "rank_fashion_candidates", source.rank)
+    monkeypatch.setattr(tools, "match_book_rows", source.books)
+    monkeypatch.setattr(tools, "get_products", source.products)
+    monkeypatch.setattr(tools, "SEARCH_FASHION_CANDIDATES", 10)
+    monkeypatch.setattr(tools, "SEARCH_BOOK_CANDIDATES", 10)
+    monkeypatch.setattr(tools, "SEARCH_MAX_CANDIDATES", 1000)
+    return source
+
+
+def drain(cursor: SearchCursor, max_pages: int = 50) -> list:
+    pages = []
+    while cursor.has_more and len(pages) < max_pages:
+        page = cursor.next_page(client=None)
+        if not page: break
+        pages.append([p["id"] for p in page])
+    return pages
+
+
+def test_pages_follow_ranking_without_duplicates(source):
+    pages = drain(SearchCursor("fashion", [0.1], "top", page_size=4))
+
+    seen = [pid for page in pages for pid in page]
+    assert seen == source.ranking
+    assert all(len(page) == 4 for page in pages[:-1])
+
+
+def test_refill_doubles_fetch_count_until_source_runs_dry(source):
+    cursor = SearchCursor("fashion", [0.1], "top", page_size=4)
+    drain(cursor)
+
+    assert source.requests == [10, 20, 40]
+    assert cursor.exhausted and not cursor.has_more
+
+
+def test_first_page_uses_one_fetch(source):
+    cursor = SearchCursor("fashion", [0.1], "top", page_size=4)
+    cursor.next_page(client=None)
+    cursor.next_page(client=None)
+
+    assert source.requests == [10]
+    assert cursor.has_more
+
+
+def test_refill_drops_candidates_already_seen(source):
+    cursor = SearchCursor("fashion", [0.1], "top", page_size=4)
+    drain(cursor, max_pages=3)  # hết 10 ứng viên đầu, sang lượt refill thứ 2
+
+    source.ranking = ["p3", "p0"] + source.ranking  # lượt refill sau trả lại cả id đã hiện
+    rest = [pid for page in drain(cursor) for pid in page]
+    assert "p0" not in rest and "p3" not in rest
+    assert len(rest) == len(set(rest))
+
+
+def test_max_candidates_caps_refill(source, monkeypatch):
+    monkeypatch.setattr(tools, "SEARCH_MAX_CANDIDATES", 15)
+    cursor = SearchCursor("fashion", [0.1], "top", page_size=4)
+    seen = [pid for page in drain(cursor) for pid in page]
+
+    assert source.requests == [10, 15]
+    assert seen == source.ranking[:15]
+
+
+def test_post_filter_skips_and_backfills_from_later_candidates(source):
+    source.titles = {pid: "Red Dress" for pid in source.ranking[::3]}
+    source.post_filter = "dress"
+    pages = drain(SearchCursor("fashion", [0.1], "red dress", page_size=3))
+
+    seen = [pid for page in pages for pid in page]
+    assert seen == source.ranking[::3]
+    assert len(pages[0]) == 3
+
+
+def test_missing_products_are_skipped(source, monkeypatch):
+    monkeypatch.setattr(tools, "get_products",
+                        lambda client, table, ids: source.products(client, table, [i for i in ids if i != "p1"]))
+    page = SearchCursor("fashion", [0.1], "top", page_size=3).next_page(client=None)
+
+    assert [p["id"] for p in page] == ["p0", "p2", "p3"]
+    assert page[0]["reason"].startswith("Độ giống")
+
+
+def test_book_cursor_pages_full_rows(source):
+    cursor = SearchCursor("book", [0.1], "", page_size=5)
+    first, second = cursor.next_page(client=None), cursor.next_page(client=None)
+
+    assert [b["id"] for b in first + second] == source.ranking[:10]
+    assert all(b["type"] == "book" for b in first)
+    assert source.requests == [10]
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from app.feedback_buffer import FeedbackBuffer
+from app.interaction_graph import InteractionGraph
+from app.trending import TrendingIndex
+
+TYPES = {"b": "fashion", "c": "fashion", "k": "book"}
+
+
+def classify(ids):
+    return {pid: TYPES.get(pid, "fashion") for pid in ids}
+
+
+def test_rebuild_ranks_each_type():
+    index = TrendingIndex(capacity=2)
+    index.rebuild({"b": 3.0, "c": 5.0, "k": 1.0, "x": 0.5}, classify)
+
+    assert index.top("fashion", 5) == ["c", "b"]
+    assert index.top("book", 5) == ["k"]
+
+
+def test_deltas_during_rebuild_are_carried_over():
+    index = TrendingIndex(capacity=3)
+    index.rebuild({"b": 1.0}, classify)
+
+    index.begin_rebuild()
+    index.apply_delta("c", 4.0)  # tới sau lúc chụp snapshot
+    index.rebuild({"b": 2.0}, classify)
+    index.classify_pending(classify)
+
+    assert index.top("fashion", 5) == ["c", "b"]
+    assert index._totals == {"b": 2.0, "c": 4.0}
+
+
+def test_unclassified_items_are_ranked_after_classify_pending():
+    index = TrendingIndex(capacity=3)
+    index.rebuild({"b": 1.0}, classify)
+    index.apply_delta("k", 2.0)
+    assert index.top("book", 5) == []
+
+    index.classify_pending(classify)
+    assert index.top("book", 5) == ["k"]
+
+
+# --- Snapshot cho rebuild (app.tools) ---
+
+@pytest.fixture
+def feedback(monkeypatch):
+    for module in ("langchain_community", "langchain_google_genai", "streamlit", "supabase"):
+        pytest.importorskip(module)
+    from app import tools
+
+    index = TrendingIndex(capacity=5)
+    buffer = FeedbackBuffer(lambda batch: {}, flush_interval=3600)
+    buffer._stopped.set()
+    buffer._wake.set()
+    buffer._thread.join()
+    buffer.add_listener(tools._apply_feedback_to_graph)
+    buffer.add_listener(tools._apply_feedback_to_trending)
+    monkeypatch.setattr(tools, "get_feedback_buffer", lambda: buffer)
+    monkeypatch.setattr(tools, "get_trending_index", lambda: index)
+    monkeypatch.setattr(tools, "get_interaction_graph", lambda: None)
+    return tools, index, buffer
+
+
+def click_during(fn, tools, threads):
+    """Chạy fn() trong khi 1 thread khác click (a -> b) ở giữa; thread được thêm vào `threads` để join sau."""
+    clicker = threading.Thread(target=tools.feedback_loop_tool, args=("a", "b"))
+    threads.append(clicker)
+    clicker.start()
+    time.sleep(0.05)  # đủ để click áp xong nếu không bị chặn
+    return fn()
+
+
+def test_graph_snapshot_does_not_double_count_concurrent_click(feedback, monkeypatch):
+    tools, index, _ = feedback
+    tools.feedback_loop_tool("a", "b")  # click cũ, đã có trong graph lẫn trending
+
+    threads = []
+
+    class RacingGraph(InteractionGraph):
+        def item_scores(self):
+            return click_during(super().item_scores, tools, threads)
+
+    graph = RacingGraph([("a", "b", 1.0)])
+    monkeypatch.setattr(tools, "get_interaction_graph", lambda: graph)
+    totals = tools._trending_totals(index, client=None)
+    threads[0].join()
+    index.rebuild(totals, classify)
+
+    assert graph.top_neighbors("a", 1) == [("b", 2.0)]
+    assert index._totals["b"] == 2.0
+
+
+def test_scan_snapshot_keeps_unflushed_clicks(feedback, monkeypatch):
+    tools, index, buffer = feedback
+    tools.feedback_loop_tool("a", "b", 2)  # còn nằm trong bộ đệm, chưa ghi xuống bảng
+    flushed, threads = [], []
+    buffer.flush_fn = lambda batch: flushed.append(dict(batch)) or {}
+
+    def scan(client):
+        # Lô ghi xin chạy giữa lúc đọc bảng phải chờ tới khi đọc xong
+        flusher = threading.Thread(target=buffer.flush)
+        threads.append(flusher)
+        flusher.start()
+        result = click_during(lambda: {"b": 5.0}, tools, threads)
+        assert flushed == []
+        return result
+
+    monkeypatch.setattr(tools, "_scan_item_scores", scan)
+    totals = tools._trending_totals(index, client=None)
+    for thread in threads:
+        thread.join()
+    index.rebuild(totals, classify)
+
+    assert index._totals["b"] == 8.0  # 5 trong bảng + 2 chưa ghi + 1 click tới giữa chừng
+    assert flushed and sum(w for batch in flushed for w in batch.values()) >= 2
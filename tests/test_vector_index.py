@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from app import vector_index
+from app.vector_index import FashionVectorIndex, build_fashion_index, detect_fallback_category, has_category
+from tests.conftest import unit_vectors
+
+N_LISTS = 8
+
+
+def clustered_vectors(n_clusters: int = N_LISTS, per_cluster: int = 40, dim: int = 16) -> np.ndarray:
+    centers = unit_vectors(n_clusters, dim, seed=1)
+    noise = np.random.default_rng(2).normal(scale=0.15, size=(n_clusters, per_cluster, dim))
+    vectors = (centers[:, None, :] + noise).reshape(-1, dim).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def catalog(store):
+    vectors = clustered_vectors()
+    kinds = ["Dress", "Shirt", "Shoe", "Watch"]
+    store.load("fashion_clip_index", [
+        {"id": f"p{i}", "title": f"Item {i}",
+         "metadata": {"categories": ["Clothing", kinds[i % 4]] + (["Beach"] if i % 20 == 0 else [])},
+         "embedding": v.tolist()}
+        for i, v in enumerate(vectors)
+    ])
+    return vectors
+
+
+@pytest.fixture
+def index(store, catalog, tmp_path):
+    build_fashion_index(store, str(tmp_path / "index"), n_lists=N_LISTS)
+    return FashionVectorIndex(str(tmp_path / "index"))
+
+
+def exact_top(vectors: np.ndarray, query: np.ndarray, k: int, rows=None) -> list:
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    scores = vectors[rows] @ query
+    return [f"p{rows[i]}" for i in np.argsort(-scores)[:k]]
+
+
+def test_build_writes_every_vector_grouped_by_list(index, catalog):
+    assert len(index) == len(catalog)
+    assert len(index.centroids) == N_LISTS
+    assert index.list_offsets[0] == 0 and index.list_offsets[-1] == len(catalog)
+    for pid in ("p0", "p123", "p319"):
+        assert index.get_vector(pid) == pytest.approx(catalog[int(pid[1:])].tolist(), abs=1e-6)
+
+
+def test_probing_all_lists_is_exact(index, catalog):
+    query = catalog[17]
+    results = index.search(query, match_threshold=-1.0, match_count=10, nprobe=N_LISTS)
+
+    assert [r["id"] for r in results] == exact_top(catalog, query, 10)
+    assert [r["similarity"] for r in results] == sorted((r["similarity"] for r in results), reverse=True)
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_probe_scans_only_nearest_lists(index, catalog):
+    query = catalog[45]
+    nearest = np.argsort(-(index.centroids @ query))[:2]
+    probed = {index.ids[row] for c in nearest for row in range(index.list_offsets[c], index.list_offsets[c + 1])}
+
+    results = index.search(query, match_threshold=-1.0, match_count=20, nprobe=2)
+    assert results[0]["id"] == "p45"
+    assert {r["id"] for r in results} <= probed
+
+
+def test_probe_recall_on_clustered_data(index, catalog):
+    hits = 0
+    for q in range(0, len(catalog), 16):
+        found = {r["id"] for r in index.search(catalog[q], -1.0, 10, nprobe=2)}
+        hits += len(found & set(exact_top(catalog, catalog[q], 10)))
+    assert hits / (10 * len(range(0, len(catalog), 16))) >= 0.9
+
+
+def test_threshold_is_applied(index, catalog):
+    results = index.search(catalog[3], match_threshold=0.999, match_count=10, nprobe=N_LISTS)
+    assert [r["id"] for r in results] == ["p3"]
+
+
+def test_category_filter_exact_path(index, catalog):
+    shirts = [i for i in range(len(catalog)) if i % 4 == 1]
+    results = index.search(catalog[0], match_threshold=-1.0, match_count=5, nprobe=1, category="shirt")
+
+    assert [r["id"] for r in results] == exact_top(catalog, catalog[0], 5, rows=shirts)
+
+
+def test_category_filter_probe_path_widens_until_enough_rows(index, catalog, monkeypatch):
+    monkeypatch.setattr(vector_index, "EXACT_FILTER_MAX_ROWS", 0)
+    results = index.search(catalog[0], match_threshold=-1.0, match_count=30, nprobe=1, category="watch")
+
+    assert len(results) == 30
+    assert all(int(r["id"][1:]) % 4 == 3 for r in results)
+
+
+def test_unknown_category_matches_nothing(index, catalog):
+    assert index.search(catalog[0], -1.0, 5, nprobe=N_LISTS, category="hat") == []
+
+
+@pytest.mark.parametrize("query, category", [
+    ("beach dress for summer", "dress"),  # loại sản phẩm thắng thuộc tính hiếm
+    ("something for the beach", "beach"),  # category hiếm vẫn được lọc khi đứng một mình
+    ("red shoes", "shoe"),
+    ("clothing", None),  # phủ cả catalog -> quá chung chung
+    ("blue sweatshirt", None),
+])
+def test_detect_category_uses_category_vocabulary(index, query, category):
+    assert index.detect_category(query) == category
+
+
+def test_fallback_category_matches_whole_words():
+    assert detect_fallback_category("red dresses") == "dress"
+    assert detect_fallback_category("grey sweatshirt") is None
+    assert has_category({"title": "Cotton Shirt", "metadata": {}}, "shirt")
+    assert not has_category({"title": "Grey Sweatshirt", "metadata": {"categories": ["Tops"]}}, "shirt")